@@ -0,0 +1,193 @@
+"""Scoring analytics for a golfer, computed column-wise with NumPy.
+
+One grouped query reduces each of the golfer's rounds to a row of sums
+(strokes, putts, fairways, greens, strokes over par by par type and by
+stroke index band), so the database returns one short row per round
+instead of every hole. NumPy then works on that rounds-by-sums matrix as
+columns: rolling averages, trends and totals are vectorized reductions. It
+is imported on first use to keep worker startup light. Results are cached
+per golfer until the golfer's Statistic row changes, which happens whenever
+the post-round pipeline folds a round in or out.
+"""
+from collections import OrderedDict
+import threading
+
+from flask import current_app
+
+from models import Round, Score, Statistic, db
+
+
+FULL_ROUND_HOLES = 18
+ROLLING_ROUNDS = 20
+PAR_TYPES = (3, 4, 5)
+# Stroke index ranges, hardest holes first
+HANDICAP_BANDS = ((1, 6), (7, 12), (13, 18))
+
+
+def _round_sums():
+    """(name, SQL expression) of every per-round sum the analytics use."""
+    def total(value, condition):
+        return db.func.sum(db.case((condition, value), else_=0))
+
+    to_par = Score.score - Score.hole_par
+    par_known = Score.hole_par.isnot(None)
+    sums = [
+        ('holes', db.func.count()),
+        ('strokes', db.func.sum(Score.score)),
+        ('putts', db.func.sum(db.func.coalesce(Score.putts, 0))),
+        ('fairways', total(1, Score.fairway_hit.is_(True) & (Score.hole_par >= 4))),
+        ('fairway_holes', total(1, Score.hole_par >= 4)),
+        ('greens', total(1, Score.green_in_regulation.is_(True))),
+    ]
+    for par in PAR_TYPES:
+        sums += [(f'par{par}_to_par', total(to_par, Score.hole_par == par)),
+                 (f'par{par}_holes', total(1, Score.hole_par == par))]
+    for low, high in HANDICAP_BANDS:
+        band = Score.hole_handicap.between(low, high) & par_known
+        sums += [(f'band{low}_to_par', total(to_par, band)),
+                 (f'band{low}_holes', total(1, band))]
+    return sums
+
+
+def _load(golfer_id):
+    """Round dates and a rounds-by-sums matrix, in play order."""
+    import numpy as np
+
+    sums = _round_sums()
+    rows = db.session.execute(
+        db.select(Round.id, Round.date_played, *(expression for _, expression in sums))
+        .join(Score, Score.round_id == Round.id)
+        .where(Round.golfer_id == golfer_id, Score.score.isnot(None))
+        .group_by(Round.id, Round.date_played)
+        .order_by(Round.date_played, Round.id)).all()
+    if not rows:
+        return None, None
+    _, dates, *columns = zip(*rows)
+    return dates, dict(zip((name for name, _ in sums), np.array(columns, dtype=float)))
+
+
+def _ratio(numerator, denominator, scale=1.0, digits=2):
+    return round(float(numerator) * scale / denominator, digits) if denominator else None
+
+
+def compute_analytics(golfer_id, rolling_rounds=ROLLING_ROUNDS):
+    """Analytics for one golfer, or None when they have no scored holes.
+
+    Scoring and putting averages cover full 18-hole rounds; fairways count
+    par 4s and 5s only; scoring by par type and by stroke index band is
+    the average score relative to par.
+    """
+    import numpy as np
+
+    dates, columns = _load(golfer_id)
+    if columns is None:
+        return None
+
+    full = columns['holes'] == FULL_ROUND_HOLES
+    full_totals = columns['strokes'][full]
+    cumulative = np.r_[0.0, np.cumsum(full_totals)]
+    ends = np.arange(1, full_totals.size + 1)
+    window = np.minimum(ends, rolling_rounds)
+    rolling = (cumulative[ends] - cumulative[ends - window]) / window
+
+    total = {name: column.sum() for name, column in columns.items()}
+    return {
+        'rounds': len(dates),
+        'full_rounds': int(full_totals.size),
+        'holes': int(total['holes']),
+        'scoring_average': _ratio(full_totals.sum(), full_totals.size),
+        'rolling_rounds': rolling_rounds,
+        'rolling_average': round(float(rolling[-1]), 2) if rolling.size else None,
+        'best_round': int(full_totals.min()) if full_totals.size else None,
+        'fairway_hit_percentage': _ratio(total['fairways'], total['fairway_holes'], 100, 1),
+        'green_in_regulation_percentage': _ratio(total['greens'], total['holes'], 100, 1),
+        'putts_per_round': _ratio(columns['putts'][full].sum(), full_totals.size),
+        'scoring_by_par': {par: _ratio(total[f'par{par}_to_par'], total[f'par{par}_holes'])
+                           for par in PAR_TYPES},
+        'scoring_by_handicap_band': {
+            f'{low}-{high}': _ratio(total[f'band{low}_to_par'], total[f'band{low}_holes'])
+            for low, high in HANDICAP_BANDS},
+        'trend': {
+            'dates': [date.isoformat() if date else None
+                      for date, is_full in zip(dates, full) if is_full],
+            'scores': full_totals.astype(int).tolist(),
+            'rolling_average': np.round(rolling, 2).tolist(),
+        },
+    }
+
+
+def trend_chart(analytics):
+    """Round totals and their rolling average as a Plotly figure dict."""
+    trend = analytics['trend']
+    return {
+        'data': [
+            {'type': 'scatter', 'mode': 'markers', 'name': 'Score',
+             'x': trend['dates'], 'y': trend['scores']},
+            {'type': 'scatter', 'mode': 'lines',
+             'name': f"{analytics['rolling_rounds']}-round average",
+             'x': trend['dates'], 'y': trend['rolling_average']},
+        ],
+        'layout': {'title': 'Scoring Trend', 'xaxis': {'title': 'Date'},
+                   'yaxis': {'title': 'Strokes'}},
+    }
+
+
+class AnalyticsCache:
+    """Figures computed from one or more golfers' rounds, in an in-process LRU.
+
+    Entries are keyed by golfer ids and remember each golfer's
+    Statistic.updated_at when they were computed; reading those rows tells
+    whether any of the golfers has had a round processed since, so every
+    worker notices new rounds without being told. `compute` takes the same
+    golfer ids; it defaults to one golfer's analytics.
+    """
+
+    def __init__(self, compute=None):
+        self.compute = compute or (lambda golfer_id: compute_analytics(
+            golfer_id, current_app.config.get('ANALYTICS_ROLLING_ROUNDS', ROLLING_ROUNDS)))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, *golfer_ids):
+        # Read the stamps before the scores, so a round processed in between
+        # leaves a stale stamp and is recomputed on the next request
+        stamps = dict(db.session.execute(db.select(Statistic.golfer_id, Statistic.updated_at)
+                                         .where(Statistic.golfer_id.in_(golfer_ids))).all())
+        stamp = tuple(stamps.get(golfer_id) for golfer_id in golfer_ids)
+        with self._lock:
+            entry = self._entries.get(golfer_ids)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(golfer_ids)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = self.compute(*golfer_ids)
+        max_entries = current_app.config.get('ANALYTICS_CACHE_MAX_ENTRIES', 256)
+        with self._lock:
+            self._entries[golfer_ids] = (stamp, value)
+            self._entries.move_to_end(golfer_ids)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *golfer_ids):
+        with self._lock:
+            self._entries.pop(golfer_ids, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+analytics_cache = AnalyticsCache()
+
+
+def golfer_analytics(golfer_id):
+    return analytics_cache.get(golfer_id)
@@ -1,47 +1,197 @@
-
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, session
+from flask import Flask, Blueprint, current_app, render_template, redirect, url_for, flash, request, jsonify
 from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.urls import url_parse
-import plotly.express as px
-from apscheduler.schedulers.background import BackgroundScheduler
-from models import db, Golfer, Course, Tee, Hole, Round, Score, Milestone, Statistic, connect_db, GameType, check_and_create_milestones
+from models import db, Golfer, Course, Tee, Round, RoundSummary, Milestone, Statistic, HoleAggregate, connect_db
 from forms import RegistrationForm, LoginForm, HoleEntryForm, GolferSearchForm, CourseSearchForm, GameInitiationForm, ProfileForm, SearchRoundsForm, ScorecardForm
 from flask_wtf import CSRFProtect
-from services import fetch_course_details, get_admin_token, search_courses, fetch_golfer_handicap, save_course_data
+from spatial import nearby_courses
+from leaderboard import rebuild_leaderboards
+from pipeline import pipeline
+from handicap import recompute_handicaps
+from scorecards import ScorecardError, submit_scorecard
+from analytics import golfer_analytics, trend_chart
+from head_to_head import head_to_head
+from services import get_course_details, get_course_with_tees, get_tee_with_holes, find_courses, refresh_stale_handicaps, bulk_refresh_handicaps
 from datetime import datetime
 
 import os
+import click
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from a .env file
 
 
-app = Flask(__name__)
-bcrypt = Bcrypt(app)
-migrate = Migrate(app, db)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///swing_oil_society'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-app.config['GHIN_ADMIN_USER'] = os.getenv('GHIN_ADMIN_USER')
-app.config['GHIN_ADMIN_PASSWORD'] = os.getenv('GHIN_ADMIN_PASSWORD')
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-csrf = CSRFProtect(app)
+bcrypt = Bcrypt()
+csrf = CSRFProtect()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'  # Specify the login route
+
+main = Blueprint('main', __name__, cli_group=None)
+
+
+def default_config():
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', 'postgresql:///swing_oil_society'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SQLALCHEMY_ECHO': False,
+        'DEBUG_TB_INTERCEPT_REDIRECTS': True,
+        'GHIN_ADMIN_USER': os.getenv('GHIN_ADMIN_USER'),
+        'GHIN_ADMIN_PASSWORD': os.getenv('GHIN_ADMIN_PASSWORD'),
+        'SECRET_KEY': os.environ.get('SECRET_KEY', "it's a secret"),
+        'COURSE_CACHE_TTL': int(os.environ.get('COURSE_CACHE_TTL', 24 * 60 * 60)),
+        'COURSE_CACHE_STALE_TTL': int(os.environ.get('COURSE_CACHE_STALE_TTL', 7 * 24 * 60 * 60)),
+        'COURSE_CACHE_MAX_ENTRIES': int(os.environ.get('COURSE_CACHE_MAX_ENTRIES', 256)),
+        'COURSE_SEARCH_MAX_AGE': int(os.environ.get('COURSE_SEARCH_MAX_AGE', 7 * 24 * 60 * 60)),
+        'HANDICAP_MAX_AGE': int(os.environ.get('HANDICAP_MAX_AGE', 12 * 60 * 60)),
+        'HANDICAP_REFRESH_MINUTES': int(os.environ.get('HANDICAP_REFRESH_MINUTES', 15)),
+        'SCHEDULER_ENABLED': os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true',
+        'PIPELINE_POLL_SECONDS': int(os.environ.get('PIPELINE_POLL_SECONDS', 5)),
+        'PIPELINE_MAX_ATTEMPTS': int(os.environ.get('PIPELINE_MAX_ATTEMPTS', 5)),
+        'PIPELINE_RETRY_SECONDS': int(os.environ.get('PIPELINE_RETRY_SECONDS', 30)),
+        'ANALYTICS_ROLLING_ROUNDS': int(os.environ.get('ANALYTICS_ROLLING_ROUNDS', 20)),
+        'ANALYTICS_CACHE_MAX_ENTRIES': int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', 256)),
+    }
+
+
+def create_app(config=None):
+    """Build and configure the Flask application.
+
+    Nothing here touches the database or GHIN: run `flask init-db` to create
+    the schema, and GHIN credentials are only needed on the first API call.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(default_config())
+    app.config.from_mapping(config or {})
+
+    bcrypt.init_app(app)
+    csrf.init_app(app)
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        # Alembic is slow to import and only needed for `flask db ...`
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    connect_db(app)
+    login_manager.init_app(app)
+    app.register_blueprint(main)
+
+    if not app.config['GHIN_ADMIN_USER'] or not app.config['GHIN_ADMIN_PASSWORD']:
+        app.logger.warning(
+            "GHIN API credentials are not set; GHIN lookups will fail.")
+
+    # Under the debug reloader only the child process should run jobs
+    if app.config['SCHEDULER_ENABLED'] and not app.testing and _serves_requests() and \
+            (not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_scheduler(app)
+    return app
+
+
+def _serves_requests():
+    """False when the app is loaded for a `flask` command other than `run`.
+
+    `flask init-db`, `flask refresh-handicaps` and the like do their work in
+    the foreground and exit; scheduled jobs would only race them.
+    """
+    if os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+        return True  # `python app.py` or a WSGI server
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and ctx.info_name == 'run'
+
+
+def start_scheduler(app):
+    """Start the background jobs; APScheduler is only imported when needed."""
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    def refresh_handicaps_job():
+        with app.app_context():
+            try:
+                refresh_stale_handicaps()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Scheduled handicap refresh failed: {e}")
+            finally:
+                db.session.remove()
+
+    def post_round_jobs():
+        with app.app_context():
+            try:
+                pipeline.run_pending()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Post-round job run failed: {e}")
+            finally:
+                db.session.remove()
+
+    scheduler = BackgroundScheduler(daemon=True)
+    scheduler.add_job(refresh_handicaps_job, 'interval',
+                      minutes=app.config['HANDICAP_REFRESH_MINUTES'],
+                      id='refresh_handicaps', coalesce=True, max_instances=1)
+    scheduler.add_job(post_round_jobs, 'interval',
+                      seconds=app.config['PIPELINE_POLL_SECONDS'],
+                      id='post_round_jobs', coalesce=True, max_instances=1)
+    scheduler.start()
+    app.extensions['scheduler'] = scheduler
+    return scheduler
+
+
+@main.cli.command('init-db')
+def init_db_command():
+    """Create any missing database tables."""
+    db.create_all()
+    click.echo("Database tables created")
+
 
-if not app.config['GHIN_ADMIN_USER'] or not app.config['GHIN_ADMIN_PASSWORD']:
-    raise Exception("API credentials are not set in environment variables.")
+@main.cli.command('refresh-handicaps')
+@click.option('--workers', default=8, show_default=True, help='Concurrent GHIN lookups.')
+@click.option('--rate', default=10.0, show_default=True, help='Maximum GHIN requests per second.')
+def refresh_handicaps_command(workers, rate):
+    """Refresh the handicap index of every golfer with a GHIN ID."""
+    report = bulk_refresh_handicaps(workers=workers, rate=rate)
+    click.echo(f"Updated {report['updated']} of {report['total']} golfers in "
+               f"{report['seconds']:.1f}s ({report['golfers_per_second']:.1f} golfers/s)")
+    if report['not_found']:
+        click.echo(f"Not found on GHIN: {report['not_found']}")
+    for golfer_id, error in report['failed']:
+        click.echo(f"Golfer {golfer_id} failed: {error}", err=True)
 
-connect_db(app)
-with app.app_context():
-    db.create_all()
 
+@main.cli.command('backfill-round-summaries')
+@click.option('--batch-size', default=500, show_default=True)
+def backfill_round_summaries_command(batch_size):
+    """Create round summaries for rounds submitted before they existed."""
+    created = RoundSummary.backfill(batch_size=batch_size)
+    click.echo(f"Created {created} round summaries")
+
+
+@main.cli.command('recompute-statistics')
+def recompute_statistics_command():
+    """Rebuild every golfer's statistics from their scores."""
+    golfers = Statistic.recompute()
+    db.session.commit()
+    click.echo(f"Recomputed statistics for {golfers} golfers")
+
+
+@main.cli.command('recompute-handicaps')
+def recompute_handicaps_command():
+    """Rebuild every golfer's local handicap index from stored rounds."""
+    golfers = recompute_handicaps()
+    db.session.commit()
+    click.echo(f"Recomputed handicap indexes for {golfers} golfers")
+
+
+@main.cli.command('rebuild-hole-aggregates')
+def rebuild_hole_aggregates_command():
+    """Recompute every course's hole difficulty aggregates from the scores."""
+    holes = HoleAggregate.recompute()
+    db.session.commit()
+    click.echo(f"Rebuilt aggregates for {holes} holes")
 
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'  # Specify the login route
+
+@main.cli.command('rebuild-leaderboards')
+def rebuild_leaderboards_command():
+    """Recompute every leaderboard from the stored rounds."""
+    entries = rebuild_leaderboards()
+    db.session.commit()
+    for name, count in entries.items():
+        click.echo(f"{name}: {count} entries")
 
 
 @login_manager.user_loader
@@ -49,14 +199,14 @@ def load_user(user_id):
     return Golfer.query.get(int(user_id))
 
 
-@app.route('/', methods=['GET', 'POST'])
+@main.route('/', methods=['GET', 'POST'])
 @login_required
 def home():
     form = CourseSearchForm()
     return render_template('home.html', form=form)
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -72,11 +222,11 @@ def register():
         db.session.add(new_golfer)
         db.session.commit()
         flash('You have been registered! You can now log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html', form=form)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -86,20 +236,20 @@ def login():
 
             next_page = request.args.get('next')
             if not next_page or not next_page.startswith('/'):
-                next_page = url_for('home')
+                next_page = url_for('main.home')
             return redirect(next_page)
         else:
             flash('Login Unsuccessful. Please check username and password', 'danger')
     return render_template('login.html', form=form)
 
 
-@app.route('/logout')
+@main.route('/logout')
 def logout():
     logout_user()
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 
-@app.route('/profile', methods=['GET', 'POST'])
+@main.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     form = ProfileForm(obj=current_user)
@@ -107,11 +257,11 @@ def profile():
         current_user.email = form.email.data
         db.session.commit()
         flash('Your profile has been updated!', 'success')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
     return render_template('profile.html', form=form)
 
 
-@app.route('/search_courses_route', methods=['GET', 'POST'])
+@main.route('/search_courses_route', methods=['GET', 'POST'])
 @login_required
 def search_courses_route():
     form = CourseSearchForm()
@@ -119,9 +269,8 @@ def search_courses_route():
     if form.validate_on_submit():  # checks if the form submission is valid
         search_performed = True
         query = form.course_name.data  # directly using the validated form data
-        courses = search_courses(query)  # Corrected function call
+        courses = find_courses(query)  # Local index first, GHIN on a miss
         if courses:
-            save_course_data(courses)
             return render_template('search_courses.html', courses=courses, form=form, search_performed=search_performed)
         else:
             flash('Failed to fetch course data', 'error')
@@ -130,22 +279,18 @@ def search_courses_route():
     return render_template('search_courses.html', form=form, search_performed=search_performed)
 
 
-@app.route('/courses/<int:course_id>', methods=['GET', 'POST'])
+@main.route('/courses/<int:course_id>', methods=['GET', 'POST'])
 @login_required
 def view_course(course_id):
 
-    course_details = fetch_course_details(course_id)  # Fetch from API
+    course_details = get_course_details(course_id)
+    course = get_course_with_tees(course_id)  # Tees and holes from the database
     form = GameInitiationForm()
-    # db_course = Course.query.get(course_id)  # Fetch from database
-    # if not db_course:
-    #     flash('Course details could not be retrieved from the database.', 'error')
-    #     return redirect(url_for('search_courses_route'))
 
-    # If API provided additional details, merge or use them
-    if course_details:
-        tee_choices = [(tee['TeeSetRatingId'], f"{tee['TeeSetRatingName']} - {tee['TotalYardage']} yards")
-                       for tee in course_details.get('TeeSets', [])]
-        form.tee.choices = tee_choices  # Update form choices with API data
+    if course:
+        tee_choices = [(tee.tee_set_id, f"{tee.name} - {tee.yardage} yards")
+                       for tee in course.tees]
+        form.tee.choices = tee_choices
 
     if request.method == 'POST' and form.validate_on_submit():
         tee_id = form.tee.data
@@ -164,69 +309,125 @@ def view_course(course_id):
         )
         db.session.add(new_round)
         db.session.commit()
-        app.logger.info(
+        current_app.logger.info(
             f"New round started successfully: {new_round.id}")
-        return redirect(url_for('scorecard', round_id=new_round.id))
+        return redirect(url_for('main.scorecard', round_id=new_round.id))
     elif request.method == 'POST':
-        app.logger.info("Form errors: {}".format(form.errors))
+        current_app.logger.info("Form errors: {}".format(form.errors))
         flash('Error with form data.', 'error')
 
     return render_template('view_course.html', form=form, course_details=course_details)
 
 
-@app.route('/scorecard/<int:round_id>', methods=['GET', 'POST'])
+@main.route('/courses/<int:course_id>/difficulty')
 @login_required
-def scorecard(round_id):
-    round = Round.query.get_or_404(round_id)
-    course_details = fetch_course_details(round.course_id)
+def course_difficulty(course_id):
+    """How each hole of a course plays, per tee, from the running aggregates."""
+    course = Course.query.filter_by(course_id=course_id).first()
+    aggregates = (HoleAggregate.query
+                  .filter(HoleAggregate.course_id == course_id, HoleAggregate.times_played > 0)
+                  .order_by(HoleAggregate.tee_id, HoleAggregate.hole_number).all())
+    tee_names = dict(db.session.execute(
+        db.select(Tee.tee_set_id, Tee.name)
+        .where(Tee.tee_set_id.in_({aggregate.tee_id for aggregate in aggregates}))).all())
+
+    tees = {}
+    for aggregate in aggregates:
+        tees.setdefault(aggregate.tee_id, []).append(aggregate)
+    # 1 is the hole that plays hardest against par
+    ranks = {}
+    for holes in tees.values():
+        for rank, aggregate in enumerate(
+                sorted(holes, key=lambda aggregate: -aggregate.average_to_par), start=1):
+            ranks[aggregate.id] = rank
+
+    return render_template('course_difficulty.html', course=course, course_id=course_id,
+                           tees=tees, tee_names=tee_names, ranks=ranks)
+
+
+MAX_NEARBY_RESULTS = 100
+
+
+def _nearby_query_args():
+    """Read and validate lat/lon/radius_km/k from the query string."""
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lon', type=float)
+    radius_km = request.args.get('radius_km', type=float)
+    k = max(1, min(request.args.get('k', 20, type=int), MAX_NEARBY_RESULTS))
+    if latitude is not None and not -90 <= latitude <= 90:
+        latitude = None
+    if longitude is not None and not -180 <= longitude <= 180:
+        longitude = None
+    return latitude, longitude, radius_km, k
+
+
+@main.route('/courses/nearby')
+@login_required
+def view_nearby_courses():
+    latitude, longitude, radius_km, k = _nearby_query_args()
+    courses = []
+    if latitude is not None and longitude is not None:
+        courses = nearby_courses(latitude, longitude, radius_km=radius_km, k=k)
+    return render_template('nearby_courses.html', courses=courses, latitude=latitude,
+                           longitude=longitude, radius_km=radius_km)
 
-    if not course_details or 'TeeSets' not in course_details:
-        flash('Failed to retrieve course details.', 'error')
-        return redirect(url_for('view_course', course_id=round.course_id))
 
-    tee_set = next((tee for tee in course_details['TeeSets']
-                    if str(tee['TeeSetRatingId']) == str(round.tee_id)), None)
-    if not tee_set:
+@main.route('/api/courses/nearby')
+@login_required
+def api_nearby_courses():
+    latitude, longitude, radius_km, k = _nearby_query_args()
+    if latitude is None or longitude is None:
+        return jsonify({'error': 'Valid lat and lon query parameters are required.'}), 400
+    courses = nearby_courses(latitude, longitude, radius_km=radius_km, k=k)
+    return jsonify([{
+        'course_id': course.course_id,
+        'name': course.name,
+        'city': course.city,
+        'state': course.state,
+        'latitude': course.latitude,
+        'longitude': course.longitude,
+        'distance_km': round(distance, 2)
+    } for course, distance in courses])
+
+
+@main.route('/scorecard/<int:round_id>', methods=['GET', 'POST'])
+@login_required
+def scorecard(round_id):
+    round = Round.query.get_or_404(round_id)
+    tee = get_tee_with_holes(round.course_id, round.tee_id)
+    if not tee or not tee.holes:
         flash('Tee set details could not be found.', 'error')
-        return redirect(url_for('view_course', course_id=round.course_id))
+        return redirect(url_for('main.view_course', course_id=round.course_id))
 
-    holes = tee_set['Holes']
+    holes = tee.holes
     form = ScorecardForm()
 
     if request.method == 'GET':
         form.holes.entries.clear()  # Clear previous entries to avoid duplication
-        for hole_data in tee_set['Holes']:
+        for hole_data in holes:
             hole_form = HoleEntryForm()
             # Ensure the form is populated correctly
             form.holes.append_entry(hole_form.data)
 
     if form.validate_on_submit():
         try:
-            scores_to_add = []
-            for hole_form, hole_data in zip(form.holes.entries, holes):
-                score = Score(
-                    round_id=round.id,
-
-                    hole_number=hole_data['Number'],
-                    # hole_id=hole_data['HoleId'],
-                    hole_par=hole_data['Par'],
-                    yardage=hole_data['Length'],
-                    hole_handicap=hole_data['Allocation'],
-                    score=hole_form.score.data,
-                    fairway_hit=hole_form.fairway_hit.data,
-                    green_in_regulation=hole_form.green_in_regulation.data,
-                    putts=hole_form.putts.data,
-                    bunker_shots=hole_form.bunker_shots.data,
-                    penalties=hole_form.penalties.data
-                )
-                scores_to_add.append(score)
-            db.session.add_all(scores_to_add)
+            entries = [dict(hole_form.data, hole_number=hole_data.number)
+                       for hole_form, hole_data in zip(form.holes.entries, holes)]
+            # Scores and the round summary are upserted in bulk, and
+            # statistics, milestones and leaderboards are queued with them
+            result = submit_scorecard(round, tee, entries)
             db.session.commit()
-            flash('Scores submitted successfully!', 'success')
-            return redirect(url_for('round_details', round_id=round.id))
+            pipeline.wake(round.id)
+            flash('Scores updated successfully!' if result == 'updated' else
+                  'Scores submitted successfully!', 'success')
+            return redirect(url_for('main.round_details', round_id=round.id))
+        except ScorecardError as e:
+            db.session.rollback()
+            for error in e.errors:
+                flash(error, 'error')
         except Exception as e:
             db.session.rollback()
-            app.logger.error(f"Failed to save scores: {str(e)}")
+            current_app.logger.error(f"Failed to save scores: {str(e)}")
             flash(
                 'Failed to save scores due to a database error. Error: {}'.format(e), 'error')
     else:
@@ -235,7 +436,7 @@ def scorecard(round_id):
     hole_forms = zip(form.holes.entries, holes)
     return render_template('scorecard.html', form=form, round=round, hole_forms=hole_forms)
 
-# @app.route('/round_details/<int:round_id>', methods=['POST'])
+# @main.route('/round_details/<int:round_id>', methods=['POST'])
 # @login_required
 # def submit_score(round_id):
 #     form = ScoreEntryForm()
@@ -252,7 +453,7 @@ def scorecard(round_id):
 #         check_and_create_milestones(golfer_id=current_user.id, score=score)
 
 #         flash('Score submitted successfully!', 'success')
-#         return redirect(url_for('enter_scores', round_id=round_id))
+#         return redirect(url_for('main.enter_scores', round_id=round_id))
 #     return render_template('submit_score.html', form=form, round_id=round_id)
 
 
@@ -289,7 +490,7 @@ def scorecard(round_id):
 #     create_milestone(golfer_id, "Tournament Win", "Won a tournament")
 
 
-# @app.route('/complete_round/<int:round_id>', methods=['POST'])
+# @main.route('/complete_round/<int:round_id>', methods=['POST'])
 # @login_required
 # def complete_round(round_id):
 #     round = Round.query.get_or_404(round_id)
@@ -308,88 +509,161 @@ def scorecard(round_id):
 
 #     db.session.commit()
 #     flash('Round completed and leaderboard updated!', 'success')
-#     return redirect(url_for('round_details', round_id=round_id))
+#     return redirect(url_for('main.round_details', round_id=round_id))
 
 
-@app.route('/view_golfer', methods=['POST'])
+@main.route('/view_golfer', methods=['POST'])
 def view_golfer():
     form = GolferSearchForm()
     if form.validate_on_submit():
         golfer = Golfer.query.filter_by(
             username=form.golfer_username.data).first()
         if golfer:
-            return redirect(url_for('golfer_trophy_room', golfer_id=golfer.id))
+            return redirect(url_for('main.golfer_trophy_room', golfer_id=golfer.id))
         else:
             flash('Golfer not found.', 'danger')
-            return redirect(url_for('home'))
-    return redirect(url_for('home'))
+            return redirect(url_for('main.home'))
+    return redirect(url_for('main.home'))
 
 
-@app.route('/golfer/<int:golfer_id>/rounds')
+@main.route('/golfer/<int:golfer_id>/rounds')
 def view_golfer_rounds(golfer_id):
     golfer = Golfer.query.get_or_404(golfer_id)
-    rounds = golfer.rounds.order_by(Round.date_played.desc()).all()
-    return render_template('golfer_rounds.html', golfer=golfer, rounds=rounds)
+    rounds, next_before = Round.page_for_golfer(
+        golfer_id, before=_parse_round_cursor(request.args.get('before')))
+    next_cursor = f"{next_before[0].isoformat()}_{next_before[1]}" if next_before else None
+    return render_template('golfer_rounds.html', golfer=golfer, rounds=rounds, next_cursor=next_cursor)
+
+
+def _parse_round_cursor(cursor):
+    """Parse a '<date_played iso>_<round id>' pagination cursor."""
+    if not cursor:
+        return None
+    try:
+        date_played, round_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(date_played), int(round_id)
+    except ValueError:
+        return None
 
 
-@app.route('/round_details/<int:round_id>')
+@main.route('/round_details/<int:round_id>')
 def round_details(round_id):
     round = Round.query.get_or_404(round_id)
     statistics = round.calculate_round_statistics()
-    # Log the statistics
-
-    app.logger.debug("Statistics: " + str(statistics))
-    app.logger.info(f"Statistics for round {round_id}: {statistics}")
+    current_app.logger.debug(f"Statistics for round {round_id}: {statistics}")
 
     try:
-        graph_json = round.create_score_chart()
-        app.logger.debug("Graph JSON: " + str(graph_json))
-        app.logger.info(f"Graph JSON: {graph_json}")
+        graph_json = round.create_score_chart()  # Cached figure spec
     except Exception as e:
-        app.logger.error(f"Error creating graph JSON: {e}")
+        current_app.logger.error(f"Error creating graph JSON: {e}")
         graph_json = {}  # Provide an empty dict if chart creation fails
 
     return render_template('round_details.html', round=round, statistics=statistics, graph_json=graph_json)
 
 
-@app.route('/search_rounds', methods=['GET', 'POST'])
+@main.route('/api/rounds/<int:round_id>/scores', methods=['PUT'])
+@csrf.exempt  # JSON only: browsers cannot send it cross-site without CORS
+@login_required
+def api_submit_scores(round_id):
+    round = Round.query.get_or_404(round_id)
+    if round.golfer_id != current_user.id:
+        return jsonify({'errors': ['This round belongs to another golfer.']}), 403
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('holes'), list):
+        return jsonify({'errors': ['Expected a JSON object with a "holes" list.']}), 400
+
+    tee = get_tee_with_holes(round.course_id, round.tee_id)
+    if not tee or not tee.holes:
+        return jsonify({'errors': ['Tee set details could not be found.']}), 404
+    try:
+        result = submit_scorecard(round, tee, payload['holes'])
+        db.session.commit()
+    except ScorecardError as e:
+        db.session.rollback()
+        return jsonify({'errors': e.errors}), 400
+    pipeline.wake(round.id)
+    return jsonify({
+        'round_id': round.id,
+        'result': result,
+        'total_score': round.total_score(),
+        'processing_url': url_for('main.api_round_processing', round_id=round.id),
+    }), 201 if result == 'created' else 200
+
+
+@main.route('/api/rounds/<int:round_id>/processing')
+@login_required
+def api_round_processing(round_id):
+    Round.query.get_or_404(round_id)
+    return jsonify(pipeline.status(round_id))
+
+
+@main.route('/api/pipeline/metrics')
+@login_required
+def api_pipeline_metrics():
+    return jsonify(pipeline.metrics())
+
+
+@main.route('/api/golfers/<int:golfer_id>/head-to-head/<int:opponent_id>')
+@login_required
+def api_head_to_head(golfer_id, opponent_id):
+    if golfer_id == opponent_id:
+        return jsonify({'errors': ['Choose two different golfers.']}), 400
+    found = db.session.scalar(db.select(db.func.count(Golfer.id))
+                              .where(Golfer.id.in_((golfer_id, opponent_id))))
+    if found != 2:
+        return jsonify({'errors': ['Golfer not found.']}), 404
+    return jsonify(head_to_head(golfer_id, opponent_id))  # Cached per pair of golfers
+
+
+ROUNDS_PER_PAGE = 25
+
+
+@main.route('/search_rounds', methods=['GET'])
+@login_required
 def search_rounds():
-    form = SearchRoundsForm()  # Assume this form is defined to accept dates and game type
-    if form.validate_on_submit():
-        rounds = Round.find_by_golfer_and_date_range(
+    # A GET form so result pages can be linked and paginated
+    form = SearchRoundsForm(formdata=request.args or None, meta={'csrf': False})
+    if request.args and form.validate():
+        page = request.args.get('page', 1, type=int)
+        rounds, total_count = Round.search(
             golfer_id=current_user.id,
             start_date=form.start_date.data,
-            end_date=form.end_date.data
+            end_date=form.end_date.data,
+            game_type_id=form.game_type.data.id if form.game_type.data else None,
+            course_id=form.course_id.data,
+            tee_id=form.tee_id.data,
+            min_score=form.min_score.data,
+            max_score=form.max_score.data,
+            page=page,
+            per_page=ROUNDS_PER_PAGE
         )
-        return render_template('rounds_search_results.html', rounds=rounds)
+        page_count = (total_count + ROUNDS_PER_PAGE - 1) // ROUNDS_PER_PAGE
+        filters = {key: value for key, value in request.args.items() if key != 'page'}
+        return render_template('rounds_search_results.html', rounds=rounds, total_count=total_count,
+                               page=page, page_count=page_count, filters=filters)
     return render_template('search_rounds.html', form=form)
 
 
-@app.route('/golfer/<int:golfer_id>/profile')
+@main.route('/golfer/<int:golfer_id>/profile')
 @login_required
 def golfer_profile(golfer_id):
     golfer = Golfer.query.get_or_404(golfer_id)
-    handicap = fetch_golfer_handicap(golfer.ghin_id)
+    handicap = golfer.display_handicap  # Local WHS index, else the synced GHIN one
     return render_template('golfer_profile.html', golfer=golfer, handicap=handicap)
 
 
-@app.route('/golfer/<int:golfer_id>/trophy_room', methods=['GET'])
+@main.route('/golfer/<int:golfer_id>/trophy_room', methods=['GET'])
 @login_required
 def golfer_trophy_room(golfer_id):
     golfer = Golfer.query.get_or_404(golfer_id)
-    # Ensure that golfer.ghin_id, golfer.last_name, and golfer.state are not None
-    if golfer.ghin_id and golfer.last_name and golfer.state:
-        handicap = fetch_golfer_handicap(
-            golfer.ghin_id, golfer.last_name, golfer.state)
-    else:
-        handicap = "Not available"  # or handle it as appropriate if any info is missing
+    handicap = golfer.display_handicap  # Local WHS index, else the synced GHIN one
     milestones = golfer.milestones
     return render_template('golfer_trophy_room.html', golfer=golfer, milestones=milestones, handicap=handicap)
 
 # Route to record a milestone for a golfer
 
 
-@app.route('/golfer/<int:golfer_id>/add_milestone', methods=['GET', 'POST'])
+@main.route('/golfer/<int:golfer_id>/add_milestone', methods=['GET', 'POST'])
 @login_required
 def add_milestone(golfer_id):
     if request.method == 'POST':
@@ -401,11 +675,11 @@ def add_milestone(golfer_id):
         db.session.add(new_milestone)
         db.session.commit()
         flash('Milestone added successfully!', 'success')
-        return redirect(url_for('view_golfer', golfer_id=golfer_id))
+        return redirect(url_for('main.view_golfer', golfer_id=golfer_id))
     return render_template('add_milestone.html', golfer_id=golfer_id)
 
 
-@app.route('/golfer/<int:golfer_id>/statistics', methods=['GET', 'POST'])
+@main.route('/golfer/<int:golfer_id>/statistics', methods=['GET', 'POST'])
 @login_required
 def view_statistics(golfer_id):
     golfer = Golfer.query.get_or_404(golfer_id)
@@ -415,8 +689,18 @@ def view_statistics(golfer_id):
         # Update other fields similarly
         db.session.commit()
         flash('Statistics updated successfully!', 'success')
-    return render_template('view_statistics.html', golfer=golfer)
 
+    try:
+        analytics = golfer_analytics(golfer.id)  # Cached until a new round is processed
+    except ImportError:
+        current_app.logger.warning("NumPy is not installed; golfer analytics are unavailable.")
+        analytics = None
+    graph_json = trend_chart(analytics) if analytics and analytics['full_rounds'] else {}
+    return render_template('view_statistics.html', golfer=golfer, statistics=golfer.statistics,
+                           analytics=analytics, graph_json=graph_json)
+
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,91 @@
+"""Time golfer analytics for a golfer with a long history.
+
+One golfer gets `--rounds` 18-hole rounds, bulk inserted; the benchmark
+times compute_analytics() cold and the cached lookup the statistics page
+makes afterwards:
+
+    python benchmarks/analytics.py --rounds 1000
+    python benchmarks/analytics.py --database-url postgresql:///swing_oil_bench
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from models import db, Golfer, Round, Score, Statistic  # noqa: E402
+from analytics import AnalyticsCache, compute_analytics  # noqa: E402
+
+
+def make_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+    return app
+
+
+def add_rounds(golfer, count, rng):
+    start = datetime(2015, 1, 1, 8)
+    round_ids = db.session.scalars(db.insert(Round).returning(Round.id), [
+        {'golfer_id': golfer.id, 'course_id': 1, 'tee_id': 1,
+         'date_played': start + timedelta(days=day)} for day in range(count)]).all()
+    pars = [4, 3, 5, 4, 4, 3, 4, 5, 4] * 2
+    db.session.execute(db.insert(Score), [
+        {'round_id': round_id, 'hole_number': number, 'hole_par': par, 'hole_handicap': number,
+         'score': par + rng.randint(-1, 3), 'putts': rng.randint(1, 3),
+         'fairway_hit': rng.random() < 0.5, 'green_in_regulation': rng.random() < 0.3}
+        for round_id in round_ids for number, par in enumerate(pars, start=1)])
+    db.session.add(Statistic(golfer_id=golfer.id, updated_at=datetime.utcnow()))
+    db.session.commit()
+
+
+def report(label, timings):
+    ordered = sorted(timings)
+    print(f'{label:>8}: median {statistics.median(ordered):8.3f} ms  '
+          f'max {ordered[-1]:8.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        golfer = Golfer(username='golfer', email='golfer@example.com',
+                        first_name='Bench', last_name='Golfer', state='TX')
+        db.session.add(golfer)
+        db.session.commit()
+        add_rounds(golfer, args.rounds, random.Random(args.seed))
+        print(f'{args.rounds} rounds, {args.rounds * 18} holes, {db.engine.dialect.name}')
+
+        compute_analytics(golfer.id)  # Import NumPy outside the timings
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            compute_analytics(golfer.id)
+            timings.append((time.perf_counter() - start) * 1000)
+        report('compute', timings)
+
+        cache, timings = AnalyticsCache(), []
+        cache.get(golfer.id)
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            cache.get(golfer.id)
+            timings.append((time.perf_counter() - start) * 1000)
+        report('cached', timings)
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Time handicap index updates against a full recompute over a roster.
+
+Every golfer gets a history of rated rounds, bulk inserted; the benchmark
+then times recompute_handicaps() and one more round per golfer applied with
+update_handicap():
+
+    python benchmarks/handicap.py --golfers 2000 --rounds 40
+    python benchmarks/handicap.py --database-url postgresql:///swing_oil_bench
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from models import db, Golfer, Round, RoundSummary  # noqa: E402
+from handicap import recompute_handicaps, update_handicap  # noqa: E402
+
+
+def make_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+    return app
+
+
+def add_rounds(golfers, days, rng):
+    """Bulk insert one rated round per golfer per day; returns the round ids."""
+    start = datetime(2024, 1, 1, 8)
+    rows = [{'golfer_id': golfer.id, 'course_id': 1, 'tee_id': 1,
+             'date_played': start + timedelta(days=day)}
+            for day in days for golfer in golfers]
+    ids = db.session.scalars(db.insert(Round).returning(Round.id), rows).all()
+    db.session.execute(db.insert(RoundSummary), [
+        {'round_id': round_id, 'holes_played': 18, 'total_score': 90,
+         'score_differential': round(rng.uniform(5, 30), 1)} for round_id in ids])
+    db.session.commit()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--golfers', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=40)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        rng = random.Random(args.seed)
+        golfers = [Golfer(username=f'golfer{n}', email=f'golfer{n}@example.com',
+                          first_name='Bench', last_name=str(n), state='TX')
+                   for n in range(args.golfers)]
+        db.session.add_all(golfers)
+        db.session.commit()
+        add_rounds(golfers, range(args.rounds), rng)
+        print(f'{args.golfers} golfers, {args.rounds} rounds each, {db.engine.dialect.name}')
+
+        start = time.perf_counter()
+        recompute_handicaps()
+        db.session.commit()
+        print(f'{"recompute":>12}: {(time.perf_counter() - start) * 1000:9.2f} ms')
+
+        timings = []
+        for round_id in add_rounds(golfers, [args.rounds], rng):
+            start = time.perf_counter()
+            update_handicap(db.session.get(Round, round_id))
+            db.session.commit()
+            timings.append((time.perf_counter() - start) * 1000)
+        ordered = sorted(timings)
+        print(f'{"update":>12}: median {statistics.median(ordered):7.2f} ms  '
+              f'p95 {ordered[int(len(ordered) * 0.95) - 1]:7.2f} ms  '
+              f'total {sum(timings) / 1000:6.2f} s')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Time leaderboard updates for one large match-play match and stroke-play field.
+
+Every golfer submits an 18-hole round on the same course and day, and each
+submission updates the leaderboard the way the scorecard view does:
+
+    python benchmarks/leaderboard.py --golfers 240
+    python benchmarks/leaderboard.py --database-url postgresql:///swing_oil_bench
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from models import db, GameType, Golfer, Round, Score  # noqa: E402
+from leaderboard import update_leaderboard, rank_leaderboard, rebuild_leaderboard  # noqa: E402
+
+
+def make_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+    return app
+
+
+def submit_all(game_type, golfers, rng):
+    timings = []
+    for golfer in golfers:
+        round = Round(golfer_id=golfer.id, course_id=1, tee_id=1, game_type_id=game_type.id,
+                      date_played=datetime(2024, 6, 1, 8))
+        db.session.add(round)
+        db.session.flush()
+        db.session.execute(db.insert(Score), [
+            {'round_id': round.id, 'hole_number': number, 'hole_par': 4,
+             'score': rng.randint(3, 7)} for number in range(1, 19)])
+
+        start = time.perf_counter()
+        update_leaderboard(round)
+        db.session.commit()
+        rank_leaderboard(game_type)
+        db.session.commit()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    ordered = sorted(timings)
+    print(f'{label:>12}: median {statistics.median(ordered):7.2f} ms  '
+          f'p95 {ordered[int(len(ordered) * 0.95) - 1]:7.2f} ms  '
+          f'last {timings[-1]:7.2f} ms  total {sum(timings) / 1000:6.2f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--golfers', type=int, default=240)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        rng = random.Random(args.seed)
+        golfers = [Golfer(username=f'golfer{n}', email=f'golfer{n}@example.com',
+                          first_name='Bench', last_name=str(n), state='TX')
+                   for n in range(args.golfers)]
+        game_types = {name: GameType(name=name) for name in ('Match Play', 'Stroke Play')}
+        db.session.add_all(golfers + list(game_types.values()))
+        db.session.commit()
+
+        print(f'{args.golfers} golfers, 18 holes, {db.engine.dialect.name}')
+        for name, game_type in game_types.items():
+            report(name, submit_all(game_type, golfers, rng))
+
+            start = time.perf_counter()
+            rebuild_leaderboard(game_type)
+            db.session.commit()
+            print(f'{"rebuild":>12}: {(time.perf_counter() - start) * 1000:7.2f} ms')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
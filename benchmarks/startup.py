@@ -0,0 +1,53 @@
+"""Measure per-worker startup cost: import time, app creation time and RSS.
+
+Each sample runs in a fresh interpreter, the same way a new worker would:
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import models
+models_loaded = time.perf_counter()
+import app
+app_loaded = time.perf_counter()
+print(json.dumps({
+    "import_models_ms": (models_loaded - start) * 1000,
+    "import_app_ms": (app_loaded - start) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": sorted(m for m in ("plotly", "pandas", "numpy", "apscheduler") if m in sys.modules),
+}))
+'''
+
+
+def sample():
+    env = dict(os.environ, SCHEDULER_ENABLED='false')
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [sample() for _ in range(args.runs)]
+    for key in ('import_models_ms', 'import_app_ms', 'max_rss_mb'):
+        values = [s[key] for s in samples]
+        print(f'{key:>18}: median {statistics.median(values):8.1f}  '
+              f'min {min(values):8.1f}  max {max(values):8.1f}')
+    print(f'{"heavy modules":>18}: {", ".join(samples[-1]["heavy_modules"]) or "none"}')
+
+
+if __name__ == '__main__':
+    main()
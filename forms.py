@@ -20,6 +20,12 @@ class SearchRoundsForm(FlaskForm):
                          validators=[DataRequired()])
     game_type = QuerySelectField('Game Type', query_factory=game_type_choices,
                                  get_label='name', allow_blank=True, blank_text='Any')
+    course_id = IntegerField('Course ID', validators=[Optional()])
+    tee_id = IntegerField('Tee ID', validators=[Optional()])
+    min_score = IntegerField('Minimum Score', validators=[
+                             Optional(), NumberRange(min=1)])
+    max_score = IntegerField('Maximum Score', validators=[
+                             Optional(), NumberRange(min=1)])
     submit = SubmitField('Search Rounds')
 
 
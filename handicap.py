@@ -0,0 +1,223 @@
+"""World Handicap System index computed from the rounds stored here.
+
+A round's score differential is worked out once when its scorecard is
+submitted and stored on its RoundSummary. Each golfer's HandicapRecord keeps
+the differentials of their 20 most recent rated rounds, so a new round only
+updates that window instead of rescanning the golfer's history.
+"""
+from datetime import datetime
+import math
+
+from models import Golfer, HandicapRecord, Round, RoundSummary, db, dialect_insert
+
+
+WINDOW = 20
+MAX_INDEX = 54.0
+STANDARD_SLOPE = 113
+HOLES = 18
+# Per-hole cap for golfers without an index: par plus five
+NO_INDEX_MAX_OVER_PAR = 5
+
+# Differentials counted and the adjustment applied, by how many are on record
+COUNTED_DIFFERENTIALS = {
+    3: (1, -2.0), 4: (1, -1.0), 5: (1, 0.0), 6: (2, -1.0), 7: (2, 0.0), 8: (2, 0.0),
+    9: (3, 0.0), 10: (3, 0.0), 11: (3, 0.0), 12: (4, 0.0), 13: (4, 0.0), 14: (4, 0.0),
+    15: (5, 0.0), 16: (5, 0.0), 17: (6, 0.0), 18: (6, 0.0), 19: (7, 0.0), 20: (8, 0.0),
+}
+
+
+def _tenth(value):
+    """Round half away from zero to one decimal, as WHS does."""
+    return math.copysign(math.floor(abs(value) * 10 + 0.5) / 10, value)
+
+
+def _whole(value):
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+def course_handicap(index, slope_rating, course_rating, par):
+    """Strokes a golfer with `index` receives on a tee; negative for plus."""
+    return _whole(index * slope_rating / STANDARD_SLOPE + (course_rating - par))
+
+
+def strokes_received(course_handicap, stroke_index, holes=HOLES):
+    """Handicap strokes on the hole with `stroke_index` (1 is hardest).
+
+    Strokes go to the hardest holes first; plus handicaps give strokes back
+    starting from the easiest hole.
+    """
+    if course_handicap >= 0:
+        full, extra = divmod(course_handicap, holes)
+        return full + (1 if stroke_index <= extra else 0)
+    full, extra = divmod(-course_handicap, holes)
+    return -(full + (1 if stroke_index > holes - extra else 0))
+
+
+def adjusted_gross_score(holes, course_handicap=None):
+    """Total of (par, stroke_index, strokes) holes with each hole capped at
+    net double bogey, or par plus five without a course handicap."""
+    total = 0
+    for par, stroke_index, strokes in holes:
+        if course_handicap is None:
+            cap = par + NO_INDEX_MAX_OVER_PAR
+        else:
+            cap = par + 2 + strokes_received(course_handicap, stroke_index)
+        total += min(strokes, cap)
+    return total
+
+
+def score_differential(adjusted_gross, course_rating, slope_rating):
+    return _tenth((STANDARD_SLOPE / slope_rating) * (adjusted_gross - course_rating))
+
+
+def handicap_index(differentials):
+    """Index from up to WINDOW differentials; None below three."""
+    counted = COUNTED_DIFFERENTIALS.get(min(len(differentials), WINDOW))
+    if counted is None:
+        return None
+    count, adjustment = counted
+    best = sorted(differentials[:WINDOW])[:count]
+    return min(_tenth(sum(best) / count + adjustment), MAX_INDEX)
+
+
+def playing_handicap(tee, index):
+    """Course handicap of a golfer with `index` on `tee`, or None when
+    either the index or the tee's rating is missing."""
+    if index is None or not (tee and tee.course_rating and tee.slope_rating and tee.par):
+        return None
+    return course_handicap(index, tee.slope_rating, tee.course_rating, tee.par)
+
+
+def net_scores(rows, course_handicap):
+    """Set `net_score` on each Score row dict from the strokes received on
+    its hole; holes without a stroke index, or a card without a course
+    handicap, net their gross score."""
+    for row in rows:
+        strokes = 0
+        if course_handicap is not None and row['hole_handicap'] is not None:
+            strokes = strokes_received(course_handicap, row['hole_handicap'])
+        row['net_score'] = row['score'] - strokes
+    return rows
+
+
+def rate_round(summary, rows, tee, course_handicap):
+    """Store the course handicap, adjusted gross score and differential of
+    a submitted round on its summary.
+
+    `rows` are the round's Score rows as dicts and `course_handicap` comes
+    from playing_handicap() with the golfer's index before the round.
+    Rounds that are not 18 holes, or whose tee or holes lack ratings, pars
+    or stroke indexes, get no differential.
+    """
+    summary.course_handicap = course_handicap
+    summary.adjusted_gross_score = summary.score_differential = None
+    if not (tee and tee.course_rating and tee.slope_rating and tee.par):
+        return
+    if len(rows) != HOLES or any(row['hole_par'] is None or row['hole_handicap'] is None
+                                 for row in rows):
+        return
+    summary.adjusted_gross_score = adjusted_gross_score(
+        [(row['hole_par'], row['hole_handicap'], row['score']) for row in rows],
+        course_handicap)
+    summary.score_differential = score_differential(
+        summary.adjusted_gross_score, tee.course_rating, tee.slope_rating)
+
+
+def current_index(golfer_id):
+    golfer = db.session.get(Golfer, golfer_id)
+    return golfer.current_handicap_index if golfer else None
+
+
+def _locked_record(golfer_id):
+    db.session.execute(dialect_insert(HandicapRecord).values(
+        golfer_id=golfer_id, differentials=[]).on_conflict_do_nothing(
+            index_elements=['golfer_id']))
+    return db.session.scalars(db.select(HandicapRecord)
+                              .where(HandicapRecord.golfer_id == golfer_id)
+                              .with_for_update()
+                              .execution_options(populate_existing=True)).one()
+
+
+def _save(record, window):
+    record.differentials = window
+    record.handicap_index = handicap_index([differential for _, _, differential in window])
+    record.updated_at = datetime.utcnow()
+
+
+def _latest_differentials(golfer_id, limit=WINDOW, exclude_round_id=None):
+    query = (db.select(Round.date_played, Round.id, RoundSummary.score_differential)
+             .join(RoundSummary, RoundSummary.round_id == Round.id)
+             .where(Round.golfer_id == golfer_id,
+                    RoundSummary.score_differential.isnot(None))
+             .order_by(Round.date_played.desc(), Round.id.desc())
+             .limit(limit))
+    if exclude_round_id is not None:
+        query = query.where(Round.id != exclude_round_id)
+    return [[date_played.isoformat(), round_id, differential]
+            for date_played, round_id, differential in db.session.execute(query)]
+
+
+def update_handicap(round):
+    """Add a round's differential to the golfer's window and re-derive the
+    index. Rounds older than a full window leave it unchanged."""
+    differential = round.summary.score_differential if round.summary else None
+    if differential is None:
+        return
+    record = _locked_record(round.golfer_id)
+    entry = [round.date_played.isoformat(), round.id, differential]
+    window = [item for item in record.differentials if item[1] != round.id]
+    if len(window) >= WINDOW and (entry[0], entry[1]) < (window[-1][0], window[-1][1]):
+        return
+    window.append(entry)
+    window.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    _save(record, window[:WINDOW])
+
+
+def retract_handicap(round):
+    """Take a round out of the golfer's window before its scores change."""
+    record = db.session.get(HandicapRecord, round.golfer_id)
+    if record is None or not any(item[1] == round.id for item in record.differentials):
+        return
+    record = _locked_record(round.golfer_id)
+    window = [item for item in record.differentials if item[1] != round.id]
+    if len(record.differentials) >= WINDOW:
+        # The round that slides back into the window is only in the database
+        window = _latest_differentials(round.golfer_id, exclude_round_id=round.id)
+    _save(record, window)
+
+
+def recompute_handicaps():
+    """Rebuild every golfer's record from stored differentials.
+
+    One windowed query reads the 20 latest differentials per golfer and one
+    upsert writes all records. Returns the number of golfers.
+    """
+    numbered = (db.select(Round.golfer_id, Round.date_played, Round.id,
+                          RoundSummary.score_differential,
+                          db.func.row_number().over(
+                              partition_by=Round.golfer_id,
+                              order_by=(Round.date_played.desc(), Round.id.desc())).label('n'))
+                .join(RoundSummary, RoundSummary.round_id == Round.id)
+                .where(RoundSummary.score_differential.isnot(None),
+                       Round.golfer_id.isnot(None))
+                .subquery())
+    windows = {}
+    for golfer_id, date_played, round_id, differential in db.session.execute(
+            db.select(numbered.c.golfer_id, numbered.c.date_played, numbered.c.id,
+                      numbered.c.score_differential)
+            .where(numbered.c.n <= WINDOW)
+            .order_by(numbered.c.golfer_id, numbered.c.n)):
+        windows.setdefault(golfer_id, []).append([date_played.isoformat(), round_id, differential])
+    if not windows:
+        return 0
+
+    now = datetime.utcnow()
+    stmt = dialect_insert(HandicapRecord).values([
+        {'golfer_id': golfer_id, 'differentials': window, 'updated_at': now,
+         'handicap_index': handicap_index([differential for _, _, differential in window])}
+        for golfer_id, window in windows.items()])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['golfer_id'],
+        set_={column: getattr(stmt.excluded, column)
+              for column in ('differentials', 'updated_at', 'handicap_index')}))
+    return len(windows)
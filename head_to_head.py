@@ -0,0 +1,171 @@
+"""Head-to-head comparison of two golfers on the courses both have played.
+
+Two grouped queries do the work: one pairs the holes the golfers played on
+the same course and day and counts who won each, the other sums each
+golfer's round summaries per course. Neither loads a round history into
+Python. Comparisons are cached per pair of golfers in an AnalyticsCache, so
+they are recomputed once either golfer has a new round processed.
+"""
+from sqlalchemy.orm import aliased
+
+from analytics import AnalyticsCache
+from models import Course, Round, RoundSummary, Score, db
+
+
+FULL_ROUND_HOLES = 18
+
+# Per-golfer figures compared, each a (numerator, denominator, scale) of
+# the per-course sums below
+COMPARED = {
+    'scoring_average': ('full_strokes', 'full_rounds', 1),
+    'average_differential': ('differentials', 'rated_rounds', 1),
+    'putts_per_round': ('full_putts', 'full_rounds', 1),
+    'fairway_hit_percentage': ('fairways', 'holes', 100),
+    'green_in_regulation_percentage': ('greens', 'holes', 100),
+}
+
+
+def _holes_played_together(golfer_id, opponent_id):
+    """(course_id, course name, won, lost, halved, days) per course, from
+    holes both golfers scored on the same course and day.
+
+    Rounds are paired one-to-one: each golfer's rounds on a course and day
+    are numbered in play order, and the nth round of one meets only the
+    nth round of the other.
+    """
+    day = db.func.date(Round.date_played)
+    numbered = (db.select(Round.id, Round.golfer_id, Round.course_id, day.label('day'),
+                          db.func.row_number().over(
+                              partition_by=(Round.golfer_id, Round.course_id, day),
+                              order_by=(Round.date_played, Round.id)).label('nth'))
+                .where(Round.golfer_id.in_((golfer_id, opponent_id)),
+                       Round.course_id.isnot(None))
+                .subquery())
+    mine, theirs = aliased(numbered), aliased(numbered)
+    my_score, their_score = aliased(Score), aliased(Score)
+
+    def count(condition):
+        return db.func.sum(db.case((condition, 1), else_=0))
+
+    return db.session.execute(
+        db.select(mine.c.course_id, db.func.max(Course.name),
+                  count(my_score.score < their_score.score),
+                  count(my_score.score > their_score.score),
+                  count(my_score.score == their_score.score),
+                  db.func.count(db.distinct(mine.c.day)))
+        .join(my_score, my_score.round_id == mine.c.id)
+        .join(theirs, (theirs.c.course_id == mine.c.course_id)
+              & (theirs.c.day == mine.c.day) & (theirs.c.nth == mine.c.nth))
+        .join(their_score, (their_score.round_id == theirs.c.id)
+              & (their_score.hole_number == my_score.hole_number))
+        .outerjoin(Course, Course.course_id == mine.c.course_id)
+        .where(mine.c.golfer_id == golfer_id, theirs.c.golfer_id == opponent_id,
+               my_score.score.isnot(None), their_score.score.isnot(None))
+        .group_by(mine.c.course_id)).all()
+
+
+def _course_sums(golfer_ids):
+    """{golfer_id: {course_id: sums}} over every summarized round."""
+    full = RoundSummary.holes_played == FULL_ROUND_HOLES
+
+    def total(value, condition):
+        return db.func.sum(db.case((condition, value), else_=0))
+
+    sums = {
+        'rounds': db.func.count(),
+        'full_rounds': total(1, full),
+        'full_strokes': total(RoundSummary.total_score, full),
+        'full_putts': total(RoundSummary.total_putts, full),
+        'rated_rounds': total(1, RoundSummary.score_differential.isnot(None)),
+        'differentials': db.func.coalesce(db.func.sum(RoundSummary.score_differential), 0),
+        'holes': db.func.sum(RoundSummary.holes_played),
+        'fairways': db.func.sum(RoundSummary.fairways_hit),
+        'greens': db.func.sum(RoundSummary.greens_in_regulation),
+    }
+    result = {golfer_id: {} for golfer_id in golfer_ids}
+    for golfer_id, course_id, *values in db.session.execute(
+            db.select(Round.golfer_id, Round.course_id, *sums.values())
+            .join(RoundSummary, RoundSummary.round_id == Round.id)
+            .where(Round.golfer_id.in_(golfer_ids), Round.course_id.isnot(None))
+            .group_by(Round.golfer_id, Round.course_id)):
+        result[golfer_id][course_id] = dict(zip(sums, (value or 0 for value in values)))
+    return result
+
+
+def _figures(per_course, courses):
+    totals = {}
+    for course_id in courses:
+        for name, value in per_course[course_id].items():
+            totals[name] = totals.get(name, 0) + value
+    figures = {'rounds': totals.get('rounds', 0)}
+    for name, (numerator, denominator, scale) in COMPARED.items():
+        figures[name] = (round(totals[numerator] * scale / totals[denominator], 2)
+                         if totals.get(denominator) else None)
+    return figures
+
+
+def compare_golfers(golfer_id, opponent_id):
+    """How `golfer_id` fares against `opponent_id` on their shared courses.
+
+    Hole records count holes both scored in rounds paired on the same
+    course and day, lowest gross score winning. Statistics cover each
+    golfer's rounds on the shared courses, and deltas are the first
+    golfer's figure less the second's.
+    """
+    sums = _course_sums((golfer_id, opponent_id))
+    shared = sorted(sums[golfer_id].keys() & sums[opponent_id].keys())
+    figures = {golfer: _figures(sums[golfer], shared) for golfer in (golfer_id, opponent_id)}
+
+    together = {course_id: {'course_name': name, 'won': won, 'lost': lost,
+                            'halved': halved, 'days_played_together': days}
+                for course_id, name, won, lost, halved, days
+                in _holes_played_together(golfer_id, opponent_id)}
+    holes = {result: sum(course[result] for course in together.values())
+             for result in ('won', 'lost', 'halved')}
+
+    return {
+        'golfer_id': golfer_id,
+        'opponent_id': opponent_id,
+        'shared_courses': [
+            dict({'course_id': course_id, 'course_name': None, 'won': 0, 'lost': 0,
+                  'halved': 0, 'days_played_together': 0},
+                 **together.get(course_id, {}),
+                 golfer_rounds=sums[golfer_id][course_id]['rounds'],
+                 opponent_rounds=sums[opponent_id][course_id]['rounds'])
+            for course_id in shared],
+        'holes': holes,
+        'golfer': figures[golfer_id],
+        'opponent': figures[opponent_id],
+        'deltas': {name: (round(figures[golfer_id][name] - figures[opponent_id][name], 2)
+                          if figures[golfer_id][name] is not None
+                          and figures[opponent_id][name] is not None else None)
+                   for name in COMPARED},
+    }
+
+
+def _swapped(comparison):
+    """The same comparison seen from the other golfer's side."""
+    return dict(
+        comparison,
+        golfer_id=comparison['opponent_id'],
+        opponent_id=comparison['golfer_id'],
+        shared_courses=[dict(course, won=course['lost'], lost=course['won'],
+                             golfer_rounds=course['opponent_rounds'],
+                             opponent_rounds=course['golfer_rounds'])
+                        for course in comparison['shared_courses']],
+        holes=dict(comparison['holes'], won=comparison['holes']['lost'],
+                   lost=comparison['holes']['won']),
+        golfer=comparison['opponent'],
+        opponent=comparison['golfer'],
+        deltas={name: None if delta is None else 0 - delta
+                for name, delta in comparison['deltas'].items()})
+
+
+# Keyed by the lower golfer id first, so both golfers share one entry
+head_to_head_cache = AnalyticsCache(compare_golfers)
+
+
+def head_to_head(golfer_id, opponent_id):
+    if golfer_id <= opponent_id:
+        return head_to_head_cache.get(golfer_id, opponent_id)
+    return _swapped(head_to_head_cache.get(opponent_id, golfer_id))
@@ -0,0 +1,271 @@
+from datetime import datetime, time, timedelta
+import zlib
+
+from sqlalchemy import case, func, or_, select, text, union_all, update
+
+from models import GameType, Leaderboard, Round, Score, db, dialect_insert
+
+
+MATCH_PLAY = 'Match Play'
+STROKE_PLAY = 'Stroke Play'
+TOURNAMENT_PLAY = 'Tournament Play'
+
+# Rounds counted towards a golfer's tournament total, earliest first
+TOURNAMENT_ROUNDS = 4
+
+# Game types with a ranked leaderboard
+RANKED = (MATCH_PLAY, STROKE_PLAY, TOURNAMENT_PLAY)
+
+ADVISORY_LOCK_NAMESPACE = 0x6c62  # 'lb'
+
+
+def _rounds(game_type_id):
+    """Rounds of a game type, with the calendar day that groups a match."""
+    return select(Round.id, Round.golfer_id, Round.course_id, Round.date_played,
+                  Round.use_handicap, func.date(Round.date_played).label('day')).where(
+                      Round.game_type_id == game_type_id)
+
+
+def _strokes(rounds):
+    """What a hole of one of `rounds` counts for: the net score stored at
+    submission when the round is played with handicap, else the gross."""
+    return case((rounds.c.use_handicap, func.coalesce(Score.net_score, Score.score)),
+                else_=Score.score)
+
+
+def _match_rounds(round):
+    """The rounds played in the same match as `round`.
+
+    A match is every round of the game type on the same course and day.
+    """
+    day = datetime.combine(round.date_played.date(), time.min)
+    return _rounds(round.game_type_id).where(
+        Round.course_id == round.course_id,
+        Round.date_played >= day,
+        Round.date_played < day + timedelta(days=1))
+
+
+def _holes_won(rounds, sign=1):
+    """(golfer_id, won) per scored hole of `rounds`.
+
+    A hole is won by the single lowest score among two or more players on the
+    same course and day; ties and unopposed holes win nothing. Rounds played
+    with handicap compete with their net scores.
+    """
+    rounds = rounds.subquery()
+    partition = (rounds.c.course_id, rounds.c.day, Score.hole_number)
+    strokes = _strokes(rounds)
+    scored = (select(rounds.c.golfer_id, rounds.c.course_id, rounds.c.day,
+                     Score.hole_number, strokes.label('score'),
+                     func.min(strokes).over(partition_by=partition).label('best'),
+                     func.count().over(partition_by=partition).label('players'))
+              .join(Score, Score.round_id == rounds.c.id)
+              .where(Score.score.isnot(None))
+              .subquery())
+
+    partition = (scored.c.course_id, scored.c.day, scored.c.hole_number)
+    is_best = case((scored.c.score == scored.c.best, 1), else_=0)
+    ranked = select(scored.c.golfer_id, scored.c.players, is_best.label('is_best'),
+                    func.sum(is_best).over(partition_by=partition).label('tied')).subquery()
+
+    won = case(((ranked.c.is_best == 1) & (ranked.c.tied == 1) & (ranked.c.players > 1), sign),
+               else_=0)
+    return select(ranked.c.golfer_id, won.label('won'))
+
+
+def match_play_points(game_type_id):
+    """Holes won by every golfer over all matches of the game type."""
+    holes = _holes_won(_rounds(game_type_id)).subquery()
+    return db.session.execute(
+        select(holes.c.golfer_id, func.sum(holes.c.won))
+        .group_by(holes.c.golfer_id)).all()
+
+
+def match_play_changes(round):
+    """Change in holes won for each golfer of the match `round` was added to.
+
+    Holes are re-scored for the whole match with and without the new round,
+    so points a rival loses to a new tie or a new best are taken back. Only
+    rounds whose points are already on the leaderboard count as the match:
+    a scorecard committed but not yet applied is left to its own update,
+    so every round's points are counted exactly once.
+    """
+    applied = _match_rounds(round).where(Round.leaderboard_applied.is_(True),
+                                         Round.id != round.id)
+    with_round = _holes_won(_match_rounds(round).where(
+        or_(Round.leaderboard_applied.is_(True), Round.id == round.id)))
+    without_round = _holes_won(applied, sign=-1)
+    holes = union_all(with_round, without_round).subquery()
+    return db.session.execute(
+        select(holes.c.golfer_id, func.sum(holes.c.won))
+        .group_by(holes.c.golfer_id)).all()
+
+
+def _applied(round):
+    """Whether the round's points are on the leaderboard, read afresh once
+    the match lock is held."""
+    return db.session.scalar(select(Round.leaderboard_applied).where(Round.id == round.id))
+
+
+def _mark_applied(round, applied):
+    db.session.execute(update(Round).where(Round.id == round.id)
+                       .values(leaderboard_applied=applied))
+
+
+def _round_totals(rounds, latest_first, limit):
+    """Per golfer, the summed strokes of their first `limit` rounds, net for
+    rounds played with handicap."""
+    rounds = rounds.subquery()
+    if latest_first:
+        order = (rounds.c.date_played.desc(), rounds.c.id.desc())
+    else:
+        order = (rounds.c.date_played, rounds.c.id)
+    numbered = select(rounds.c.id, rounds.c.golfer_id, rounds.c.use_handicap,
+                      func.row_number().over(partition_by=rounds.c.golfer_id,
+                                             order_by=order).label('n')).subquery()
+    return db.session.execute(
+        select(numbered.c.golfer_id, func.sum(_strokes(numbered)))
+        .join(Score, Score.round_id == numbered.c.id)
+        .where(numbered.c.n <= limit)
+        .group_by(numbered.c.golfer_id)).all()
+
+
+def stroke_play_totals(game_type_id, golfer_id=None):
+    """Each golfer's strokes in their latest round of the game type."""
+    rounds = _rounds(game_type_id)
+    if golfer_id is not None:
+        rounds = rounds.where(Round.golfer_id == golfer_id)
+    return _round_totals(rounds, latest_first=True, limit=1)
+
+
+def tournament_play_totals(game_type_id, golfer_id=None):
+    """Each golfer's strokes over their first TOURNAMENT_ROUNDS rounds."""
+    rounds = _rounds(game_type_id)
+    if golfer_id is not None:
+        rounds = rounds.where(Round.golfer_id == golfer_id)
+    return _round_totals(rounds, latest_first=False, limit=TOURNAMENT_ROUNDS)
+
+
+def _lock(*key):
+    """Hold a lock on `key` until the transaction ends.
+
+    Changes computed from other rounds (a match's hole winners, a golfer's
+    latest rounds) are serialized per key so concurrent submissions see each
+    other. SQLite already serializes writers, so this is PostgreSQL only.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        digest = zlib.crc32(':'.join(map(str, key)).encode())
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                           {'key': (ADVISORY_LOCK_NAMESPACE << 32) | digest})
+
+
+def upsert_scores(game_type_id, scores, increment=False):
+    """Write (golfer_id, score) pairs to the leaderboard in one statement.
+
+    With increment, scores are added to existing entries in SQL, so
+    concurrent writers never overwrite each other; otherwise they replace
+    them. Rows are written in golfer order to keep row locks ordered.
+    """
+    if not scores:
+        return
+    stmt = dialect_insert(Leaderboard).values([
+        {'golfer_id': golfer_id, 'game_type_id': game_type_id, 'score': score}
+        for golfer_id, score in sorted(scores)])
+    score = Leaderboard.score + stmt.excluded.score if increment else stmt.excluded.score
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['golfer_id', 'game_type_id'], set_={'score': score}))
+
+
+def rank_leaderboard(game_type):
+    """Set `position` for every entry of a game type from its score.
+
+    Equal scores share a position; only entries whose position moved are
+    written. Run it in its own short transaction after the scores commit:
+    it locks the whole leaderboard, in golfer order like the upserts.
+    """
+    if game_type.name not in RANKED:
+        return
+    db.session.execute(select(Leaderboard.id)
+                       .where(Leaderboard.game_type_id == game_type.id)
+                       .order_by(Leaderboard.golfer_id)
+                       .with_for_update())
+
+    order = Leaderboard.score.desc() if game_type.name == MATCH_PLAY else Leaderboard.score.asc()
+    ranked = (select(Leaderboard.id, func.rank().over(order_by=order).label('position'))
+              .where(Leaderboard.game_type_id == game_type.id)
+              .subquery())
+    db.session.execute(
+        update(Leaderboard)
+        .where(Leaderboard.id == ranked.c.id,
+               Leaderboard.position.is_distinct_from(ranked.c.position))
+        .values(position=ranked.c.position))
+
+
+def update_leaderboard(round):
+    """Apply a round with saved scores to its game type's leaderboard.
+
+    Changes are executed but not committed, so they land in the caller's
+    transaction; positions are left to rank_leaderboard. Applying a match
+    play round that is already on the leaderboard changes nothing.
+    """
+    game_type = round.game_type
+    if game_type is None:
+        return
+
+    if game_type.name == MATCH_PLAY:
+        _lock('match', game_type.id, round.course_id, round.date_played.date())
+        if _applied(round):
+            return
+        upsert_scores(game_type.id, match_play_changes(round), increment=True)
+        _mark_applied(round, True)
+    elif game_type.name == STROKE_PLAY:
+        _lock('golfer', game_type.id, round.golfer_id)
+        upsert_scores(game_type.id, stroke_play_totals(game_type.id, round.golfer_id))
+    elif game_type.name == TOURNAMENT_PLAY:
+        _lock('golfer', game_type.id, round.golfer_id)
+        upsert_scores(game_type.id, tournament_play_totals(game_type.id, round.golfer_id))
+
+
+def retract_round(round):
+    """Take a round's match play points back out before its scores change.
+
+    Must run while the old scores are stored. Stroke and tournament totals
+    need nothing: they are recomputed when the round is applied again.
+    """
+    game_type = round.game_type
+    if game_type is None or game_type.name != MATCH_PLAY:
+        return
+    _lock('match', game_type.id, round.course_id, round.date_played.date())
+    if not _applied(round):
+        return
+    upsert_scores(game_type.id, [(golfer_id, -points) for golfer_id, points
+                                 in match_play_changes(round)], increment=True)
+    _mark_applied(round, False)
+
+
+def rebuild_leaderboard(game_type):
+    """Recompute every entry of a leaderboard from the stored rounds."""
+    if game_type.name == MATCH_PLAY:
+        scores = match_play_points(game_type.id)
+    elif game_type.name == STROKE_PLAY:
+        scores = stroke_play_totals(game_type.id)
+    elif game_type.name == TOURNAMENT_PLAY:
+        scores = tournament_play_totals(game_type.id)
+    else:
+        return 0
+
+    db.session.execute(db.delete(Leaderboard).where(
+        Leaderboard.game_type_id == game_type.id))
+    upsert_scores(game_type.id, scores)
+    if game_type.name == MATCH_PLAY:
+        # Every stored round is now counted; their pending updates skip
+        db.session.execute(update(Round).where(Round.game_type_id == game_type.id)
+                           .values(leaderboard_applied=True))
+    rank_leaderboard(game_type)
+    return len(scores)
+
+
+def rebuild_leaderboards():
+    """Rebuild the leaderboard of every game type; returns entries per name."""
+    return {game_type.name: rebuild_leaderboard(game_type)
+            for game_type in GameType.query.order_by(GameType.id)}
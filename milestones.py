@@ -0,0 +1,140 @@
+from datetime import datetime
+
+from models import Milestone, Round, RoundSummary, db
+
+
+FULL_ROUND_HOLES = 18
+
+
+class HoleRule:
+    """A milestone earned on a single hole.
+
+    `test(score)` gets a Score with its hole_par; `details` is formatted with
+    the hole number.
+    """
+
+    def __init__(self, type, test, details):
+        self.type = type
+        self.test = test
+        self.details = details
+
+
+class RoundRule:
+    """A milestone earned by a whole round.
+
+    `test(summary, history)` gets the round's RoundSummary and the golfer's
+    RoundHistory from before the round. With once=True a golfer earns it
+    only one time.
+    """
+
+    def __init__(self, type, test, details, once=False):
+        self.type = type
+        self.test = test
+        self.details = details
+        self.once = once
+
+
+class RoundHistory:
+    """What round rules need to know about a golfer's earlier full rounds.
+
+    Earlier means played before the round, ties broken by id, so the history
+    doesn't depend on the order rounds are processed or corrected in.
+    """
+
+    def __init__(self, best_score=None):
+        self.best_score = best_score
+
+    @classmethod
+    def before(cls, round):
+        if round.date_played is None:
+            earlier = Round.id < round.id
+        else:
+            earlier = db.tuple_(Round.date_played, Round.id) < (round.date_played, round.id)
+        return cls(db.session.scalar(
+            db.select(db.func.min(RoundSummary.total_score))
+            .join(Round, Round.id == RoundSummary.round_id)
+            .where(Round.golfer_id == round.golfer_id, earlier,
+                   RoundSummary.holes_played == FULL_ROUND_HOLES)))
+
+
+def _to_par(score):
+    return score.score - score.hole_par
+
+
+def _full_round(summary):
+    return summary.holes_played == FULL_ROUND_HOLES
+
+
+HOLE_RULES = (
+    HoleRule('Hole-in-One', lambda score: score.score == 1,
+             'Achieved hole-in-one on hole {hole}'),
+    HoleRule('Albatross', lambda score: score.score > 1 and _to_par(score) == -3,
+             'Achieved albatross on hole {hole}'),
+    HoleRule('Eagle', lambda score: score.score > 1 and _to_par(score) == -2,
+             'Achieved eagle on hole {hole}'),
+    HoleRule('Double-Sandy',
+             lambda score: score.hole_par == 4 and score.score == 4 and (score.bunker_shots or 0) >= 2,
+             'Achieved double-sandy on hole {hole}'),
+)
+
+ROUND_RULES = (
+    RoundRule('Personal Best',
+              lambda summary, history: _full_round(summary) and history.best_score is not None
+              and summary.total_score < history.best_score,
+              'New personal best of {total_score}'),
+    RoundRule('First Sub-90',
+              lambda summary, history: _full_round(summary) and summary.total_score < 90
+              and (history.best_score is None or history.best_score >= 90),
+              'First round under 90 with {total_score}', once=True),
+)
+
+
+def detect_milestones(round, scores, summary, history):
+    """Evaluate every rule against one round; returns Milestone row dicts."""
+    date = (round.date_played or datetime.utcnow()).date()
+    base = {'golfer_id': round.golfer_id, 'round_id': round.id, 'date': date}
+    found = []
+    for score in scores:
+        if score.score is None or score.hole_par is None:
+            continue
+        for rule in HOLE_RULES:
+            if rule.test(score):
+                found.append(dict(base, type=rule.type, hole_number=score.hole_number,
+                                  details=rule.details.format(hole=score.hole_number)))
+    for rule in ROUND_RULES:
+        if rule.test(summary, history):
+            found.append(dict(base, type=rule.type, hole_number=None,
+                              details=rule.details.format(total_score=summary.total_score)))
+    return found
+
+
+def record_milestones(round, scores, summary):
+    """Detect a round's milestones and bulk-insert the ones not yet recorded.
+
+    Existing milestones of the round, and one-time milestones of the golfer,
+    are read in one query. Nothing is committed.
+    """
+    found = detect_milestones(round, scores, summary, RoundHistory.before(round))
+    if not found:
+        return []
+
+    once = {rule.type for rule in ROUND_RULES if rule.once}
+
+    def key(type, round_id, hole_number):
+        return (type,) if type in once else (type, round_id, hole_number)
+
+    existing = {key(*row) for row in db.session.execute(
+        db.select(Milestone.type, Milestone.round_id, Milestone.hole_number)
+        .where(Milestone.golfer_id == round.golfer_id,
+               db.or_(Milestone.round_id == round.id, Milestone.type.in_(once))))}
+    new = [milestone for milestone in found if key(
+        milestone['type'], milestone['round_id'], milestone['hole_number']) not in existing]
+    if new:
+        db.session.execute(db.insert(Milestone), new)
+    return new
+
+
+def retract_milestones(round):
+    """Delete the milestones detected from a round, so they can be detected
+    again from replaced scores."""
+    db.session.execute(db.delete(Milestone).where(Milestone.round_id == round.id))
@@ -1,9 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-import plotly
-import plotly.express as px
-import json
+from datetime import datetime, timedelta
 from flask_login import UserMixin
+from sqlalchemy.dialects import postgresql, sqlite
 
 import bcrypt
 
@@ -11,16 +9,33 @@ import bcrypt
 db = SQLAlchemy()
 
 
+def dialect_insert(model):
+    """An INSERT for `model` that supports on_conflict_do_update."""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
 class APIToken(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String, nullable=False)
     expiry = db.Column(db.DateTime, nullable=False)
 
     @classmethod
-    def get_current_token(cls):
+    def get_current_token(cls, session=None):
         # This retrieves the most recent token that hasn't expired.
         now = datetime.utcnow()
-        return cls.query.filter(cls.expiry > now).order_by(cls.expiry.desc()).first()
+        return (session or db.session).scalars(
+            db.select(cls).where(cls.expiry > now).order_by(cls.expiry.desc()).limit(1)).first()
+
+
+class CachedCourseDetails(db.Model):
+    """Durable tier of the course details cache, one GHIN payload per course."""
+    __tablename__ = 'course_details_cache'
+    course_id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
 
 
 class Golfer(db.Model, UserMixin):
@@ -33,6 +48,9 @@ class Golfer(db.Model, UserMixin):
     password_hash = db.Column(db.String(128))
     ghin_id = db.Column(db.Integer, unique=True, nullable=True)
     state = db.Column(db.String(120), nullable=False)
+    # Last handicap index synced from GHIN; plus handicaps are stored negative
+    handicap_index = db.Column(db.Float)
+    handicap_fetched_at = db.Column(db.DateTime, index=True)
     statistics = db.relationship(
         'Statistic', back_populates='golfer', uselist=False, lazy='select')
     milestones = db.relationship('Milestone', backref='golfer', lazy='select')
@@ -61,6 +79,24 @@ class Golfer(db.Model, UserMixin):
     def get_id(self):
         return str(self.id)  # python 3 support
 
+    @property
+    def current_handicap_index(self):
+        """The index computed from rounds played here, else the GHIN one."""
+        record = self.handicap_record
+        if record is not None and record.handicap_index is not None:
+            return record.handicap_index
+        return self.handicap_index
+
+    @property
+    def display_handicap(self):
+        """Handicap index formatted the way GHIN shows it, e.g. '12.4' or '+1.2'."""
+        index = self.current_handicap_index
+        if index is None:
+            return None
+        if index < 0:
+            return f'+{-index:.1f}'
+        return f'{index:.1f}'
+
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -84,19 +120,54 @@ class Course(db.Model):
     phone = db.Column(db.String(20))
     email = db.Column(db.String(100))
     updated_on = db.Column(db.DateTime)
-    tees = db.relationship('Tee',
-                           lazy='dynamic', back_populates='course', cascade="all, delete-orphan")
+    # Set once the course's TeeSets have been written to tees/holes
+    tees_synced_at = db.Column(db.DateTime)
+    # Last time a GHIN course search returned this course
+    synced_at = db.Column(db.DateTime, index=True)
+    tees = db.relationship('Tee', lazy='select', order_by='Tee.id',
+                           back_populates='course', cascade="all, delete-orphan")
+
+    SEARCH_COLUMNS = ('name', 'full_name', 'facility_name', 'city', 'state')
+
+    # Trigram indexes let PostgreSQL answer ILIKE '%term%' without a scan
+    __table_args__ = tuple(
+        db.Index(f'ix_courses_{column}_trgm', column, postgresql_using='gin',
+                 postgresql_ops={column: 'gin_trgm_ops'})
+        for column in SEARCH_COLUMNS
+    )
+
+    def to_search_result(self):
+        """Render the course with the keys of a GHIN course search result."""
+        return {
+            'CourseID': self.course_id,
+            'CourseName': self.name,
+            'FacilityName': self.facility_name,
+            'FullName': self.full_name,
+            'City': self.city,
+            'State': self.state
+        }
+
+
+db.event.listen(
+    Course.__table__, 'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
 
 
 class Tee(db.Model):
     __tablename__ = 'tees'
     id = db.Column(db.Integer, primary_key=True)
+    # TeeSetRatingId from the API; rounds store this as their tee_id
+    tee_set_id = db.Column(db.Integer, unique=True, index=True)
     name = db.Column(db.String(255))
-    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'))
+    gender = db.Column(db.String(20))
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), index=True)
     yardage = db.Column(db.Integer)
+    par = db.Column(db.Integer)
+    course_rating = db.Column(db.Float)
+    slope_rating = db.Column(db.Integer)
     course = db.relationship('Course', back_populates='tees')
-    holes = db.relationship('Hole', backref='tee',
-                            lazy='dynamic', cascade="all, delete-orphan")
+    holes = db.relationship('Hole', backref='tee', lazy='select',
+                            order_by='Hole.number', cascade="all, delete-orphan")
 
 
 class Hole(db.Model):
@@ -104,7 +175,7 @@ class Hole(db.Model):
     hole_id = db.Column(db.Integer, primary_key=True)
     # This is the ID from the API
     api_hole_id = db.Column(db.Integer, unique=True)
-    tee_id = db.Column(db.Integer, db.ForeignKey('tees.id'))
+    tee_id = db.Column(db.Integer, db.ForeignKey('tees.id'), index=True)
     number = db.Column(db.Integer)
     par = db.Column(db.Integer)
     yardage = db.Column(db.Integer)  # Yardage for the hole
@@ -113,21 +184,6 @@ class Hole(db.Model):
     def __repr__(self):
         return f'<Hole {self.number}, Par {self.par}, Yardage {self.yardage}, Handicap {self.handicap}>'
 
-    @classmethod
-    def find_by_golfer_and_date_range(cls, golfer_id, start_date, end_date):
-        return cls.query.filter(
-            cls.golfer_id == golfer_id,
-            cls.date_played >= start_date,
-            cls.date_played <= end_date
-        ).all()
-
-    @classmethod
-    def find_by_golfer_and_game_type(cls, golfer_id, game_type_id):
-        return cls.query.filter_by(
-            golfer_id=golfer_id,
-            game_type_id=game_type_id
-        ).all()
-
 
 class Round(db.Model):
     __tablename__ = 'rounds'
@@ -138,91 +194,170 @@ class Round(db.Model):
     tee_id = db.Column(db.Integer)
     game_type_id = db.Column(db.Integer, db.ForeignKey('game_types.id'))
     use_handicap = db.Column(db.Boolean, default=False)
+    # Whether the round's match play points are on the leaderboard, see
+    # leaderboard.py; set and cleared together with the points
+    leaderboard_applied = db.Column(db.Boolean, default=False, nullable=False)
     scores = db.relationship('Score', backref='round', lazy='dynamic')
     golfer = db.relationship('Golfer', backref='rounds')
     # course = db.relationship('Course', backref='rounds')
     game_type = db.relationship('GameType', back_populates='rounds')
 
+    # Serves a golfer's history newest-first and its keyset pagination, plus
+    # the game type and course filters of the round search
+    __table_args__ = (
+        db.Index('ix_rounds_golfer_date', 'golfer_id', 'date_played', 'id'),
+        db.Index('ix_rounds_golfer_game_type_date',
+                 'golfer_id', 'game_type_id', 'date_played'),
+        db.Index('ix_rounds_golfer_course_date',
+                 'golfer_id', 'course_id', 'date_played'),
+        # Finds the other rounds of a match for the leaderboard
+        db.Index('ix_rounds_game_type_course_date',
+                 'game_type_id', 'course_id', 'date_played'),
+    )
+
     def __repr__(self):
         return f'<Round on {self.date_played.strftime("%Y-%m-%d")} by Golfer {self.golfer_id}>'
 
+    @classmethod
+    def find_by_golfer_and_date_range(cls, golfer_id, start_date, end_date):
+        return cls.query.filter(
+            cls.golfer_id == golfer_id,
+            cls.date_played >= start_date,
+            cls.date_played <= end_date
+        ).all()
+
+    @classmethod
+    def find_by_golfer_and_game_type(cls, golfer_id, game_type_id):
+        return cls.query.filter_by(
+            golfer_id=golfer_id,
+            game_type_id=game_type_id
+        ).all()
+
+    @classmethod
+    def search(cls, golfer_id, start_date=None, end_date=None, game_type_id=None,
+               course_id=None, tee_id=None, min_score=None, max_score=None,
+               page=1, per_page=25):
+        """Filter a golfer's rounds, newest first, one page at a time.
+
+        Dates are inclusive calendar days; the score range applies to the
+        round total. Returns (rows, total_count) from a single query, where
+        each row is (round, total_score, holes_played, game_type_name,
+        course_name, total_count).
+        """
+        total_score = db.func.coalesce(
+            RoundSummary.total_score, db.func.sum(Score.score))
+        query = db.select(cls, total_score.label('total_score'),
+                          db.func.count(Score.id).label('holes_played'),
+                          GameType.name, Course.name,
+                          db.func.count().over().label('total_count')) \
+            .outerjoin(RoundSummary, RoundSummary.round_id == cls.id) \
+            .outerjoin(Score, Score.round_id == cls.id) \
+            .outerjoin(GameType, GameType.id == cls.game_type_id) \
+            .outerjoin(Course, Course.course_id == cls.course_id) \
+            .where(cls.golfer_id == golfer_id)
+
+        if start_date is not None:
+            query = query.where(cls.date_played >= start_date)
+        if end_date is not None:
+            query = query.where(cls.date_played < end_date + timedelta(days=1))
+        if game_type_id is not None:
+            query = query.where(cls.game_type_id == game_type_id)
+        if course_id is not None:
+            query = query.where(cls.course_id == course_id)
+        if tee_id is not None:
+            query = query.where(cls.tee_id == tee_id)
+
+        query = query.group_by(cls.id, RoundSummary.total_score, GameType.name, Course.name)
+        if min_score is not None:
+            query = query.having(total_score >= min_score)
+        if max_score is not None:
+            query = query.having(total_score <= max_score)
+
+        rows = db.session.execute(
+            query.order_by(cls.date_played.desc(), cls.id.desc())
+            .limit(per_page).offset((max(page, 1) - 1) * per_page)
+        ).all()
+        return rows, rows[0].total_count if rows else 0
+
+    @classmethod
+    def page_for_golfer(cls, golfer_id, before=None, per_page=25):
+        """One page of a golfer's rounds, newest first, with their totals.
+
+        `before` is the (date_played, id) of the last round on the previous
+        page. Returns (rows, next_before) where each row is
+        (round, total_score, holes_played, game_type_name, course_name).
+        Totals come from the round summary when present, otherwise from the
+        scores in the same grouped query.
+        """
+        page = db.select(cls.id).where(cls.golfer_id == golfer_id)
+        if before is not None:
+            page = page.where(db.tuple_(cls.date_played, cls.id) < before)
+        page = page.order_by(cls.date_played.desc(), cls.id.desc()) \
+            .limit(per_page + 1).subquery()
+
+        rows = db.session.execute(
+            db.select(cls,
+                      db.func.coalesce(RoundSummary.total_score,
+                                       db.func.sum(Score.score)).label('total_score'),
+                      db.func.count(Score.id).label('holes_played'),
+                      GameType.name, Course.name)
+            .join(page, page.c.id == cls.id)
+            .outerjoin(RoundSummary, RoundSummary.round_id == cls.id)
+            .outerjoin(Score, Score.round_id == cls.id)
+            .outerjoin(GameType, GameType.id == cls.game_type_id)
+            .outerjoin(Course, Course.course_id == cls.course_id)
+            .group_by(cls.id, RoundSummary.total_score, GameType.name, Course.name)
+            .order_by(cls.date_played.desc(), cls.id.desc())
+        ).all()
+
+        next_before = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            last = rows[-1][0]
+            next_before = (last.date_played, last.id)
+        return rows, next_before
+
+    def _summary(self):
+        """The stored summary, or one computed from the scores if not yet saved."""
+        return self.summary or RoundSummary.from_scores(self.id, self.scores.all())
+
     def total_score(self):
-        return sum(score.score for score in self.scores.all())
+        return self._summary().total_score
 
     def fairway_hits_percentage(self):
-        fairway_hits = sum(1 for score in self.scores if score.fairway_hit)
-        return (fairway_hits / len(self.scores)) * 100 if self.scores else 0
+        summary = self._summary()
+        return (summary.fairways_hit / summary.holes_played) * 100 if summary.holes_played else 0
 
     def average_score_per_hole(self):
         """Calculate the average score per hole for the round."""
-        total_scores = self.total_score()
-        num_holes = self.scores.count()
-        return total_scores / num_holes if num_holes else None
+        summary = self._summary()
+        return summary.total_score / summary.holes_played if summary.holes_played else None
 
     def best_score(self):
         """Find the best (lowest) score of the round."""
-        return min((score.score for score in self.scores.all()), default=None)
+        return self._summary().best_hole_score
 
     def worst_score(self):
         """Find the worst (highest) score of the round."""
-        return max((score.score for score in self.scores.all()), default=None)
+        return self._summary().worst_hole_score
 
     def calculate_round_statistics(self):
-        scores = self.scores.all()  # Ensure you fetch scores only once per function call
-        total_score = sum(score.score for score in scores)
-        first_nine_score = sum(
-            score.score for score in scores if score.hole_number <= 9)
-        last_nine_score = sum(
-            score.score for score in scores if score.hole_number > 9)
-        total_putts = sum(score.putts for score in scores)
-        total_penalties = sum(score.penalties for score in scores)
-        total_bunker_shots = sum(score.bunker_shots for score in scores)
-        num_scores = len(scores)
-
-        fairways_hit = sum(1 for score in scores if score.fairway_hit)
-        greens_in_regulation = sum(
-            1 for score in scores if score.green_in_regulation)
-
-        statistics = {
-            'total_score': total_score,
-            'first_nine_score': first_nine_score,
-            'last_nine_score': last_nine_score,
-            'total_putts': total_putts,
-            'fairways_hit_ratio': f"{fairways_hit}/{num_scores}",
-            'greens_in_regulation_ratio': f"{greens_in_regulation}/{num_scores}",
-            'total_penalties': total_penalties,
-            'total_bunker_shots': total_bunker_shots,
-        }
-
-        return statistics
+        return self._summary().to_statistics()
 
     def create_score_chart(self):
-        scores = self.scores.order_by('hole_number').all()
-
-        # Calculate average scores by par type, making sure to handle division by zero
-        par3_scores = [s.score for s in scores if s.hole_par == 3]
-        par4_scores = [s.score for s in scores if s.hole_par == 4]
-        par5_scores = [s.score for s in scores if s.hole_par == 5]
-
-        par3_avg = sum(par3_scores) / len(par3_scores) if par3_scores else 0
-        par4_avg = sum(par4_scores) / len(par4_scores) if par4_scores else 0
-        par5_avg = sum(par5_scores) / len(par5_scores) if par5_scores else 0
-
-        # Create bar chart for average scores by par
-        fig = px.bar(
-            x=['Par 3', 'Par 4', 'Par 5'],
-            y=[par3_avg, par4_avg, par5_avg],
-            labels={'x': 'Hole Par', 'y': 'Average Score'},
-            title="Average Scores by Hole Par"
-        )
-        fig.update_layout(
-            xaxis_title="Hole Par",
-            yaxis_title="Average Score",
-            title="Average Score by Hole Par"
-        )
-
-        graph_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
-        return graph_json
+        """Average score by hole par as a minimal Plotly figure spec.
+
+        Rounds don't change once submitted, so the spec is built with the
+        summary and cached on it; older summaries get it filled in here.
+        """
+        summary = self.summary
+        if summary is None:
+            return RoundSummary.from_scores(self.id, self.scores.all()).chart
+        if summary.chart is None:
+            summary.chart = RoundSummary.from_scores(
+                self.id, self.scores.all()).chart
+            db.session.commit()
+        return summary.chart
 
 
 class Score(db.Model):
@@ -235,12 +370,20 @@ class Score(db.Model):
     hole_handicap = db.Column(db.Integer)
     yardage = db.Column(db.Integer)
     score = db.Column(db.Integer)
+    # Strokes less the handicap strokes received on the hole, set when the
+    # scorecard is submitted; equals `score` without a course handicap
+    net_score = db.Column(db.Integer)
     fairway_hit = db.Column(db.Boolean, default=False)
     green_in_regulation = db.Column(db.Boolean, default=False)
     putts = db.Column(db.Integer)
     bunker_shots = db.Column(db.Integer)
     penalties = db.Column(db.Integer)
 
+    # A resubmitted scorecard upserts its holes; also serves lookups by round
+    __table_args__ = (
+        db.UniqueConstraint('round_id', 'hole_number', name='uq_scores_round_hole'),
+    )
+
     def is_fairway_hit(self):
         return self.fairway_hit
 
@@ -248,73 +391,422 @@ class Score(db.Model):
         return self.green_in_regulation
 
 
+def par_average_chart(averages):
+    """Bar chart of average score by hole par, as a plain Plotly figure dict."""
+    return {
+        'data': [{
+            'type': 'bar',
+            'x': [f'Par {par}' for par in sorted(averages)],
+            'y': [round(averages[par], 2) for par in sorted(averages)]
+        }],
+        'layout': {
+            'title': {'text': 'Average Score by Hole Par'},
+            'xaxis': {'title': {'text': 'Hole Par'}},
+            'yaxis': {'title': {'text': 'Average Score'}}
+        }
+    }
+
+
+class RoundSummary(db.Model):
+    """Per-round totals computed once when the scorecard is submitted."""
+    __tablename__ = 'round_summaries'
+    id = db.Column(db.Integer, primary_key=True)
+    round_id = db.Column(db.Integer, db.ForeignKey(
+        'rounds.id'), unique=True, nullable=False)
+    holes_played = db.Column(db.Integer, default=0)
+    total_score = db.Column(db.Integer, default=0)
+    net_total = db.Column(db.Integer, default=0)
+    total_par = db.Column(db.Integer, default=0)
+    first_nine_score = db.Column(db.Integer, default=0)
+    last_nine_score = db.Column(db.Integer, default=0)
+    total_putts = db.Column(db.Integer, default=0)
+    total_penalties = db.Column(db.Integer, default=0)
+    total_bunker_shots = db.Column(db.Integer, default=0)
+    fairways_hit = db.Column(db.Integer, default=0)
+    greens_in_regulation = db.Column(db.Integer, default=0)
+    eagles = db.Column(db.Integer, default=0)  # Eagle or better
+    birdies = db.Column(db.Integer, default=0)
+    pars = db.Column(db.Integer, default=0)
+    bogeys = db.Column(db.Integer, default=0)
+    double_bogeys = db.Column(db.Integer, default=0)  # Double bogey or worse
+    best_hole_score = db.Column(db.Integer)
+    worst_hole_score = db.Column(db.Integer)
+    # World Handicap System rating of the round, see handicap.py; only
+    # 18-hole rounds on a rated tee get a differential
+    course_handicap = db.Column(db.Integer)
+    adjusted_gross_score = db.Column(db.Integer)
+    score_differential = db.Column(db.Float)
+    # Cached Plotly figure spec for the round details page
+    chart = db.Column(db.JSON)
+    round = db.relationship('Round', backref=db.backref(
+        'summary', uselist=False, lazy='select'))
+
+    @classmethod
+    def from_scores(cls, round_id, scores):
+        """Build a summary from a round's Score rows in a single pass."""
+        summary = cls(round_id=round_id, holes_played=0, total_score=0, net_total=0,
+                      total_par=0, first_nine_score=0, last_nine_score=0, total_putts=0,
+                      total_penalties=0, total_bunker_shots=0, fairways_hit=0,
+                      greens_in_regulation=0, eagles=0, birdies=0, pars=0,
+                      bogeys=0, double_bogeys=0)
+        par_totals = {3: [0, 0], 4: [0, 0], 5: [0, 0]}
+        for score in scores:
+            strokes = score.score or 0
+            summary.holes_played += 1
+            summary.total_score += strokes
+            summary.net_total += strokes if score.net_score is None else score.net_score
+            if score.hole_number <= 9:
+                summary.first_nine_score += strokes
+            else:
+                summary.last_nine_score += strokes
+            summary.total_putts += score.putts or 0
+            summary.total_penalties += score.penalties or 0
+            summary.total_bunker_shots += score.bunker_shots or 0
+            summary.fairways_hit += 1 if score.fairway_hit else 0
+            summary.greens_in_regulation += 1 if score.green_in_regulation else 0
+            if summary.best_hole_score is None or strokes < summary.best_hole_score:
+                summary.best_hole_score = strokes
+            if summary.worst_hole_score is None or strokes > summary.worst_hole_score:
+                summary.worst_hole_score = strokes
+
+            if score.hole_par is None:
+                continue
+            summary.total_par += score.hole_par
+            if score.hole_par in par_totals:
+                par_totals[score.hole_par][0] += strokes
+                par_totals[score.hole_par][1] += 1
+            to_par = strokes - score.hole_par
+            if to_par <= -2:
+                summary.eagles += 1
+            elif to_par == -1:
+                summary.birdies += 1
+            elif to_par == 0:
+                summary.pars += 1
+            elif to_par == 1:
+                summary.bogeys += 1
+            else:
+                summary.double_bogeys += 1
+
+        summary.chart = par_average_chart(
+            {par: total / count if count else 0 for par, (total, count) in par_totals.items()})
+        return summary
+
+    @classmethod
+    def backfill(cls, batch_size=500):
+        """Create summaries for rounds that have scores but no summary yet."""
+        created = 0
+        while True:
+            round_ids = [round_id for round_id, in db.session.execute(
+                db.select(Round.id)
+                .outerjoin(cls, cls.round_id == Round.id)
+                .where(cls.id.is_(None),
+                       db.select(Score.id).where(Score.round_id == Round.id).exists())
+                .order_by(Round.id)
+                .limit(batch_size)
+            )]
+            if not round_ids:
+                return created
+
+            scores_by_round = {}
+            for score in Score.query.filter(Score.round_id.in_(round_ids)):
+                scores_by_round.setdefault(score.round_id, []).append(score)
+            db.session.add_all(cls.from_scores(round_id, scores_by_round[round_id])
+                               for round_id in round_ids)
+            db.session.commit()
+            created += len(round_ids)
+
+    def to_statistics(self):
+        return {
+            'total_score': self.total_score,
+            'net_total': self.net_total,
+            'course_handicap': self.course_handicap,
+            'first_nine_score': self.first_nine_score,
+            'last_nine_score': self.last_nine_score,
+            'total_putts': self.total_putts,
+            'fairways_hit_ratio': f"{self.fairways_hit}/{self.holes_played}",
+            'greens_in_regulation_ratio': f"{self.greens_in_regulation}/{self.holes_played}",
+            'total_penalties': self.total_penalties,
+            'total_bunker_shots': self.total_bunker_shots,
+            'eagles': self.eagles,
+            'birdies': self.birdies,
+            'pars': self.pars,
+            'bogeys': self.bogeys,
+            'double_bogeys': self.double_bogeys,
+        }
+
+
+class HandicapRecord(db.Model):
+    """A golfer's locally computed handicap index and the differentials of
+    their 20 most recent rated rounds, newest first."""
+    __tablename__ = 'handicap_records'
+    golfer_id = db.Column(db.Integer, db.ForeignKey('golfers.id'), primary_key=True)
+    handicap_index = db.Column(db.Float)
+    # [[date_played ISO string, round_id, differential], ...]
+    differentials = db.Column(db.JSON, nullable=False, default=list)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    golfer = db.relationship('Golfer', backref=db.backref(
+        'handicap_record', uselist=False, lazy='select'))
+
+
 class Milestone(db.Model):
     __tablename__ = 'milestones'
     id = db.Column(db.Integer, primary_key=True)
-    golfer_id = db.Column(db.Integer, db.ForeignKey('golfers.id'))
+    golfer_id = db.Column(db.Integer, db.ForeignKey('golfers.id'), index=True)
     type = db.Column(db.String(50))
     date = db.Column(db.Date)
     details = db.Column(db.String(255))
-
-    @staticmethod
-    def create(golfer_id, type, details):
-        date = datetime.utcnow()
-        new_milestone = Milestone(
-            golfer_id=golfer_id, type=type, details=details, date=date)
-        db.session.add(new_milestone)
-        db.session.commit()
+    # Set for milestones detected from a round; hole_number for hole milestones
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'), index=True)
+    hole_number = db.Column(db.Integer)
 
 
 class Statistic(db.Model):
     __tablename__ = 'statistics'
     id = db.Column(db.Integer, primary_key=True)
-    golfer_id = db.Column(db.Integer, db.ForeignKey('golfers.id'))
+    # One row per golfer, the conflict target of record_round's upsert
+    golfer_id = db.Column(db.Integer, db.ForeignKey('golfers.id'), unique=True)
     average_score = db.Column(db.Float)
     fairway_hit_percentage = db.Column(db.Float)
     green_in_regulation_percentage = db.Column(db.Float)
     putts_per_round = db.Column(db.Float)
     total_rounds_played = db.Column(db.Integer, default=0)
+    # Weight of the per-hole percentages when a round is folded in
+    holes_played = db.Column(db.Integer, default=0)
     total_wins = db.Column(db.Integer, default=0)
     total_losses = db.Column(db.Integer, default=0)
     golfer = db.relationship('Golfer', back_populates='statistics')
+    eagles = db.Column(db.Integer, default=0)  # Eagle or better
     birdies = db.Column(db.Integer, default=0)
     pars = db.Column(db.Integer, default=0)
     bogeys = db.Column(db.Integer, default=0)
-    double_bogeys = db.Column(db.Integer, default=0)
-
-    def update(self, score):
-        hole = Hole.query.get(score.hole_id)
-        self.total_rounds_played += 1
-        if score.strokes == hole.par - 1:
-            self.birdies += 1
-        elif score.strokes == hole.par:
-            self.pars += 1
-        elif score.strokes == hole.par + 1:
-            self.bogeys += 1
-        elif score.strokes == hole.par + 2:
-            self.double_bogeys += 1
-        db.session.commit()
-
-
-def check_and_create_milestones(score):
-    hole = Hole.query.get(score.hole_id)
-    golfer_id = score.round.golfer_id
-    # Milestone checks...
-    if score.strokes == 1:
-        Milestone.create(golfer_id, "Hole-in-One",
-                         f"Achieved hole-in-one on hole {hole.number}")
-
-    if (hole.par == 4 and score.strokes == 2) or (hole.par == 5 and score.strokes == 3):
-        Milestone.create(golfer_id, "Eagle",
-                         f"Achieved eagle on hole {hole.number}")
-
-    if hole.par == 5 and score.strokes == 2:
-        Milestone.create(golfer_id, "Albatross",
-                         f"Achieved albatross on hole {hole.number}")
-
-    if hole.par == 4 and score.strokes == 4 and score.bunker_shots >= 2:
-        Milestone.create(golfer_id, "Double-Sandy",
-                         f"Achieved double-sandy on hole {hole.number}")
+    double_bogeys = db.Column(db.Integer, default=0)  # Double bogey or worse
+    # Set whenever rounds are folded in or taken out; analytics.py uses it to
+    # tell whether a golfer's cached analytics are still current
+    updated_at = db.Column(db.DateTime)
+
+    SCORE_TYPES = ('eagles', 'birdies', 'pars', 'bogeys', 'double_bogeys')
+
+    @classmethod
+    def record_round(cls, golfer_id, summary, sign=1):
+        """Fold a round's summary into the golfer's statistics.
+
+        The summary already classifies every hole against its par, so this is
+        one upsert whose SET reads the stored values; concurrent rounds of the
+        same golfer are all counted. sign=-1 takes a recorded round back out.
+        """
+        holes = summary.holes_played or 0
+        stmt = dialect_insert(cls).values(
+            golfer_id=golfer_id,
+            total_rounds_played=sign,
+            holes_played=sign * holes,
+            average_score=float(summary.total_score or 0),
+            putts_per_round=float(summary.total_putts or 0),
+            fairway_hit_percentage=summary.fairways_hit * 100.0 / holes if holes else 0.0,
+            green_in_regulation_percentage=summary.greens_in_regulation * 100.0 / holes if holes else 0.0,
+            updated_at=datetime.utcnow(),
+            **{name: sign * (getattr(summary, name) or 0) for name in cls.SCORE_TYPES})
+        new = stmt.excluded
+        rounds = db.func.coalesce(cls.total_rounds_played, 0)
+        played = db.func.coalesce(cls.holes_played, 0)
+
+        def per_round(column):
+            return ((db.func.coalesce(column, 0) * rounds
+                     + new.total_rounds_played * getattr(new, column.key))
+                    / db.func.nullif(rounds + new.total_rounds_played, 0))
+
+        def per_hole(column):
+            return db.func.coalesce(
+                (db.func.coalesce(column, 0) * played + getattr(new, column.key) * new.holes_played)
+                / db.func.nullif(played + new.holes_played, 0), 0)
+
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['golfer_id'],
+            set_={'total_rounds_played': rounds + new.total_rounds_played,
+                  'holes_played': played + new.holes_played,
+                  'average_score': per_round(cls.average_score),
+                  'putts_per_round': per_round(cls.putts_per_round),
+                  'fairway_hit_percentage': per_hole(cls.fairway_hit_percentage),
+                  'green_in_regulation_percentage': per_hole(cls.green_in_regulation_percentage),
+                  'updated_at': new.updated_at,
+                  **{name: db.func.coalesce(getattr(cls, name), 0) + getattr(new, name)
+                     for name in cls.SCORE_TYPES}}))
+
+    @classmethod
+    def recompute(cls):
+        """Rebuild every golfer's statistics from the scores table.
+
+        One grouped query aggregates all rounds, then one upsert writes the
+        results; golfers without scores are reset. Wins and losses are kept.
+        Returns the number of golfers with scores.
+        """
+        strokes = db.func.coalesce(Score.score, 0)
+        to_par = strokes - Score.hole_par
+        par_known = Score.hole_par.isnot(None)
+
+        def count(condition):
+            return db.func.sum(db.case((condition, 1), else_=0))
+
+        rows = db.session.execute(
+            db.select(Round.golfer_id,
+                      db.func.count(db.distinct(Round.id)),
+                      db.func.count(Score.id),
+                      db.func.sum(strokes),
+                      db.func.sum(db.func.coalesce(Score.putts, 0)),
+                      count(Score.fairway_hit.is_(True)),
+                      count(Score.green_in_regulation.is_(True)),
+                      count(par_known & (to_par <= -2)),
+                      count(par_known & (to_par == -1)),
+                      count(par_known & (to_par == 0)),
+                      count(par_known & (to_par == 1)),
+                      count(par_known & (to_par >= 2)))
+            .join(Score, Score.round_id == Round.id)
+            .where(Round.golfer_id.isnot(None))
+            .group_by(Round.golfer_id)).all()
+
+        now = datetime.utcnow()
+        db.session.execute(db.update(cls).values(
+            total_rounds_played=0, holes_played=0, average_score=None,
+            putts_per_round=None, fairway_hit_percentage=None,
+            green_in_regulation_percentage=None, updated_at=now,
+            **{name: 0 for name in cls.SCORE_TYPES}))
+        if not rows:
+            return 0
+
+        stmt = dialect_insert(cls).values([
+            {'golfer_id': golfer_id, 'total_rounds_played': rounds, 'holes_played': holes,
+             'average_score': total / rounds, 'putts_per_round': putts / rounds,
+             'fairway_hit_percentage': fairways * 100.0 / holes,
+             'green_in_regulation_percentage': greens * 100.0 / holes, 'updated_at': now,
+             **dict(zip(cls.SCORE_TYPES, score_types))}
+            for golfer_id, rounds, holes, total, putts, fairways, greens, *score_types in rows])
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['golfer_id'],
+            set_={column: getattr(stmt.excluded, column) for column in (
+                'total_rounds_played', 'holes_played', 'average_score', 'putts_per_round',
+                'fairway_hit_percentage', 'green_in_regulation_percentage', 'updated_at',
+                *cls.SCORE_TYPES)}))
+        return len(rows)
+
+
+class HoleAggregate(db.Model):
+    """Running totals of how one hole of a tee has been played.
+
+    Rows are keyed like rounds are, by GHIN course id and tee set id, and
+    kept current by record_round as scorecards are processed, so a course's
+    difficulty is read from one row per hole instead of every Score.
+    """
+    __tablename__ = 'hole_aggregates'
+    id = db.Column(db.Integer, primary_key=True)
+    course_id = db.Column(db.Integer, nullable=False)
+    tee_id = db.Column(db.Integer, nullable=False)
+    hole_number = db.Column(db.Integer, nullable=False)
+    hole_par = db.Column(db.Integer)
+    times_played = db.Column(db.Integer, default=0)
+    total_to_par = db.Column(db.Integer, default=0)
+    greens_in_regulation = db.Column(db.Integer, default=0)
+    # Holes with putts recorded, and how many took 0, 1, 2 or 3+ putts
+    putted = db.Column(db.Integer, default=0)
+    total_putts = db.Column(db.Integer, default=0)
+    zero_putts = db.Column(db.Integer, default=0)
+    one_putts = db.Column(db.Integer, default=0)
+    two_putts = db.Column(db.Integer, default=0)
+    three_putts = db.Column(db.Integer, default=0)  # Three or more
+
+    # The conflict target of record_round's upsert, and the difficulty
+    # page's lookup by course
+    __table_args__ = (
+        db.UniqueConstraint('course_id', 'tee_id', 'hole_number',
+                            name='uq_hole_aggregates_course_tee_hole'),
+    )
+
+    COUNTS = ('times_played', 'total_to_par', 'greens_in_regulation', 'putted', 'total_putts',
+              'zero_putts', 'one_putts', 'two_putts', 'three_putts')
+
+    @property
+    def average_to_par(self):
+        return self.total_to_par / self.times_played if self.times_played else None
+
+    @property
+    def green_in_regulation_percentage(self):
+        return self.greens_in_regulation * 100.0 / self.times_played if self.times_played else None
+
+    @property
+    def putts_per_hole(self):
+        return self.total_putts / self.putted if self.putted else None
+
+    @staticmethod
+    def _counts(score):
+        putts = score.putts
+        return {
+            'times_played': 1,
+            'total_to_par': score.score - score.hole_par,
+            'greens_in_regulation': 1 if score.green_in_regulation else 0,
+            'putted': 0 if putts is None else 1,
+            'total_putts': putts or 0,
+            'zero_putts': 1 if putts == 0 else 0,
+            'one_putts': 1 if putts == 1 else 0,
+            'two_putts': 1 if putts == 2 else 0,
+            'three_putts': 1 if putts is not None and putts >= 3 else 0,
+        }
+
+    @classmethod
+    def record_round(cls, round, scores, sign=1):
+        """Add a round's holes to the aggregates of its tee in one upsert.
+
+        Counts are added to the stored values in SQL, so concurrent rounds
+        on the same tee are all counted. sign=-1 takes a round back out.
+        Holes without a score or par are skipped.
+        """
+        rows = [dict({name: sign * value for name, value in cls._counts(score).items()},
+                     course_id=round.course_id, tee_id=round.tee_id,
+                     hole_number=score.hole_number, hole_par=score.hole_par)
+                for score in sorted(scores, key=lambda score: score.hole_number)
+                if score.score is not None and score.hole_par is not None]
+        if not rows or round.course_id is None or round.tee_id is None:
+            return
+        stmt = dialect_insert(cls).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['course_id', 'tee_id', 'hole_number'],
+            set_={'hole_par': stmt.excluded.hole_par,
+                  **{name: db.func.coalesce(getattr(cls, name), 0) + getattr(stmt.excluded, name)
+                     for name in cls.COUNTS}}))
+
+    @classmethod
+    def recompute(cls):
+        """Rebuild every aggregate from the scores table.
+
+        One grouped query over all scores and one insert replace the table.
+        Returns the number of holes aggregated.
+        """
+        to_par = Score.score - Score.hole_par
+
+        def count(condition):
+            return db.func.sum(db.case((condition, 1), else_=0))
+
+        rows = db.session.execute(
+            db.select(Round.course_id, Round.tee_id, Score.hole_number,
+                      db.func.max(Score.hole_par),
+                      db.func.count(),
+                      db.func.sum(to_par),
+                      count(Score.green_in_regulation.is_(True)),
+                      count(Score.putts.isnot(None)),
+                      db.func.sum(db.func.coalesce(Score.putts, 0)),
+                      count(Score.putts == 0),
+                      count(Score.putts == 1),
+                      count(Score.putts == 2),
+                      count(Score.putts >= 3))
+            .join(Score, Score.round_id == Round.id)
+            .where(Round.course_id.isnot(None), Round.tee_id.isnot(None),
+                   Score.score.isnot(None), Score.hole_par.isnot(None))
+            .group_by(Round.course_id, Round.tee_id, Score.hole_number)).all()
+
+        db.session.execute(db.delete(cls))
+        if rows:
+            db.session.execute(db.insert(cls), [
+                dict(zip(cls.COUNTS, counts), course_id=course_id, tee_id=tee_id,
+                     hole_number=hole_number, hole_par=hole_par)
+                for course_id, tee_id, hole_number, hole_par, *counts in rows])
+        return len(rows)
 
 
 class GameType(db.Model):
@@ -330,107 +822,6 @@ class GameType(db.Model):
     def __repr__(self):
         return f'<GameType {self.name}>'
 
-    def update_leaderboard(self, round_id):
-        round = Round.query.get(round_id)
-        scores = Score.query.filter_by(round_id=round_id).all()
-        # Implement logic to update the leaderboard based on this game type's rules
-        if self.name == "Match Play":
-            self.process_match_play(scores)
-        elif self.name == "Stroke Play":
-            self.process_stroke_play(scores)
-        elif self.name == "Tournament Play":
-            self.process_tournament_play(round.golfer_id)
-        elif self.name == "Solo Play":
-            self.process_solo_play(round)
-        # Add other game types as needed
-
-    def process_match_play(self, scores):
-        # Logic to process scores in match play
-        # Update points and determine match outcomes
-        # Assuming scores are organized by hole and golfer
-        golfer_scores = {score.golfer_id: 0 for score in scores}
-        for hole_number in range(1, 19):  # Typical 18 holes
-            hole_scores = {
-                score.golfer_id: score.strokes for score in scores if score.hole_number == hole_number}
-            min_strokes = min(hole_scores.values())
-            for golfer_id, strokes in hole_scores.items():
-                if strokes == min_strokes and list(hole_scores.values()).count(min_strokes) == 1:
-                    golfer_scores[golfer_id] += 1
-
-        # Update leaderboard
-        for golfer_id, points in golfer_scores.items():
-            leaderboard_entry = Leaderboard.query.filter_by(
-                golfer_id=golfer_id, game_type_id=self.id).first()
-            if not leaderboard_entry:
-                leaderboard_entry = Leaderboard(
-                    golfer_id=golfer_id, game_type_id=self.id, score=points)
-                db.session.add(leaderboard_entry)
-            else:
-                leaderboard_entry.score += points
-            db.session.commit()
-
-    def process_stroke_play(self, scores):
-        # Aggregate scores by golfer
-        golfer_scores = {}
-        for score in scores:
-            if score.golfer_id not in golfer_scores:
-                golfer_scores[score.golfer_id] = 0
-            golfer_scores[score.golfer_id] += score.strokes
-
-        # Update leaderboard
-        for golfer_id, total_score in golfer_scores.items():
-            leaderboard_entry = Leaderboard.query.filter_by(
-                golfer_id=golfer_id, game_type_id=self.id).first()
-            if not leaderboard_entry:
-                leaderboard_entry = Leaderboard(
-                    golfer_id=golfer_id, game_type_id=self.id, score=total_score)
-                db.session.add(leaderboard_entry)
-            else:
-                leaderboard_entry.score = total_score
-            db.session.commit()
-
-    def process_tournament_play(self, golfer_id):
-        # Assume the tournament lasts 4 rounds, calculate cumulative score
-        rounds = Round.query.filter_by(
-            golfer_id=golfer_id, game_type_id=self.id).limit(4).all()
-        # total_score() needs to be defined in Round model
-        total_score = sum(round.total_score() for round in rounds)
-        leaderboard_entry = Leaderboard.query.filter_by(
-            golfer_id=golfer_id, game_type_id=self.id).first()
-        if not leaderboard_entry:
-            leaderboard_entry = Leaderboard(
-                golfer_id=golfer_id, game_type_id=self.id, score=total_score)
-            db.session.add(leaderboard_entry)
-        else:
-            leaderboard_entry.score = total_score  # Update the total score
-        db.session.commit()
-
-    def process_solo_play(self, round):
-        # Calculate the total score for the round and possibly update golfer statistics directly.
-        total_score = round.total_score()
-
-        # Check if statistics exist for the golfer and update them.
-        statistics = Statistic.query.filter_by(
-            golfer_id=round.golfer_id).first()
-        if not statistics:
-            statistics = Statistic(
-                golfer_id=round.golfer_id,
-                average_score=total_score,  # Initialize with the score of this round
-                total_rounds_played=1,  # This is their first recorded round
-                average_strokes_per_round=total_score  # Same as average score initially
-            )
-            db.session.add(statistics)
-        else:
-            # Update the existing statistics.
-            rounds_played = statistics.total_rounds_played + 1
-            statistics.average_score = (
-                (statistics.average_score * statistics.total_rounds_played) + total_score) / rounds_played
-            statistics.average_strokes_per_round = (
-                (statistics.average_strokes_per_round * statistics.total_rounds_played) + total_score) / rounds_played
-            statistics.total_rounds_played = rounds_played
-
-        db.session.commit()
-
 
 # class ScoreDetail(db.Model):
 #     __tablename__ = 'score_details'
@@ -456,10 +847,48 @@ class Leaderboard(db.Model):
     golfer = db.relationship('Golfer', backref='leaderboard_entries')
     game_type = db.relationship('GameType', backref='leaderboard_entries')
 
+    # One entry per golfer and game type, the conflict target of the upserts
+    # in leaderboard.py; ranking reads a game type's entries by score
+    __table_args__ = (
+        db.UniqueConstraint('golfer_id', 'game_type_id',
+                            name='uq_leaderboards_golfer_game_type'),
+        db.Index('ix_leaderboards_game_type_score', 'game_type_id', 'score'),
+    )
+
     def __repr__(self):
         return f'<Leaderboard #{self.id}: Golfer {self.golfer_id} - GameType {self.game_type_id} - Score {self.score}>'
 
 
+class PostRoundJob(db.Model):
+    """A unit of post-round work queued when a scorecard is committed."""
+    __tablename__ = 'post_round_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    # Enqueueing a round twice is a no-op; workers poll pending jobs by due time
+    __table_args__ = (
+        db.UniqueConstraint('round_id', 'kind', name='uq_post_round_jobs_round_kind'),
+        db.Index('ix_post_round_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
 def connect_db(app):
     """Connect to database with the Flask app."""
     app.app_context().push()
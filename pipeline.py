@@ -0,0 +1,223 @@
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+
+from flask import current_app
+
+from models import HoleAggregate, PostRoundJob, Round, Statistic, db, dialect_insert
+from leaderboard import rank_leaderboard, retract_round, update_leaderboard
+from milestones import record_milestones, retract_milestones
+from handicap import retract_handicap, update_handicap
+
+
+def _statistics_job(round):
+    Statistic.record_round(round.golfer_id, round.summary)
+
+
+def _milestones_job(round):
+    record_milestones(round, round.scores.all(), round.summary)
+
+
+def _holes_job(round):
+    HoleAggregate.record_round(round, round.scores.all())
+
+
+def _leaderboard_job(round):
+    update_leaderboard(round)
+    game_type = round.game_type
+    if game_type is None:
+        return None
+    # Positions span the whole leaderboard, so they get their own transaction
+    return lambda: rank_leaderboard(game_type)
+
+
+JOB_HANDLERS = {
+    'statistics': _statistics_job,
+    'milestones': _milestones_job,
+    'leaderboard': _leaderboard_job,
+    'handicap': update_handicap,
+    'holes': _holes_job,
+}
+
+# Undo a finished job's effects when the round's scores are replaced
+JOB_RETRACTORS = {
+    'statistics': lambda round: Statistic.record_round(round.golfer_id, round.summary, sign=-1),
+    'milestones': retract_milestones,
+    'leaderboard': retract_round,
+    'handicap': retract_handicap,
+    'holes': lambda round: HoleAggregate.record_round(round, round.scores.all(), sign=-1),
+}
+
+
+class PostRoundPipeline:
+    """Database-backed queue of the work that follows a scorecard submission.
+
+    enqueue() adds one job per handler in the submission's own transaction,
+    so a round's jobs exist exactly when its scores do. Workers claim a job
+    with a conditional UPDATE and commit its effects together with its
+    `done` status, so a job is applied at most once even when several
+    workers poll the queue; a failed job is rolled back and retried with
+    exponential backoff until PIPELINE_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, handlers=None, retractors=None):
+        self.handlers = handlers or JOB_HANDLERS
+        self.retractors = JOB_RETRACTORS if retractors is None else retractors
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def enqueue(self, round_id):
+        stmt = dialect_insert(PostRoundJob).values([
+            {'round_id': round_id, 'kind': kind, 'status': 'pending', 'attempts': 0,
+             'created_at': datetime.utcnow(), 'run_after': datetime.utcnow()}
+            for kind in self.handlers])
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=['round_id', 'kind']))
+
+    def requeue(self, round):
+        """Queue a round's jobs again because its scores are being replaced.
+
+        Call it before the new scores are written: jobs that already ran are
+        retracted using the stored scores and summary, then every job goes
+        back to pending. The job rows are locked so a running worker finishes
+        first.
+        """
+        jobs = db.session.scalars(db.select(PostRoundJob)
+                                  .where(PostRoundJob.round_id == round.id)
+                                  .order_by(PostRoundJob.id)
+                                  .with_for_update()).all()
+        for job in jobs:
+            if job.status == 'done' and job.kind in self.retractors:
+                self.retractors[job.kind](round)
+        db.session.execute(
+            db.update(PostRoundJob)
+            .where(PostRoundJob.round_id == round.id)
+            .values(status='pending', attempts=0, last_error=None, finished_at=None,
+                    created_at=datetime.utcnow(), run_after=datetime.utcnow()))
+        self.enqueue(round.id)
+
+    def wake(self, round_id=None):
+        """Run newly queued jobs soon: on the scheduler if it is running,
+        otherwise inline in this request."""
+        scheduler = current_app.extensions.get('scheduler')
+        job = scheduler.get_job('post_round_jobs') if scheduler else None
+        if job:
+            job.modify(next_run_time=datetime.now(timezone.utc))
+        else:
+            self.run_pending(round_id=round_id)
+
+    def run_pending(self, limit=100, round_id=None):
+        """Process up to `limit` due jobs; returns how many were attempted."""
+        processed = 0
+        while processed < limit:
+            job = self._claim(round_id)
+            if job is None:
+                break
+            self._run(job)
+            processed += 1
+        return processed
+
+    def status(self, round_id):
+        jobs = PostRoundJob.query.filter_by(round_id=round_id).order_by(PostRoundJob.id).all()
+        return {
+            'round_id': round_id,
+            'complete': bool(jobs) and all(job.status == 'done' for job in jobs),
+            'jobs': [job.to_dict() for job in jobs],
+        }
+
+    def metrics(self):
+        now = datetime.utcnow()
+        depth = dict(db.session.execute(
+            db.select(PostRoundJob.status, db.func.count())
+            .where(PostRoundJob.status != 'done')
+            .group_by(PostRoundJob.status)).all())
+        oldest = db.session.scalar(db.select(db.func.min(PostRoundJob.created_at))
+                                   .where(PostRoundJob.status == 'pending'))
+        with self._lock:
+            jobs = {kind: dict(m) for kind, m in self._metrics.items()}
+        return {
+            'queue': {
+                'pending': depth.get('pending', 0),
+                'failed': depth.get('failed', 0),
+                'oldest_pending_seconds': (now - oldest).total_seconds() if oldest else 0,
+            },
+            'jobs': jobs,
+        }
+
+    def _claim(self, round_id):
+        now = datetime.utcnow()
+        query = (db.select(PostRoundJob.id)
+                 .where(PostRoundJob.status == 'pending', PostRoundJob.run_after <= now)
+                 .order_by(PostRoundJob.id)
+                 .limit(1)
+                 .with_for_update(skip_locked=True))
+        if round_id is not None:
+            query = query.where(PostRoundJob.round_id == round_id)
+        while True:
+            job_id = db.session.scalar(query)
+            if job_id is None:
+                db.session.rollback()
+                return None
+            # Taking the row for this transaction; another worker that got
+            # here first leaves nothing to update
+            claimed = db.session.execute(
+                db.update(PostRoundJob)
+                .where(PostRoundJob.id == job_id, PostRoundJob.status == 'pending')
+                .values(attempts=PostRoundJob.attempts + 1)).rowcount
+            if claimed:
+                return db.session.get(PostRoundJob, job_id)
+            db.session.rollback()
+
+    def _run(self, job):
+        job_id, kind = job.id, job.kind
+        start = time.perf_counter()
+        try:
+            follow_up = self.handlers[kind](db.session.get(Round, job.round_id))
+            job.status = 'done'
+            job.finished_at = datetime.utcnow()
+            latency = (job.finished_at - job.created_at).total_seconds()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._record(kind, start, failed=True)
+            self._retry(job_id, e)
+            return
+        self._record(kind, start, latency=latency)
+
+        if follow_up:
+            try:
+                follow_up()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning(f"Follow-up of {kind} job {job_id} failed: {e}")
+
+    def _retry(self, job_id, error):
+        job = db.session.get(PostRoundJob, job_id)
+        job.attempts += 1
+        job.last_error = str(error)[:255]
+        if job.attempts >= current_app.config.get('PIPELINE_MAX_ATTEMPTS', 5):
+            job.status = 'failed'
+            current_app.logger.error(
+                f"Post-round {job.kind} job for round {job.round_id} failed: {error}")
+        else:
+            delay = current_app.config.get('PIPELINE_RETRY_SECONDS', 30) * 2 ** (job.attempts - 1)
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+
+    def _record(self, kind, start, failed=False, latency=None):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            m = self._metrics.setdefault(kind, {
+                'runs': 0, 'failures': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                'total_latency_seconds': 0.0, 'max_latency_seconds': 0.0})
+            m['runs'] += 1
+            m['total_seconds'] += elapsed
+            m['max_seconds'] = max(m['max_seconds'], elapsed)
+            if failed:
+                m['failures'] += 1
+            else:
+                m['total_latency_seconds'] += latency
+                m['max_latency_seconds'] = max(m['max_latency_seconds'], latency)
+
+
+pipeline = PostRoundPipeline()
@@ -0,0 +1,121 @@
+from models import RoundSummary, Score, db, dialect_insert
+from handicap import current_index, net_scores, playing_handicap, rate_round
+from pipeline import pipeline
+
+
+MAX_HOLE_SCORE = 15
+
+# Per-hole fields a golfer submits, with the range each must fall in
+ENTRY_FIELDS = {
+    'score': (1, MAX_HOLE_SCORE),
+    'putts': (0, MAX_HOLE_SCORE),
+    'bunker_shots': (0, MAX_HOLE_SCORE),
+    'penalties': (0, MAX_HOLE_SCORE),
+}
+FLAG_FIELDS = ('fairway_hit', 'green_in_regulation')
+
+# Columns compared to decide whether a resubmission changed anything
+COMPARED_FIELDS = ('hole_par', 'yardage', 'hole_handicap', *ENTRY_FIELDS, *FLAG_FIELDS)
+# Written on every upsert but derived, so not compared
+STORED_FIELDS = (*COMPARED_FIELDS, 'net_score')
+
+
+class ScorecardError(ValueError):
+    """A scorecard failed validation; `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def validate_entries(round, holes, entries):
+    """Turn submitted hole entries into Score rows for the round's tee.
+
+    Each entry is a dict with a hole_number, a score and optionally putts,
+    bunker_shots, penalties, fairway_hit and green_in_regulation.
+    """
+    holes = {hole.number: hole for hole in holes}
+    errors, rows = [], {}
+    if not entries:
+        errors.append('No holes were submitted.')
+    for entry in entries:
+        if not isinstance(entry, dict):
+            errors.append('Each hole must be an object.')
+            continue
+        number = entry.get('hole_number')
+        hole = None
+        if isinstance(number, int) and not isinstance(number, bool):
+            hole = holes.get(number)
+        if hole is None:
+            errors.append(f'Hole {number!r} is not on this tee.')
+            continue
+        if number in rows:
+            errors.append(f'Hole {number} was submitted twice.')
+            continue
+
+        row = {'round_id': round.id, 'hole_number': number, 'hole_par': hole.par,
+               'yardage': hole.yardage, 'hole_handicap': hole.handicap}
+        for field, (minimum, maximum) in ENTRY_FIELDS.items():
+            value = entry.get(field)
+            if value is None and field != 'score':
+                row[field] = None
+            elif isinstance(value, bool) or not isinstance(value, int) \
+                    or not minimum <= value <= maximum:
+                errors.append(f'Hole {number}: {field} must be a whole number '
+                              f'from {minimum} to {maximum}.')
+            else:
+                row[field] = value
+        for field in FLAG_FIELDS:
+            row[field] = bool(entry.get(field))
+        rows[number] = row
+
+    if errors:
+        raise ScorecardError(errors)
+    return [rows[number] for number in sorted(rows)]
+
+
+def submit_scorecard(round, tee, entries):
+    """Validate and store a round's scorecard against its tee; the caller
+    commits.
+
+    All holes are written with one INSERT .. ON CONFLICT on (round_id,
+    hole_number), so submitting the same card twice changes nothing and a
+    corrected card replaces the stored holes. Returns 'created', 'updated'
+    or 'unchanged'.
+    """
+    rows = validate_entries(round, tee.holes, entries)
+    existing = {score.hole_number: score for score in round.scores}
+    if existing:
+        if existing.keys() == {row['hole_number'] for row in rows} and all(
+                getattr(existing[row['hole_number']], field) == row[field]
+                for row in rows for field in COMPARED_FIELDS):
+            return 'unchanged'
+        # Undo what the old card fed into statistics, milestones and
+        # leaderboards while its scores are still stored
+        pipeline.requeue(round)
+
+    # Handicap strokes are allocated once here; leaderboards read net_score
+    course_handicap = playing_handicap(tee, current_index(round.golfer_id))
+    net_scores(rows, course_handicap)
+    stmt = dialect_insert(Score).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['round_id', 'hole_number'],
+        set_={field: getattr(stmt.excluded, field) for field in STORED_FIELDS}))
+    if existing:
+        db.session.execute(db.delete(Score).where(
+            Score.round_id == round.id,
+            Score.hole_number.notin_([row['hole_number'] for row in rows])))
+
+    summary = RoundSummary.from_scores(round.id, [Score(**row) for row in rows])
+    rate_round(summary, rows, tee, course_handicap)
+    columns = {column.key: getattr(summary, column.key)
+               for column in RoundSummary.__table__.columns if column.key != 'id'}
+    stmt = dialect_insert(RoundSummary).values(columns)
+    db.session.execute(
+        stmt.on_conflict_do_update(index_elements=['round_id'],
+                                   set_={key: getattr(stmt.excluded, key) for key in columns})
+        .returning(RoundSummary),
+        execution_options={'populate_existing': True})
+
+    pipeline.enqueue(round.id)
+    return 'updated' if existing else 'created'
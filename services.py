@@ -1,55 +1,267 @@
 
 from flask import current_app
 import requests
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from models import Golfer, Course, db
-import pytz
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from sqlalchemy import text
+from sqlalchemy.orm import Session, selectinload
+from models import APIToken, Golfer, Course, Tee, Hole, CachedCourseDetails, db, dialect_insert
+from spatial import course_locations
+
+
+GHIN_API_URL = 'https://api2.ghin.com/api/v1'
+
+
+class GHINClient:
+    """Shared, pooled HTTP client for every call to the GHIN API.
+
+    Connections are kept alive across requests, each endpoint has its own
+    (connect, read) timeout, transient failures are retried with exponential
+    backoff, and latency/outcome counters are kept per endpoint.
+    """
+
+    default_timeout = (3.05, 10)
+    timeouts = {
+        'login': (3.05, 10),
+        'golfer_search': (3.05, 10),
+        'course_search': (3.05, 10),
+        'course_details': (3.05, 15),
+    }
+
+    def __init__(self, pool_size=10, retries=3, backoff_factor=0.5):
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def get(self, endpoint, path, **kwargs):
+        return self.request(endpoint, 'GET', path, **kwargs)
+
+    def post(self, endpoint, path, **kwargs):
+        return self.request(endpoint, 'POST', path, **kwargs)
+
+    def request(self, endpoint, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeouts.get(
+            endpoint, self.default_timeout))
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, f'{GHIN_API_URL}/{path}', **kwargs)
+        except requests.exceptions.Timeout:
+            self._record(endpoint, start, 'timeout')
+            raise
+        except requests.exceptions.RequestException:
+            self._record(endpoint, start, 'error')
+            raise
+        self._record(endpoint, start, str(response.status_code))
+        return response
+
+    def metrics(self):
+        with self._lock:
+            return {endpoint: {**m, 'outcomes': dict(m['outcomes'])}
+                    for endpoint, m in self._metrics.items()}
+
+    def _record(self, endpoint, start, outcome):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            m = self._metrics.setdefault(endpoint, {
+                'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'outcomes': {}})
+            m['calls'] += 1
+            m['total_seconds'] += elapsed
+            m['max_seconds'] = max(m['max_seconds'], elapsed)
+            m['outcomes'][outcome] = m['outcomes'].get(outcome, 0) + 1
+
+
+ghin_client = GHINClient()
+
+
+class TokenManager:
+    """GHIN admin token shared by every thread and worker process.
+
+    The token lives in the APIToken table so a token fetched by one worker is
+    reused by all of them. Refreshes are single-flight: a thread lock covers
+    the current process and, on PostgreSQL, a transaction-scoped advisory
+    lock covers the others. Tokens are refreshed GHIN_TOKEN_REFRESH_MARGIN
+    seconds before they expire; while a refresh is in flight other callers
+    keep using the still-valid token instead of waiting.
+    """
+
+    advisory_lock_key = 0x6768696e  # 'ghin'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token = None
+        self._expiry = None
+        self._retry_after = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.shared_loads = 0
+
+    def get_token(self):
+        now = datetime.utcnow()
+        margin = timedelta(seconds=current_app.config.get(
+            'GHIN_TOKEN_REFRESH_MARGIN', 30 * 60))
+
+        if self._token and self._expiry - margin > now:
+            return self._token
+
+        still_valid = self._token if self._token and self._expiry > now else None
+        if still_valid and self._retry_after and self._retry_after > now:
+            # The last proactive refresh failed; don't hammer the login endpoint.
+            return still_valid
+        if not self._lock.acquire(blocking=still_valid is None):
+            # Another thread is already refreshing; the old token still works.
+            return still_valid
+        try:
+            return self._refresh(now, margin)
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return {
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+            'shared_loads': self.shared_loads,
+            'expiry': self._expiry,
+        }
+
+    def _refresh(self, now, margin):
+        if self._token and self._expiry - margin > now:
+            return self._token
+
+        # The token store gets its own session: callers may hold row locks
+        # or pending work in db.session that a refresh must not commit.
+        with Session(db.engine) as session:
+            self._acquire_cross_process_lock(session)
+            stored = APIToken.get_current_token(session)
+            if stored and stored.expiry - margin > now:
+                # Another worker refreshed while we waited for the lock.
+                self.shared_loads += 1
+                self._remember(stored.token, stored.expiry)
+                session.commit()
+                return stored.token
+
+            current_app.logger.info("Fetching new token")
+            token = self._login()
+            if not token:
+                self.refresh_failures += 1
+                self._retry_after = now + timedelta(seconds=60)
+                session.commit()
+                if stored:
+                    self._remember(stored.token, stored.expiry)
+                    return stored.token
+                return None
+
+            lifetime = timedelta(seconds=current_app.config.get(
+                'GHIN_TOKEN_LIFETIME', 24 * 60 * 60))
+            expiry = now + lifetime
+            session.execute(db.delete(APIToken).where(APIToken.expiry <= now))
+            session.add(APIToken(token=token, expiry=expiry))
+            session.commit()  # Also releases the advisory lock
+            self.refreshes += 1
+            self._retry_after = None
+            self._remember(token, expiry)
+            current_app.logger.info("New token fetched successfully")
+            return token
+
+    def _remember(self, token, expiry):
+        self._token = token
+        self._expiry = expiry
+
+    def _acquire_cross_process_lock(self, session):
+        if db.engine.dialect.name == 'postgresql':
+            session.execute(text('SELECT pg_advisory_xact_lock(:key)'),
+                               {'key': self.advisory_lock_key})
+
+    def _login(self):
+        if not current_app.config.get('GHIN_ADMIN_USER') or not current_app.config.get('GHIN_ADMIN_PASSWORD'):
+            current_app.logger.error(
+                "API credentials are not set in environment variables.")
+            return None
+        try:
+            response = ghin_client.post(
+                'login', 'golfer_login.json',
+                headers={"Content-Type": "application/json"},
+                json={
+                    "token": "dummy token",
+                    "user": {
+                        "password": current_app.config['GHIN_ADMIN_PASSWORD'],
+                        "email_or_ghin": current_app.config['GHIN_ADMIN_USER'],
+                        "remember_me": True
+                    }
+                }
+            )
+        except requests.exceptions.RequestException as e:
+            current_app.logger.error(f'Failed to get admin token: {e}')
+            return None
 
+        if response.status_code == 200:
+            token = (response.json().get('golfer_user')
+                     or {}).get('golfer_user_token')
+            if not token:
+                current_app.logger.error("Token not found in response")
+            return token
 
-global_api_token = None
-token_expiry = None
+        current_app.logger.error(
+            'Failed to get admin token: HTTP status code {}'.format(response.status_code))
+        current_app.logger.debug('Response details: {}'.format(response.text))
+        return None
+
+
+token_manager = TokenManager()
 
 
 def get_admin_token():
-    global global_api_token, token_expiry  # Declare the variables as global
-    current_time = datetime.utcnow().replace(tzinfo=pytz.utc)
-
-    # Check if the current token is valid
-    if global_api_token and token_expiry and token_expiry > current_time:
-        current_app.logger.info("Using cached token")
-        return global_api_token
-
-    # Fetch a new token if necessary
-    current_app.logger.info("Fetching new token")
-    response = requests.post(
-        'https://api2.ghin.com/api/v1/golfer_login.json',
-        headers={"Content-Type": "application/json"},
-        json={
-            "token": "dummy token",
-            "user": {
-                "password": current_app.config['GHIN_ADMIN_PASSWORD'],
-                "email_or_ghin": current_app.config['GHIN_ADMIN_USER'],
-                "remember_me": True
-            }
-        }
-    )
+    """Return a valid GHIN admin token, refreshing it if necessary."""
+    return token_manager.get_token()
 
-    if response.status_code == 200:
-        global_api_token = response.json().get('golfer_user').get('golfer_user_token')
-        if global_api_token:
-            token_expiry = current_time + \
-                timedelta(hours=24)  # Set new expiry time
-            current_app.logger.info(
-                "New token fetched successfully", global_api_token)
-            return global_api_token
-        else:
-            current_app.logger.error("Token not found in response")
 
-    else:
-        current_app.logger.error(
-            'Failed to get admin token: HTTP status code {}'.format(response.status_code))
-        current_app.logger.debug('Response details: {}'.format(response.text))
+def lookup_golfer_handicap(ghin_id, last_name, state):
+    """Look up a golfer's handicap index on GHIN, raising on request errors.
+
+    Returns None when GHIN has no golfer with this GHIN ID.
+    """
+    token = get_admin_token()  # Ensure a valid token is available
+    if not token:
+        raise ValueError("Authentication token is missing or invalid")
 
+    response = ghin_client.get('golfer_search', 'golfers/search.json',
+                               headers={
+                                   "Authorization": f"Bearer {token}",
+                                   "Content-Type": "application/json"},
+                               params={
+                                   "per_page": "50",
+                                   "page": "1",
+                                   "ghin_id": ghin_id,
+                                   "last_name": last_name,
+                                   "state": state
+                               }
+                               )
+    response.raise_for_status()  # Raises an exception for HTTP errors
+    golfer_data = response.json()
+
+    for golfer in golfer_data.get('golfers', []):
+        current_app.logger.debug(
+            f"Checking golfer: GHIN ID {golfer.get('ghin')}, Name {golfer.get('last_name')}, State {golfer.get('state')}")
+        if str(golfer.get('ghin')) == str(ghin_id):
+            # Ensure matching GHIN IDs
+            current_app.logger.info(f"Match found: {golfer}")
+            return golfer.get('handicap_index')
     return None
 
 
@@ -57,37 +269,7 @@ def fetch_golfer_handicap(ghin_id, last_name, state):
     """Fetch the current handicap for a golfer using the GHIN API."""
 
     try:
-        token = get_admin_token()  # Ensure a valid token is available
-        if not token:
-            raise ValueError("Authentication token is missing or invalid")
-
-        response = requests.get('https://api2.ghin.com/api/v1/golfers/search.json',
-                                headers={
-                                    "Authorization": f"Bearer {token}",
-                                    "Content-Type": "application/json"},
-                                params={
-                                    "per_page": "50",
-                                    "page": "1",
-                                    "ghin_id": ghin_id,
-                                    "last_name": last_name,
-                                    "state": state
-                                }
-                                )
-        response.raise_for_status()  # Raises an exception for HTTP errors
-        golfer_data = response.json()
-        # current_app.logger.debug(f"API response: {golfer_data}")
-
-        golfers = golfer_data.get('golfers', [])
-        if golfers:
-            for golfer in golfers:
-                current_app.logger.debug(
-                    f"Checking golfer: GHIN ID {golfer.get('ghin')}, Name {golfer.get('last_name')}, State {golfer.get('state')}")
-                if str(golfer.get('ghin')) == str(ghin_id):
-                    # Ensure matching GHIN IDs
-                    current_app.logger.info(f"Match found: {golfer}")
-                    return golfer.get('handicap_index')
-        return None
-
+        return lookup_golfer_handicap(ghin_id, last_name, state)
     except requests.exceptions.HTTPError as e:
         current_app.logger.error(f'HTTP error occurred: {e}')
         return None
@@ -96,6 +278,154 @@ def fetch_golfer_handicap(ghin_id, last_name, state):
         return None
 
 
+def parse_handicap_index(value):
+    """Convert a GHIN handicap index string to a float; '+1.2' becomes -1.2."""
+    if value in (None, '', 'NH'):
+        return None
+    value = str(value).strip()
+    try:
+        if value.startswith('+'):
+            return -float(value[1:])
+        return float(value)
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls evenly at `rate` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every caller back for `seconds`, e.g. after an HTTP 429."""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _retry_after_seconds(error, default=5.0):
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('Retry-After', default))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+def bulk_refresh_handicaps(golfers=None, workers=None, rate=None):
+    """Refresh handicap indexes for many golfers concurrently.
+
+    `golfers` is a list of rows with id, ghin_id, last_name and state; it
+    defaults to every golfer with a GHIN ID. Lookups run on a thread pool
+    throttled to `rate` requests per second, backing off when GHIN answers
+    429. All results are written with one bulk UPDATE at the end, and a
+    report of successes, misses and failures is returned.
+    """
+    workers = workers or current_app.config.get('HANDICAP_REFRESH_WORKERS', 8)
+    rate = rate or current_app.config.get('HANDICAP_REFRESH_RATE', 10)
+    if golfers is None:
+        golfers = db.session.execute(
+            db.select(Golfer.id, Golfer.ghin_id, Golfer.last_name, Golfer.state)
+            .where(Golfer.ghin_id.isnot(None))
+        ).all()
+
+    app = current_app._get_current_object()
+    limiter = RateLimiter(rate)
+    started = time.perf_counter()
+    get_admin_token()  # Log in once before fanning out
+
+    def lookup(golfer):
+        limiter.acquire()
+        with app.app_context():
+            return lookup_golfer_handicap(golfer.ghin_id, golfer.last_name, golfer.state)
+
+    fetched_at = datetime.utcnow()
+    updates = []
+    not_found = []
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(lookup, golfer): golfer for golfer in golfers}
+        for future in as_completed(futures):
+            golfer = futures[future]
+            try:
+                handicap = future.result()
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 429:
+                    limiter.pause(_retry_after_seconds(e))
+                failures.append((golfer.id, str(e)))
+                continue
+            except Exception as e:
+                failures.append((golfer.id, str(e)))
+                continue
+            if handicap is None:
+                # Keep the last known index but don't retry until it's stale
+                not_found.append(golfer.id)
+                updates.append({'id': golfer.id, 'handicap_fetched_at': fetched_at})
+                continue
+            updates.append({
+                'id': golfer.id,
+                'handicap_index': parse_handicap_index(handicap),
+                'handicap_fetched_at': fetched_at
+            })
+
+    if updates:
+        db.session.execute(db.update(Golfer), updates)
+    db.session.commit()
+
+    elapsed = time.perf_counter() - started
+    report = {
+        'total': len(golfers),
+        'updated': len(updates) - len(not_found),
+        'not_found': not_found,
+        'failed': failures,
+        'seconds': elapsed,
+        'golfers_per_second': len(golfers) / elapsed if elapsed else 0.0
+    }
+    current_app.logger.info(
+        f"Refreshed {report['updated']}/{report['total']} handicaps "
+        f"({len(failures)} failed) at {report['golfers_per_second']:.1f} golfers/s")
+    return report
+
+
+def refresh_stale_handicaps(max_age=None, batch_size=None):
+    """Refresh handicap indexes that are missing or older than max_age.
+
+    Golfers that have never been synced come first. Rows are locked with
+    SKIP LOCKED so concurrent workers running this job split the batch
+    instead of refreshing the same golfers twice.
+    """
+    max_age = max_age or timedelta(seconds=current_app.config.get(
+        'HANDICAP_MAX_AGE', 12 * 60 * 60))
+    batch_size = batch_size or current_app.config.get(
+        'HANDICAP_REFRESH_BATCH_SIZE', 100)
+    cutoff = datetime.utcnow() - max_age
+
+    golfers = db.session.execute(
+        db.select(Golfer.id, Golfer.ghin_id, Golfer.last_name, Golfer.state)
+        .where(Golfer.ghin_id.isnot(None),
+               db.or_(Golfer.handicap_fetched_at.is_(None),
+                      Golfer.handicap_fetched_at < cutoff))
+        .order_by(Golfer.handicap_fetched_at.asc().nullsfirst())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not golfers:
+        db.session.commit()
+        return 0
+
+    report = bulk_refresh_handicaps(golfers)
+    return report['total']
+
+
 def search_courses(query):
     """Search for golf courses using the GHIN API."""
     try:
@@ -110,11 +440,10 @@ def search_courses(query):
         params = {
             "name": query
         }
-        api_url = f"https://api2.ghin.com/api/v1/courses/search.json"
-
         current_app.logger.debug(
-            f"Requesting URL: {api_url} with headers: {headers} and params: {params}")
-        response = requests.get(api_url, headers=headers, params=params)
+            f"Requesting course search with params: {params}")
+        response = ghin_client.get(
+            'course_search', 'courses/search.json', headers=headers, params=params)
         response.raise_for_status()  # Will raise an exception for HTTP errors
 
         current_app.logger.debug(f'Response Data; {response.text}')
@@ -135,34 +464,244 @@ def search_courses(query):
         return None
 
 
+def _course_row(course_info):
+    """Map a GHIN course search result onto Course column values."""
+    updated_on = course_info.get('UpdatedOn')
+    return {
+        'course_id': course_info['CourseID'],
+        'name': course_info['CourseName'],
+        'status': course_info.get('CourseStatus'),
+        'latitude': course_info.get('GeoLocationLatitude'),
+        'longitude': course_info.get('GeoLocationLongitude'),
+        'facility_id': course_info.get('FacilityID'),
+        'facility_name': course_info.get('FacilityName'),
+        'full_name': course_info.get('FullName'),
+        'address': course_info.get('Address1'),
+        'city': course_info.get('City'),
+        'state': course_info.get('State'),
+        'zip_code': course_info.get('Zip'),
+        'country': course_info.get('Country'),
+        'phone': course_info.get('Telephone'),
+        'email': course_info.get('Email'),
+        'updated_on': datetime.strptime(updated_on, "%Y-%m-%d") if updated_on else None
+    }
+
+
 def save_course_data(course_data):
+    """Upsert GHIN course search results in a single transaction.
+
+    Existing courses are found with one IN query; new courses are bulk
+    inserted and courses whose UpdatedOn is newer than the stored value are
+    bulk updated. A course another request inserted since the IN query is
+    left to that request. Returns counts of inserted, updated and unchanged
+    courses.
+    """
+    synced_at = datetime.utcnow()
+    rows = {}
     for course_info in course_data:
-        # Check if course already exists to avoid duplicates
-        existing_course = Course.query.filter_by(
-            course_id=course_info['CourseID']).first()
-        if not existing_course:
-            new_course = Course(
-                __tablename__='courses',
-                course_id=course_info['CourseID'],
-                name=course_info['CourseName'],
-                status=course_info['CourseStatus'],
-                latitude=course_info['GeoLocationLatitude'],
-                longitude=course_info['GeoLocationLongitude'],
-                facility_id=course_info['FacilityID'],
-                facility_name=course_info['FacilityName'],
-                full_name=course_info['FullName'],
-                address=course_info['Address1'],
-                city=course_info['City'],
-                state=course_info['State'],
-                zip_code=course_info['Zip'],
-                country=course_info['Country'],
-                phone=course_info['Telephone'],
-                email=course_info['Email'],
-                updated_on=datetime.strptime(
-                    course_info['UpdatedOn'], "%Y-%m-%d")
-            )
-            db.session.add(new_course)
-            db.session.commit()
+        rows[course_info['CourseID']] = {
+            **_course_row(course_info), 'synced_at': synced_at}
+
+    existing = {}
+    if rows:
+        existing = {course_id: (pk, updated_on) for course_id, pk, updated_on in db.session.execute(
+            db.select(Course.course_id, Course.id, Course.updated_on)
+            .where(Course.course_id.in_(list(rows)))
+        )}
+
+    inserts = []
+    updates = []
+    unchanged = []
+    for course_id, row in rows.items():
+        if course_id not in existing:
+            inserts.append(row)
+            continue
+        pk, updated_on = existing[course_id]
+        if row['updated_on'] and (updated_on is None or row['updated_on'] > updated_on):
+            updates.append({**row, 'id': pk})
+        else:
+            # Only record that GHIN still returns it, for local search freshness
+            unchanged.append({'id': pk, 'synced_at': synced_at})
+
+    inserted = set()
+    if inserts:
+        inserted = set(db.session.scalars(
+            dialect_insert(Course).values(inserts)
+            .on_conflict_do_nothing(index_elements=['course_id'])
+            .returning(Course.course_id)))
+        inserts = [row for row in inserts if row['course_id'] in inserted]
+    if updates or unchanged:
+        db.session.execute(db.update(Course), updates + unchanged)
+    db.session.commit()
+
+    for row in inserts + updates:
+        course_locations.add(row['course_id'], row['latitude'], row['longitude'])
+
+    return {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'unchanged': len(rows) - len(inserts) - len(updates)
+    }
+
+
+def _escape_like(value):
+    """Escape LIKE wildcards so `value` matches literally (escape char '\\')."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_local_courses(query, limit=50):
+    """Search saved courses by name, facility, city or state.
+
+    Every word of the query must appear in at least one searchable column.
+    Exact name matches rank first, then name prefixes, then other prefixes.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+
+    columns = [getattr(Course, column) for column in Course.SEARCH_COLUMNS]
+    filters = [db.or_(*(column.ilike(f'%{_escape_like(term)}%', escape='\\')
+                        for column in columns))
+               for term in terms]
+    phrase = query.strip()
+    prefix = f'{_escape_like(phrase)}%'
+    rank = db.case(
+        (db.func.lower(Course.name) == phrase.lower(), 0),
+        (Course.name.ilike(prefix, escape='\\'), 1),
+        (db.or_(Course.full_name.ilike(prefix, escape='\\'),
+                Course.facility_name.ilike(prefix, escape='\\')), 2),
+        else_=3
+    )
+    return Course.query.filter(*filters).order_by(rank, Course.name).limit(limit).all()
+
+
+def find_courses(query):
+    """Answer a course search locally, falling back to GHIN.
+
+    GHIN is only called when nothing matches locally or when the freshest
+    local match was last seen in a GHIN search more than
+    COURSE_SEARCH_MAX_AGE seconds ago. Results use GHIN's search result keys.
+    """
+    max_age = timedelta(seconds=current_app.config.get(
+        'COURSE_SEARCH_MAX_AGE', 7 * 24 * 60 * 60))
+    local = search_local_courses(query)
+    synced = [course.synced_at for course in local if course.synced_at]
+    if local and synced and max(synced) > datetime.utcnow() - max_age:
+        return [course.to_search_result() for course in local]
+
+    remote = search_courses(query)
+    if remote:
+        save_course_data(remote)
+        return remote
+    # GHIN is unavailable; stale local results are better than none.
+    return [course.to_search_result() for course in local]
+
+
+def _total_rating(tee_set):
+    """Return the 18-hole rating entry of a TeeSet, if GHIN supplied one."""
+    for rating in tee_set.get('Ratings', []):
+        if rating.get('RatingType') == 'Total':
+            return rating
+    return {}
+
+
+def materialize_course(course_id, course_details):
+    """Write a course's TeeSets and Holes to the tees/holes tables.
+
+    Runs once per course: the Course row is created if needed and all of its
+    tees and holes are bulk inserted in a single transaction. Inserts skip
+    rows that already exist, so two first views of a course can run at once:
+    the second waits for the first and adds nothing.
+    """
+    course = Course.query.filter_by(course_id=course_id).first()
+    if course and course.tees_synced_at:
+        return course
+
+    if not course:
+        facility = course_details.get('Facility') or {}
+        db.session.execute(dialect_insert(Course).values(
+            course_id=course_id,
+            name=course_details.get('CourseName') or facility.get(
+                'FacilityName') or f'Course {course_id}',
+            status=course_details.get('CourseStatus'),
+            facility_id=facility.get('FacilityId'),
+            facility_name=facility.get('FacilityName'),
+            city=course_details.get('CourseCity'),
+            state=course_details.get('CourseState')
+        ).on_conflict_do_nothing(index_elements=['course_id']))
+        course = Course.query.filter_by(course_id=course_id).one()
+
+    tee_sets = course_details.get('TeeSets', [])
+    tee_rows = []
+    for tee_set in tee_sets:
+        rating = _total_rating(tee_set)
+        tee_rows.append({
+            'tee_set_id': tee_set['TeeSetRatingId'],
+            'name': tee_set.get('TeeSetRatingName'),
+            'gender': tee_set.get('Gender'),
+            'course_id': course.id,
+            'yardage': tee_set.get('TotalYardage'),
+            'par': tee_set.get('TotalPar'),
+            'course_rating': rating.get('CourseRating'),
+            'slope_rating': rating.get('SlopeRating')
+        })
+
+    if tee_rows:
+        # Only tees inserted here get their holes; a concurrent view that
+        # inserted the others inserts their holes too
+        inserted = db.session.execute(
+            dialect_insert(Tee).values(tee_rows)
+            .on_conflict_do_nothing(index_elements=['tee_set_id'])
+            .returning(Tee.id, Tee.tee_set_id))
+        tee_ids = {tee_set_id: tee_id for tee_id, tee_set_id in inserted}
+        hole_rows = [{
+            'api_hole_id': hole.get('HoleId'),
+            'tee_id': tee_ids[tee_set['TeeSetRatingId']],
+            'number': hole['Number'],
+            'par': hole['Par'],
+            'yardage': hole.get('Length'),
+            'handicap': hole.get('Allocation')
+        } for tee_set in tee_sets if tee_set['TeeSetRatingId'] in tee_ids
+            for hole in tee_set.get('Holes', [])]
+        if hole_rows:
+            db.session.execute(dialect_insert(Hole).values(hole_rows)
+                               .on_conflict_do_nothing(index_elements=['api_hole_id']))
+
+    course.tees_synced_at = datetime.utcnow()
+    db.session.commit()
+    return course
+
+
+def get_course_with_tees(course_id):
+    """Load a course with its tees and holes in a fixed number of queries."""
+    query = Course.query.options(
+        selectinload(Course.tees).selectinload(Tee.holes)
+    ).filter_by(course_id=course_id)
+    course = query.first()
+    if course and course.tees_synced_at:
+        return course
+
+    course_details = get_course_details(course_id)
+    if not course_details:
+        return course
+    materialize_course(course_id, course_details)
+    db.session.expire_all()
+    return query.first()
+
+
+def get_tee_with_holes(course_id, tee_set_id):
+    """Load one tee and its holes, materializing the course on first use."""
+    query = Tee.query.options(selectinload(Tee.holes)).filter_by(
+        tee_set_id=tee_set_id)
+    tee = query.first()
+    if tee:
+        return tee
+
+    course_details = get_course_details(course_id)
+    if not course_details:
+        return None
+    materialize_course(course_id, course_details)
+    return query.first()
 
 
 def fetch_course_details(course_id):
@@ -177,8 +716,8 @@ def fetch_course_details(course_id):
             "content-type": "application/json"
         }
 
-        response = requests.get(
-            f"https://api2.ghin.com/api/v1/courses/{course_id}.json", headers=headers)
+        response = ghin_client.get(
+            'course_details', f"courses/{course_id}.json", headers=headers)
         response.raise_for_status()
 
         data = response.json()
@@ -190,7 +729,8 @@ def fetch_course_details(course_id):
             "CourseStatus": data.get('CourseStatus', 'Status Unknown'),
             "CourseCity": data.get('CourseCity', 'City not available'),
             "CourseState": data.get('CourseState', 'State not available'),
-            "CourseId": data.get('CourseId', 'Courseid not available')
+            "CourseId": data.get('CourseId', 'Courseid not available'),
+            "CourseName": data.get('CourseName')
         }
         current_app.logger.debug(course_details)
         return course_details
@@ -202,6 +742,147 @@ def fetch_course_details(course_id):
         return None
 
 
+class CourseDetailsCache:
+    """Course details cache keyed by GHIN course id.
+
+    An in-process LRU sits in front of the course_details_cache table, so a
+    course that any worker has already fetched is served without calling GHIN.
+    Entries older than COURSE_CACHE_TTL are still served while they are younger
+    than COURSE_CACHE_STALE_TTL, and a background refresh is started for them.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def get(self, course_id):
+        ttl = timedelta(seconds=current_app.config.get(
+            'COURSE_CACHE_TTL', 24 * 60 * 60))
+        stale_ttl = timedelta(seconds=current_app.config.get(
+            'COURSE_CACHE_STALE_TTL', 7 * 24 * 60 * 60))
+        now = datetime.utcnow()
+
+        entry = self._get_local(course_id)
+        if entry is None:
+            entry = self._get_durable(course_id)
+
+        if entry is not None:
+            payload, fetched_at = entry
+            age = now - fetched_at
+            if age <= ttl:
+                self._count('hits')
+                return payload
+            if age <= stale_ttl:
+                self._count('stale_hits')
+                self._refresh_in_background(course_id)
+                return payload
+
+        self._count('misses')
+        fresh = fetch_course_details(course_id)
+        if fresh:
+            self.put(course_id, fresh)
+            return fresh
+        # GHIN is unavailable; an expired copy is better than nothing.
+        return entry[0] if entry is not None else None
+
+    def put(self, course_id, payload, fetched_at=None):
+        fetched_at = fetched_at or datetime.utcnow()
+        self._put_local(course_id, payload, fetched_at)
+        # Its own session, so the caller's pending work isn't committed too
+        with Session(db.engine) as session:
+            session.merge(CachedCourseDetails(
+                course_id=course_id, payload=payload, fetched_at=fetched_at))
+            session.commit()
+
+    def invalidate(self, course_id):
+        with self._lock:
+            self._entries.pop(course_id, None)
+        with Session(db.engine) as session:
+            session.execute(db.delete(CachedCourseDetails)
+                            .where(CachedCourseDetails.course_id == course_id))
+            session.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'refreshes': self.refreshes,
+                'size': len(self._entries),
+            }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _get_local(self, course_id):
+        with self._lock:
+            entry = self._entries.get(course_id)
+            if entry is not None:
+                self._entries.move_to_end(course_id)
+            return entry
+
+    def _put_local(self, course_id, payload, fetched_at):
+        max_entries = current_app.config.get('COURSE_CACHE_MAX_ENTRIES', 256)
+        with self._lock:
+            self._entries[course_id] = (payload, fetched_at)
+            self._entries.move_to_end(course_id)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_durable(self, course_id):
+        cached = db.session.get(CachedCourseDetails, course_id)
+        if cached is None:
+            return None
+        self._put_local(course_id, cached.payload, cached.fetched_at)
+        return cached.payload, cached.fetched_at
+
+    def _refresh_in_background(self, course_id):
+        with self._lock:
+            if course_id in self._refreshing:
+                return
+            self._refreshing.add(course_id)
+        app = current_app._get_current_object()
+        threading.Thread(target=self._refresh, args=(app, course_id),
+                         daemon=True).start()
+
+    def _refresh(self, app, course_id):
+        with app.app_context():
+            try:
+                fresh = fetch_course_details(course_id)
+                if fresh:
+                    self.put(course_id, fresh)
+                    self._count('refreshes')
+            except Exception as e:
+                app.logger.error(
+                    f'Background refresh of course {course_id} failed: {e}')
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._refreshing.discard(course_id)
+
+
+course_details_cache = CourseDetailsCache()
+
+
+def get_course_details(course_id):
+    """Return course details from the cache, fetching from GHIN on a miss."""
+    return course_details_cache.get(course_id)
+
+
 # def fetch_playing_handicaps(golfer_id, course_id, tee_id, played_at):
 #     """Fetch playing handicaps from the GHIN API."""
 #     try:
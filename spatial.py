@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+import math
+import threading
+
+from models import Course, db
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class CourseGrid:
+    """In-memory grid index over course coordinates.
+
+    Courses are bucketed into cells of `cell_degrees` latitude/longitude, so a
+    radius query only measures courses in the cells overlapping the search
+    circle. k-nearest queries widen the radius until k courses are inside it.
+    """
+
+    def __init__(self, cell_degrees=0.5):
+        self.cell_degrees = cell_degrees
+        self._lon_cells = int(round(360 / cell_degrees))
+        self._cells = {}
+        self._locations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def add(self, course_id, latitude, longitude):
+        if latitude is None or longitude is None:
+            return
+        with self._lock:
+            self._discard(course_id)
+            cell = self._cell(latitude, longitude)
+            self._cells.setdefault(cell, {})[course_id] = (latitude, longitude)
+            self._locations[course_id] = cell
+
+    def remove(self, course_id):
+        with self._lock:
+            self._discard(course_id)
+
+    def within(self, latitude, longitude, radius_km, limit=None):
+        """Return [(distance_km, course_id)] within radius_km, nearest first."""
+        lat_span = math.degrees(radius_km / EARTH_RADIUS_KM)
+        min_row = self._row(max(latitude - lat_span, -90.0))
+        max_row = self._row(min(latitude + lat_span, 90.0))
+
+        # Longitude degrees shrink towards the poles; use the widest latitude
+        widest = min(abs(latitude) + lat_span, 90.0)
+        cos_lat = math.cos(math.radians(widest))
+        if cos_lat < 1e-6 or lat_span / cos_lat >= 180:
+            columns = range(self._lon_cells)
+        else:
+            lon_span = lat_span / cos_lat
+            first = self._column(longitude - lon_span)
+            count = int(math.ceil(2 * lon_span / self.cell_degrees)) + 1
+            columns = {(first + offset) % self._lon_cells
+                       for offset in range(min(count, self._lon_cells))}
+
+        matches = []
+        with self._lock:
+            for row in range(min_row, max_row + 1):
+                for column in columns:
+                    for course_id, (lat, lon) in self._cells.get((row, column), {}).items():
+                        distance = haversine_km(latitude, longitude, lat, lon)
+                        if distance <= radius_km:
+                            matches.append((distance, course_id))
+        matches.sort()
+        return matches[:limit] if limit else matches
+
+    def nearest(self, latitude, longitude, k=10, start_radius_km=25.0):
+        """Return the k nearest courses as [(distance_km, course_id)]."""
+        radius = start_radius_km
+        while True:
+            matches = self.within(latitude, longitude, radius)
+            if len(matches) >= k or radius >= math.pi * EARTH_RADIUS_KM:
+                return matches[:k]
+            radius *= 2
+
+    def _discard(self, course_id):
+        cell = self._locations.pop(course_id, None)
+        if cell is not None:
+            self._cells[cell].pop(course_id, None)
+            if not self._cells[cell]:
+                del self._cells[cell]
+
+    def _row(self, latitude):
+        return int(math.floor((latitude + 90.0) / self.cell_degrees))
+
+    def _column(self, longitude):
+        return int(math.floor((longitude + 180.0) / self.cell_degrees)) % self._lon_cells
+
+    def _cell(self, latitude, longitude):
+        return self._row(latitude), self._column(longitude)
+
+
+class CourseLocationIndex:
+    """Process-wide CourseGrid kept in step with the courses table.
+
+    The grid is loaded on first use; afterwards only courses whose synced_at
+    moved since the last sync are re-read, at most every `sync_interval`, so
+    courses saved by other workers appear without a rebuild.
+    """
+
+    def __init__(self, cell_degrees=0.5, sync_interval=timedelta(seconds=60)):
+        self.cell_degrees = cell_degrees
+        self.sync_interval = sync_interval
+        self.grid = None
+        self._synced_through = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def add(self, course_id, latitude, longitude):
+        if self.grid is not None:
+            self.grid.add(course_id, latitude, longitude)
+
+    def within(self, latitude, longitude, radius_km, limit=None):
+        return self._current().within(latitude, longitude, radius_km, limit)
+
+    def nearest(self, latitude, longitude, k=10):
+        return self._current().nearest(latitude, longitude, k)
+
+    def _current(self):
+        now = datetime.utcnow()
+        with self._lock:
+            if self.grid is None:
+                self.grid = CourseGrid(self.cell_degrees)
+                self._sync(None)
+            elif now - self._checked_at >= self.sync_interval:
+                self._sync(self._synced_through)
+            self._checked_at = now
+            return self.grid
+
+    def _sync(self, since):
+        query = db.select(Course.course_id, Course.latitude, Course.longitude,
+                          Course.synced_at).where(Course.latitude.isnot(None),
+                                                  Course.longitude.isnot(None))
+        if since is not None:
+            query = query.where(Course.synced_at > since)
+        for course_id, latitude, longitude, synced_at in db.session.execute(query):
+            self.grid.add(course_id, latitude, longitude)
+            if synced_at and (self._synced_through is None or synced_at > self._synced_through):
+                self._synced_through = synced_at
+
+
+course_locations = CourseLocationIndex()
+
+
+def nearby_courses(latitude, longitude, radius_km=None, k=10):
+    """Courses near a point, nearest first, with their distance in km.
+
+    With radius_km, returns up to k courses inside the radius; otherwise the
+    k nearest courses regardless of distance.
+    """
+    if radius_km:
+        matches = course_locations.within(latitude, longitude, radius_km, limit=k)
+    else:
+        matches = course_locations.nearest(latitude, longitude, k)
+    if not matches:
+        return []
+
+    courses = {course.course_id: course for course in Course.query.filter(
+        Course.course_id.in_([course_id for _, course_id in matches]))}
+    return [(courses[course_id], distance) for distance, course_id in matches
+            if course_id in courses]
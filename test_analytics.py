@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from models import db, RoundSummary, Statistic
+from analytics import AnalyticsCache, compute_analytics
+from test_support import DatabaseTestCase
+
+
+PARS = [4, 3, 5] * 6
+
+
+class TestAnalytics(DatabaseTestCase):
+    def add_dated_round(self, day, strokes, pars=PARS):
+        round = self.add_round(strokes, pars,
+                               date_played=datetime(2024, 1, 1) + timedelta(days=day))
+        for score in round.scores:
+            score.hole_handicap = score.hole_number
+        db.session.commit()
+        return round
+
+    def test_no_rounds(self):
+        self.assertIsNone(compute_analytics(1))
+
+    def test_round_and_hole_figures(self):
+        self.add_dated_round(0, [4, 3, 5] * 6)           # 72, all pars
+        self.add_dated_round(1, [5, 4, 6] * 6)           # 90, all bogeys
+        self.add_dated_round(2, [4, 4, 4] * 3, PARS[:9])  # nine holes
+        analytics = compute_analytics(1, rolling_rounds=1)
+
+        self.assertEqual((analytics['rounds'], analytics['full_rounds'], analytics['holes']),
+                         (3, 2, 45))
+        self.assertEqual(analytics['scoring_average'], 81)
+        self.assertEqual(analytics['rolling_average'], 90)
+        self.assertEqual(analytics['best_round'], 72)
+        self.assertEqual(analytics['putts_per_round'], 36)
+        # add_round marks even holes' fairways hit and greens hit at par or better
+        self.assertEqual(analytics['green_in_regulation_percentage'], round(24 * 100 / 45, 1))
+        self.assertEqual(analytics['scoring_by_par'], {3: 0.6, 4: 0.4, 5: 0.2})
+        self.assertEqual(analytics['trend']['scores'], [72, 90])
+        self.assertEqual(analytics['trend']['rolling_average'], [72.0, 90.0])
+        self.assertEqual(analytics['trend']['dates'], ['2024-01-01T00:00:00', '2024-01-02T00:00:00'])
+
+    def test_scoring_by_handicap_band(self):
+        # One over on the six hardest holes, par elsewhere
+        self.add_dated_round(0, [par + (1 if number <= 6 else 0)
+                                 for number, par in enumerate(PARS, start=1)])
+        self.assertEqual(compute_analytics(1)['scoring_by_handicap_band'],
+                         {'1-6': 1.0, '7-12': 0.0, '13-18': 0.0})
+
+
+class TestAnalyticsCache(DatabaseTestCase):
+    def process(self, round):
+        Statistic.record_round(1, RoundSummary.from_scores(round.id, round.scores.all()))
+        db.session.commit()
+
+    def test_cached_until_a_round_is_processed(self):
+        cache = AnalyticsCache()
+        self.process(self.add_round([4] * 18))
+        self.assertEqual(cache.get(1)['rounds'], 1)
+
+        # Stored but not yet processed: the cached figures are still served
+        second = self.add_round([5] * 18)
+        self.assertEqual(cache.get(1)['rounds'], 1)
+
+        self.process(second)
+        self.assertEqual(cache.get(1)['rounds'], 2)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 1})
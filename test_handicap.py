@@ -0,0 +1,101 @@
+import unittest
+from datetime import datetime, timedelta
+from models import db, HandicapRecord, Round, RoundSummary
+from handicap import (adjusted_gross_score, course_handicap, handicap_index, net_scores,
+                      playing_handicap, rate_round, recompute_handicaps, retract_handicap,
+                      score_differential, strokes_received, update_handicap)
+from test_support import DatabaseTestCase
+
+
+class TestHandicapCalculations(unittest.TestCase):
+    def test_course_handicap_rounds_half_away_from_zero(self):
+        self.assertEqual(course_handicap(12.4, 130, 71.5, 72), 14)
+        self.assertEqual(course_handicap(-1.2, 125, 72.8, 72), -1)
+
+    def test_strokes_follow_stroke_index(self):
+        self.assertEqual([strokes_received(20, index) for index in (1, 2, 3, 18)], [2, 2, 1, 1])
+        self.assertEqual([strokes_received(-2, index) for index in (1, 16, 17, 18)], [0, 0, -1, -1])
+
+    def test_adjusted_gross_caps_at_net_double_bogey(self):
+        holes = [(4, 1, 9), (4, 18, 9), (3, 5, 4)]
+        # Course handicap 1: a stroke on stroke index 1 only
+        self.assertEqual(adjusted_gross_score(holes, course_handicap=1), 7 + 6 + 4)
+        self.assertEqual(adjusted_gross_score(holes), 9 + 9 + 4)
+
+    def test_net_scores_take_strokes_by_stroke_index(self):
+        rows = [{'hole_handicap': index, 'score': 5} for index in (1, 2, 18, None)]
+        self.assertEqual([row['net_score'] for row in net_scores(rows, 19)], [3, 4, 4, 5])
+        self.assertEqual([row['net_score'] for row in net_scores(rows, -1)], [5, 5, 6, 5])
+        self.assertEqual([row['net_score'] for row in net_scores(rows, None)], [5, 5, 5, 5])
+
+    def test_index_uses_best_differentials_of_window(self):
+        self.assertIsNone(handicap_index([10.0, 12.0]))
+        self.assertEqual(handicap_index([10.0, 12.0, 8.0]), 6.0)
+        self.assertEqual(handicap_index([float(n) for n in range(20)]), 3.5)
+        self.assertEqual(score_differential(85, 71.5, 130), 11.7)
+
+
+class Tee:
+    par, course_rating, slope_rating = 72, 71.5, 130
+
+
+class TestHandicapRecords(DatabaseTestCase):
+    def add_rated_round(self, day, adjusted_gross, golfer_id=1):
+        round = Round(golfer_id=golfer_id, course_id=1, tee_id=1,
+                      date_played=datetime(2024, 1, 1) + timedelta(days=day))
+        db.session.add(round)
+        db.session.flush()
+        rows = [{'hole_par': 4, 'hole_handicap': number, 'score': 4} for number in range(1, 19)]
+        rows[0]['score'] = adjusted_gross - 68
+        summary = RoundSummary(round_id=round.id, holes_played=18)
+        rate_round(summary, rows, Tee, course_handicap=None)
+        db.session.add(summary)
+        db.session.flush()
+        return round
+
+    def record(self, golfer_id=1):
+        record = db.session.get(HandicapRecord, golfer_id)
+        db.session.refresh(record)
+        return record
+
+    def test_rate_round_needs_eighteen_rated_holes(self):
+        summary = RoundSummary(round_id=1)
+        rows = [{'hole_par': 4, 'hole_handicap': n, 'score': 5} for n in range(1, 19)]
+        rate_round(summary, rows, Tee, playing_handicap(Tee, 12.4))
+        self.assertEqual((summary.course_handicap, summary.adjusted_gross_score,
+                          summary.score_differential), (14, 90, 16.1))
+
+        rate_round(summary, rows[:9], Tee, playing_handicap(Tee, 12.4))
+        self.assertEqual((summary.course_handicap, summary.score_differential), (14, None))
+
+    def test_window_keeps_latest_twenty_incrementally(self):
+        rounds = [self.add_rated_round(day, 75 + day % 7) for day in range(25)]
+        for round in rounds:
+            update_handicap(round)
+        db.session.commit()
+        incremental = self.record()
+        self.assertEqual([item[1] for item in incremental.differentials],
+                         [round.id for round in reversed(rounds[5:])])
+
+        # A late entry older than the whole window changes nothing
+        update_handicap(self.add_rated_round(-1, 60))
+        db.session.commit()
+        self.assertEqual(self.record().differentials, incremental.differentials)
+
+        expected = (incremental.handicap_index, incremental.differentials)
+        db.session.delete(incremental)
+        db.session.commit()
+        self.assertEqual(recompute_handicaps(), 1)
+        db.session.commit()
+        self.assertEqual((self.record().handicap_index, self.record().differentials), expected)
+
+    def test_retract_refills_full_window_from_older_rounds(self):
+        rounds = [self.add_rated_round(day, 80) for day in range(21)]
+        for round in rounds:
+            update_handicap(round)
+        db.session.commit()
+
+        retract_handicap(rounds[-1])
+        db.session.commit()
+        self.assertEqual([item[1] for item in self.record().differentials],
+                         [round.id for round in reversed(rounds[:20])])
@@ -0,0 +1,66 @@
+from datetime import datetime
+from models import db, RoundSummary, Statistic
+from head_to_head import compare_golfers, head_to_head, head_to_head_cache
+from test_support import DatabaseTestCase
+
+
+class TestHeadToHead(DatabaseTestCase):
+    def play(self, golfer_id, strokes, day=1, course_id=1, differential=None):
+        round = self.add_round(strokes, golfer_id=golfer_id,
+                               date_played=datetime(2024, 5, day, 9))
+        round.course_id = course_id
+        summary = RoundSummary.from_scores(round.id, round.scores.all())
+        summary.score_differential = differential
+        db.session.add(summary)
+        db.session.commit()
+        Statistic.record_round(golfer_id, summary)
+        db.session.commit()
+        return round
+
+    def test_hole_records_and_deltas_on_shared_courses(self):
+        self.play(1, [3, 4, 5] + [4] * 15, differential=2.0)
+        self.play(2, [4, 4, 4] + [4] * 15, differential=4.0)
+        # Different day: shared course but not played together
+        self.play(2, [5] * 18, day=2)
+        # Golfer 1 alone on another course
+        self.play(1, [6] * 18, course_id=2)
+
+        comparison = compare_golfers(1, 2)
+        self.assertEqual(comparison['holes'], {'won': 1, 'lost': 1, 'halved': 16})
+        self.assertEqual([(course['course_id'], course['days_played_together'],
+                           course['golfer_rounds'], course['opponent_rounds'])
+                          for course in comparison['shared_courses']], [(1, 1, 1, 2)])
+        self.assertEqual(comparison['golfer']['scoring_average'], 72)
+        self.assertEqual(comparison['opponent']['scoring_average'], 81)
+        self.assertEqual(comparison['deltas']['scoring_average'], -9)
+        self.assertEqual(comparison['deltas']['average_differential'], -2)
+
+    def test_cached_per_pair_until_either_golfer_posts(self):
+        head_to_head_cache.clear()
+        self.play(1, [4] * 18)
+        self.play(2, [5] * 18)
+        self.assertEqual(head_to_head(1, 2)['holes']['won'], 18)
+        swapped = head_to_head(2, 1)
+        self.assertEqual((swapped['golfer_id'], swapped['holes']['lost']), (2, 18))
+        self.assertEqual(swapped['deltas']['scoring_average'], 18)
+        self.assertEqual(head_to_head_cache.stats()['size'], 1)
+
+        self.play(2, [3] * 18)
+        self.assertEqual(head_to_head(2, 1)['deltas']['scoring_average'], 0)
+        self.assertEqual(head_to_head_cache.stats()['misses'], 2)
+
+    def test_two_rounds_in_one_day_are_paired_in_order(self):
+        self.play(1, [4] * 18)
+        afternoon = self.play(1, [5] * 18)
+        afternoon.date_played = datetime(2024, 5, 1, 14)
+        self.play(2, [5] * 18)
+        db.session.commit()
+
+        comparison = compare_golfers(1, 2)
+        self.assertEqual(comparison['holes'], {'won': 18, 'lost': 0, 'halved': 0})
+        self.assertEqual(comparison['shared_courses'][0]['days_played_together'], 1)
+
+        # Both golfers out twice: morning meets morning, afternoon meets afternoon
+        self.play(2, [3] * 18).date_played = datetime(2024, 5, 1, 15)
+        db.session.commit()
+        self.assertEqual(compare_golfers(1, 2)['holes'], {'won': 18, 'lost': 18, 'halved': 0})
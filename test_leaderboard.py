@@ -0,0 +1,199 @@
+import os
+import random
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import Flask
+from models import db, GameType, Leaderboard, Round, RoundSummary, Score, Statistic
+from leaderboard import update_leaderboard, rank_leaderboard, rebuild_leaderboard, match_play_points
+from test_support import DatabaseTestCase
+
+
+class LeaderboardTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.game_types = {name: GameType(name=name) for name in
+                           ('Match Play', 'Stroke Play', 'Tournament Play', 'Solo Play')}
+        db.session.add_all(self.game_types.values())
+        db.session.commit()
+
+    def submit(self, game_type, golfer_id, strokes, date_played=datetime(2024, 5, 4, 9),
+               course_id=1, strokes_received=None):
+        """Add a round; with `strokes_received` per hole it is played with
+        handicap and each hole nets that many strokes fewer."""
+        round = Round(golfer_id=golfer_id, course_id=course_id, tee_id=1,
+                      game_type_id=self.game_types[game_type].id, date_played=date_played,
+                      use_handicap=strokes_received is not None)
+        db.session.add(round)
+        db.session.flush()
+        received = strokes_received or [0] * len(strokes)
+        db.session.add_all(Score(round_id=round.id, hole_number=number, hole_par=4, score=score,
+                                 net_score=score - received[number - 1])
+                           for number, score in enumerate(strokes, start=1))
+        update_leaderboard(round)
+        db.session.commit()
+        rank_leaderboard(round.game_type)
+        db.session.commit()
+        return round
+
+    def standings(self, game_type):
+        return [(entry.golfer_id, entry.score, entry.position) for entry in
+                Leaderboard.query.filter_by(game_type_id=self.game_types[game_type].id)
+                .order_by(Leaderboard.position, Leaderboard.golfer_id)]
+
+
+class TestMatchPlay(LeaderboardTestCase):
+    def test_later_rounds_take_back_holes_lost_to_ties(self):
+        self.submit('Match Play', 1, [3, 4, 5])
+        self.assertEqual(self.standings('Match Play'), [(1, 0, 1)])
+
+        self.submit('Match Play', 2, [4, 4, 4])
+        self.assertEqual(self.standings('Match Play'), [(1, 1, 1), (2, 1, 1)])
+
+        # Golfer 3 ties hole 1 and wins hole 2 outright
+        self.submit('Match Play', 3, [3, 3, 5])
+        self.assertEqual(self.standings('Match Play'), [(2, 1, 1), (3, 1, 1), (1, 0, 3)])
+
+    def test_matches_are_separated_by_course_and_day(self):
+        self.submit('Match Play', 1, [3, 3])
+        self.submit('Match Play', 2, [4, 4])
+        self.submit('Match Play', 2, [3, 3], date_played=datetime(2024, 5, 5, 9))
+        self.submit('Match Play', 3, [4, 4], date_played=datetime(2024, 5, 5, 9))
+        self.submit('Match Play', 3, [2, 2], course_id=2)
+        self.assertEqual(self.standings('Match Play'), [(1, 2, 1), (2, 2, 1), (3, 0, 3)])
+
+    def test_handicap_rounds_compete_on_net_scores(self):
+        self.submit('Match Play', 1, [4, 4, 4])
+        # Golfer 2 gets a stroke on the first two holes: nets 4, 3, 5
+        self.submit('Match Play', 2, [5, 4, 5], strokes_received=[1, 1, 0])
+        self.assertEqual(self.standings('Match Play'), [(1, 1, 1), (2, 1, 1)])
+
+    def test_incremental_updates_match_rebuild(self):
+        start = datetime(2024, 5, 1, 8)
+        for golfer_id in range(1, 31):
+            strokes = [3 + (golfer_id * hole) % 4 for hole in range(1, 19)]
+            self.submit('Match Play', golfer_id, strokes,
+                        date_played=start + timedelta(days=golfer_id % 3))
+        incremental = self.standings('Match Play')
+
+        rebuild_leaderboard(self.game_types['Match Play'])
+        db.session.commit()
+        self.assertEqual(self.standings('Match Play'), incremental)
+
+
+class TestStrokeAndTournamentPlay(LeaderboardTestCase):
+    def test_stroke_play_ranks_latest_round_lowest_first(self):
+        self.submit('Stroke Play', 1, [4] * 18)
+        self.submit('Stroke Play', 2, [5] * 18)
+        self.submit('Stroke Play', 1, [6] * 18, date_played=datetime(2024, 5, 6))
+        self.assertEqual(self.standings('Stroke Play'), [(2, 90, 1), (1, 108, 2)])
+
+    def test_stroke_play_uses_net_total_of_handicap_rounds(self):
+        self.submit('Stroke Play', 1, [4] * 18)
+        self.submit('Stroke Play', 2, [5] * 18, strokes_received=[1] * 18)
+        self.submit('Stroke Play', 3, [5] * 18, strokes_received=[1] * 10 + [0] * 8)
+        self.assertEqual(self.standings('Stroke Play'), [(1, 72, 1), (2, 72, 1), (3, 80, 3)])
+
+        rebuild_leaderboard(self.game_types['Stroke Play'])
+        db.session.commit()
+        self.assertEqual(self.standings('Stroke Play'), [(1, 72, 1), (2, 72, 1), (3, 80, 3)])
+
+    def test_tournament_play_totals_first_four_rounds(self):
+        start = datetime(2024, 5, 1)
+        for day, strokes in enumerate([70, 72, 74, 76, 60]):
+            self.submit('Tournament Play', 1, [strokes], date_played=start + timedelta(days=day))
+        self.submit('Tournament Play', 2, [80], date_played=start)
+        self.assertEqual(self.standings('Tournament Play'), [(2, 80, 1), (1, 292, 2)])
+
+        rebuild_leaderboard(self.game_types['Tournament Play'])
+        db.session.commit()
+        self.assertEqual(self.standings('Tournament Play'), [(2, 80, 1), (1, 292, 2)])
+
+
+class TestConcurrentSubmissions(unittest.TestCase):
+    """Parallel submitters, each in its own session and connection.
+
+    Runs against a SQLite file by default; set TEST_DATABASE_URL to a scratch
+    PostgreSQL database to exercise row-level concurrency.
+    """
+
+    SUBMITTERS = 50
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        database_url = os.environ.get('TEST_DATABASE_URL')
+        if database_url:
+            self.app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+            self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+                'pool_size': self.SUBMITTERS, 'max_overflow': 0}
+        else:
+            self.app.config['SQLALCHEMY_DATABASE_URI'] = \
+                f'sqlite:///{os.path.join(self.directory.name, "stress.db")}'
+            self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            game_types = [GameType(name='Match Play'), GameType(name='Solo Play')]
+            db.session.add_all(game_types)
+            db.session.commit()
+            self.match_play, self.solo_play = [game_type.id for game_type in game_types]
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+        self.directory.cleanup()
+
+    def submit(self, game_type_id, golfer_id, strokes):
+        with self.app.app_context():
+            round = Round(golfer_id=golfer_id, course_id=1, tee_id=1, game_type_id=game_type_id,
+                          date_played=datetime(2024, 5, 4, 9))
+            db.session.add(round)
+            db.session.flush()
+            scores = [Score(round_id=round.id, hole_number=number, hole_par=4, score=score)
+                      for number, score in enumerate(strokes, start=1)]
+            summary = RoundSummary.from_scores(round.id, scores)
+            db.session.add_all(scores + [summary])
+            Statistic.record_round(golfer_id, summary)
+            update_leaderboard(round)
+            db.session.commit()
+            rank_leaderboard(round.game_type)
+            db.session.commit()
+
+    def run_in_parallel(self, submissions):
+        barrier = threading.Barrier(len(submissions))
+
+        def submit(args):
+            barrier.wait()
+            self.submit(*args)
+
+        with ThreadPoolExecutor(max_workers=len(submissions)) as executor:
+            list(executor.map(submit, submissions))
+
+    def test_parallel_match_play_submissions_lose_no_points(self):
+        rng = random.Random(3)
+        self.run_in_parallel([(self.match_play, golfer_id, [rng.randint(3, 6) for _ in range(18)])
+                              for golfer_id in range(1, self.SUBMITTERS + 1)])
+
+        with self.app.app_context():
+            entries = {entry.golfer_id: (entry.score, entry.position)
+                       for entry in Leaderboard.query.filter_by(game_type_id=self.match_play)}
+            expected = dict(match_play_points(self.match_play))
+            self.assertEqual(len(entries), self.SUBMITTERS)
+            self.assertEqual({golfer_id: score for golfer_id, (score, _) in entries.items()},
+                             expected)
+            # Every hole won exactly once or not at all
+            self.assertLessEqual(sum(expected.values()), 18)
+            self.assertTrue(all(position is not None for _, position in entries.values()))
+
+    def test_parallel_solo_rounds_are_all_counted(self):
+        totals = [70 + n % 10 for n in range(self.SUBMITTERS)]
+        self.run_in_parallel([(self.solo_play, 1, [total]) for total in totals])
+
+        with self.app.app_context():
+            statistics = Statistic.query.filter_by(golfer_id=1).one()
+            self.assertEqual(statistics.total_rounds_played, self.SUBMITTERS)
+            self.assertAlmostEqual(statistics.average_score, sum(totals) / len(totals))
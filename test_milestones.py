@@ -0,0 +1,76 @@
+from models import db, Milestone, RoundSummary
+from milestones import RoundHistory, detect_milestones, record_milestones, retract_milestones
+from test_support import DatabaseTestCase
+
+
+class TestMilestoneRules(DatabaseTestCase):
+    def record(self, strokes, pars=None):
+        round = self.add_round(strokes, pars=pars)
+        scores = round.scores.all()
+        summary = RoundSummary.from_scores(round.id, scores)
+        db.session.add(summary)
+        new = record_milestones(round, scores, summary)
+        db.session.commit()
+        return sorted((milestone['type'], milestone['hole_number']) for milestone in new)
+
+    def test_hole_rules_evaluate_whole_round(self):
+        round = self.add_round([1, 2, 3, 2, 4] + [7] * 13, pars=[3, 4, 5, 5, 4] + [4] * 13)
+        scores = round.scores.all()
+        scores[4].bunker_shots = 2
+
+        found = detect_milestones(round, scores, RoundSummary.from_scores(round.id, scores),
+                                  RoundHistory())
+
+        self.assertEqual(sorted((m['type'], m['hole_number']) for m in found),
+                         [('Albatross', 4), ('Double-Sandy', 5), ('Eagle', 2),
+                          ('Eagle', 3), ('Hole-in-One', 1)])
+
+    def test_round_rules_use_history(self):
+        self.assertEqual(self.record([5] * 18), [])
+        self.assertEqual(self.record([6] * 18), [])
+        self.assertEqual(self.record([5] * 17 + [4]), [('First Sub-90', None),
+                                                       ('Personal Best', None)])
+        self.assertEqual(self.record([4] * 18), [('Personal Best', None)])
+        # Nine-hole rounds are not compared with full rounds
+        self.assertEqual(self.record([3] * 9), [])
+
+    def test_recorded_milestones_are_not_duplicated(self):
+        round = self.add_round([1] + [4] * 17, pars=[3] + [4] * 17)
+        scores = round.scores.all()
+        summary = RoundSummary.from_scores(round.id, scores)
+        db.session.add(summary)
+
+        self.assertEqual(len(record_milestones(round, scores, summary)), 2)
+        self.assertEqual(record_milestones(round, scores, summary), [])
+        db.session.commit()
+        self.assertEqual(sorted(m.type for m in Milestone.query.filter_by(round_id=round.id)),
+                         ['First Sub-90', 'Hole-in-One'])
+
+    def summarize(self, strokes):
+        round = self.add_round(strokes)
+        db.session.add(RoundSummary.from_scores(round.id, round.scores.all()))
+        db.session.commit()
+        return round
+
+    def detect(self, round):
+        new = record_milestones(round, round.scores.all(), round.summary)
+        db.session.commit()
+        return sorted(milestone['type'] for milestone in new)
+
+    def test_history_only_counts_rounds_played_earlier(self):
+        # Both cards are summarized before either round's milestones run
+        first = self.summarize([5] * 17 + [4])
+        second = self.summarize([4] * 18)
+
+        self.assertEqual(self.detect(first), ['First Sub-90'])
+        self.assertEqual(self.detect(second), ['Personal Best'])
+
+    def test_corrected_round_keeps_its_first_sub_90(self):
+        first = self.summarize([5] * 17 + [4])
+        second = self.summarize([4] * 18)
+        self.detect(first)
+        self.detect(second)
+
+        retract_milestones(first)
+        first.summary.total_score = 88
+        self.assertEqual(self.detect(first), ['First Sub-90'])
@@ -1,5 +1,7 @@
 import unittest
-from models import User, Round, Course
+from datetime import datetime, timedelta
+from models import db, Golfer as User, Round, RoundSummary, Score, Statistic, Course, HoleAggregate
+from test_support import DatabaseTestCase
 
 
 class TestUserModel(unittest.TestCase):
@@ -43,5 +45,177 @@ class TestCourseModel(unittest.TestCase):
     # Add more test cases for other course-related functionalities like adding tees, calculating handicaps, etc.
 
 
+class TestRoundSummary(DatabaseTestCase):
+    def test_from_scores_computes_totals_in_one_pass(self):
+        round = self.add_round([2, 3, 4, 5, 6] + [4] * 13)
+
+        summary = RoundSummary.from_scores(round.id, round.scores.all())
+
+        self.assertEqual(summary.total_score, 72)
+        self.assertEqual(summary.first_nine_score, 2 + 3 + 4 + 5 + 6 + 16)
+        self.assertEqual(summary.last_nine_score, 36)
+        self.assertEqual(summary.total_putts, 36)
+        self.assertEqual((summary.eagles, summary.birdies, summary.pars,
+                          summary.bogeys, summary.double_bogeys), (1, 1, 14, 1, 1))
+        self.assertEqual((summary.best_hole_score, summary.worst_hole_score), (2, 6))
+
+    def test_round_reads_stored_summary(self):
+        round = self.add_round([4] * 18)
+        db.session.add(RoundSummary.from_scores(round.id, round.scores.all()))
+        db.session.commit()
+
+        round.summary.total_score = 70  # Proves the stored row is used
+        self.assertEqual(round.total_score(), 70)
+        self.assertEqual(round.calculate_round_statistics()['fairways_hit_ratio'], '9/18')
+
+    def test_score_chart_is_cached_on_summary(self):
+        round = self.add_round([3, 5, 6] * 6, pars=[3, 4, 5] * 6)
+        summary = RoundSummary.from_scores(round.id, round.scores.all())
+        summary.chart = None
+        db.session.add(summary)
+        db.session.commit()
+
+        chart = round.create_score_chart()
+
+        self.assertEqual(chart['data'][0]['x'], ['Par 3', 'Par 4', 'Par 5'])
+        self.assertEqual(chart['data'][0]['y'], [3, 5, 6])
+        self.assertEqual(round.summary.chart, chart)
+
+    def test_backfill_creates_missing_summaries(self):
+        rounds = [self.add_round([4] * 18), self.add_round([5] * 18)]
+
+        self.assertEqual(RoundSummary.backfill(batch_size=1), 2)
+        self.assertEqual(RoundSummary.backfill(), 0)
+        self.assertEqual([round.summary.total_score for round in rounds], [72, 90])
+
+
+class TestStatistic(DatabaseTestCase):
+    def record(self, strokes, pars=None, golfer_id=1):
+        round = self.add_round(strokes, pars=pars, golfer_id=golfer_id)
+        Statistic.record_round(golfer_id, RoundSummary.from_scores(round.id, round.scores.all()))
+        db.session.commit()
+
+    def columns(self, golfer_id):
+        statistics = Statistic.query.filter_by(golfer_id=golfer_id).one()
+        db.session.refresh(statistics)
+        return {column: getattr(statistics, column) for column in (
+            'total_rounds_played', 'holes_played', 'average_score', 'putts_per_round',
+            'fairway_hit_percentage', 'green_in_regulation_percentage', *Statistic.SCORE_TYPES)}
+
+    def test_record_round_classifies_holes_and_averages(self):
+        self.record([2, 3, 4, 5, 6] + [4] * 13)
+        self.record([5] * 9)
+
+        columns = self.columns(1)
+        self.assertEqual((columns['total_rounds_played'], columns['holes_played']), (2, 27))
+        self.assertAlmostEqual(columns['average_score'], (72 + 45) / 2)
+        self.assertAlmostEqual(columns['putts_per_round'], (36 + 18) / 2)
+        self.assertAlmostEqual(columns['fairway_hit_percentage'], (9 + 4) * 100 / 27)
+        self.assertEqual([columns[name] for name in Statistic.SCORE_TYPES], [1, 1, 14, 10, 1])
+
+    def test_recompute_matches_incremental_updates(self):
+        self.record([2, 3, 4, 5, 6] + [4] * 13)
+        self.record([5] * 9)
+        self.record([3, 4, 5] * 6, pars=[3, 4, 5] * 6, golfer_id=2)
+        incremental = {golfer_id: self.columns(golfer_id) for golfer_id in (1, 2)}
+
+        db.session.execute(db.update(Statistic).values(birdies=99, average_score=0))
+        self.add_round([4] * 18, golfer_id=3)
+        self.assertEqual(Statistic.recompute(), 3)
+        db.session.commit()
+
+        for golfer_id, columns in incremental.items():
+            recomputed = self.columns(golfer_id)
+            for column, value in columns.items():
+                self.assertAlmostEqual(recomputed[column], value, msg=column)
+        self.assertEqual(self.columns(3)['total_rounds_played'], 1)
+
+
+class TestHoleAggregate(DatabaseTestCase):
+    def record(self, strokes, putts=2, sign=1, **kwargs):
+        round = self.add_round(strokes, **kwargs)
+        for score in round.scores:
+            score.putts = putts
+        HoleAggregate.record_round(round, round.scores.all(), sign=sign)
+        db.session.commit()
+        return round
+
+    def holes(self):
+        return {aggregate.hole_number: tuple(getattr(aggregate, name)
+                                             for name in ('hole_par', *HoleAggregate.COUNTS))
+                for aggregate in HoleAggregate.query.order_by(HoleAggregate.hole_number)}
+
+    def test_rounds_accumulate_per_hole(self):
+        self.record([3, 5], putts=1)
+        self.record([4, 6], putts=3, golfer_id=2)
+        first, second = [HoleAggregate.query.filter_by(hole_number=number).one()
+                         for number in (1, 2)]
+        self.assertEqual((first.times_played, first.average_to_par), (2, -0.5))
+        self.assertEqual(first.green_in_regulation_percentage, 100.0)
+        self.assertEqual((second.average_to_par, second.green_in_regulation_percentage), (1.5, 0.0))
+        self.assertEqual((second.putts_per_hole, second.one_putts, second.three_putts), (2, 1, 1))
+
+    def test_recompute_matches_incremental_updates(self):
+        self.record([4] * 18)
+        self.record([3, 5, 6] * 3)
+        taken_back = self.record([9] * 18)
+        HoleAggregate.record_round(taken_back, taken_back.scores.all(), sign=-1)
+        db.session.commit()
+        incremental = self.holes()
+
+        db.session.execute(db.delete(Score).where(Score.round_id == taken_back.id))
+        self.assertEqual(HoleAggregate.recompute(), 18)
+        db.session.commit()
+        self.assertEqual(self.holes(), incremental)
+
+
+class TestRoundHistoryPagination(DatabaseTestCase):
+    def test_page_for_golfer_walks_history_newest_first(self):
+        start = datetime(2024, 1, 1)
+        rounds = [self.add_round([4 + n % 2] * 18, date_played=start + timedelta(days=n))
+                  for n in range(5)]
+        self.add_round([3] * 18, golfer_id=2, date_played=start)
+        db.session.add(RoundSummary.from_scores(rounds[4].id, rounds[4].scores.all()))
+        db.session.commit()
+
+        first, before = Round.page_for_golfer(1, per_page=2)
+        second, before = Round.page_for_golfer(1, before=before, per_page=2)
+        third, before = Round.page_for_golfer(1, before=before, per_page=2)
+
+        self.assertEqual([row[0].id for row in first + second + third],
+                         [round.id for round in reversed(rounds)])
+        self.assertEqual([(row.total_score, row.holes_played) for row in first],
+                         [(72, 18), (90, 18)])
+        self.assertIsNone(before)
+
+
+class TestRoundSearch(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        start = datetime(2024, 1, 1)
+        self.rounds = [self.add_round([4 + n % 3] * 18, date_played=start + timedelta(days=n))
+                       for n in range(6)]
+        self.rounds[0].game_type_id = 2
+        db.session.commit()
+
+    def test_search_filters_and_counts_in_one_query(self):
+        rows, total_count = Round.search(1, start_date=datetime(2024, 1, 2).date(),
+                                         end_date=datetime(2024, 1, 6).date(),
+                                         min_score=80, per_page=1)
+
+        self.assertEqual(total_count, 4)
+        self.assertEqual([row[0].id for row in rows], [self.rounds[5].id])
+        self.assertEqual(rows[0].total_score, 108)
+
+    def test_search_by_game_type(self):
+        rows, total_count = Round.search(1, game_type_id=2)
+
+        self.assertEqual(total_count, 1)
+        self.assertEqual(rows[0][0].id, self.rounds[0].id)
+
+    def test_search_past_last_page(self):
+        self.assertEqual(Round.search(1, page=3, per_page=5), ([], 0))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from models import db, GameType, Leaderboard, Milestone, PostRoundJob, RoundSummary, Statistic
+from pipeline import PostRoundPipeline, pipeline
+from test_support import DatabaseTestCase
+
+
+class TestPostRoundPipeline(DatabaseTestCase):
+    def submit(self, strokes, game_type_name='Stroke Play'):
+        game_type = GameType.query.filter_by(name=game_type_name).first() or GameType(name=game_type_name)
+        db.session.add(game_type)
+        round = self.add_round(strokes)
+        round.game_type = game_type
+        db.session.add(RoundSummary.from_scores(round.id, round.scores.all()))
+        pipeline.enqueue(round.id)
+        db.session.commit()
+        return round
+
+    def test_jobs_run_once_and_report_status(self):
+        round = self.submit([1] + [4] * 17)
+        pipeline.enqueue(round.id)  # A second submit queues nothing new
+        db.session.commit()
+        self.assertEqual(PostRoundJob.query.count(), 5)
+        self.assertFalse(pipeline.status(round.id)['complete'])
+
+        self.assertEqual(pipeline.run_pending(), 5)
+        self.assertEqual(pipeline.run_pending(), 0)
+
+        status = pipeline.status(round.id)
+        self.assertTrue(status['complete'])
+        self.assertEqual([job['attempts'] for job in status['jobs']], [1, 1, 1, 1, 1])
+        self.assertEqual(Statistic.query.one().total_rounds_played, 1)
+        self.assertEqual(Leaderboard.query.one().score, 69)
+        self.assertEqual(Leaderboard.query.one().position, 1)
+        self.assertIn('Hole-in-One', [milestone.type for milestone in Milestone.query])
+        self.assertEqual(pipeline.metrics()['queue']['pending'], 0)
+
+    def test_round_without_game_type_skips_ranking(self):
+        round = self.add_round([4] * 18)
+        db.session.add(RoundSummary.from_scores(round.id, round.scores.all()))
+        pipeline.enqueue(round.id)
+        db.session.commit()
+
+        with self.assertNoLogs(self.app.logger, level='WARNING'):
+            self.assertEqual(pipeline.run_pending(), 5)
+        self.assertTrue(pipeline.status(round.id)['complete'])
+        self.assertIsNone(Leaderboard.query.first())
+
+    def test_failed_jobs_roll_back_and_retry_with_backoff(self):
+        calls = []
+
+        def flaky(round):
+            calls.append(round.id)
+            Statistic.record_round(round.golfer_id, round.summary)
+            if len(calls) == 1:
+                raise RuntimeError('database went away')
+
+        flaky_pipeline = PostRoundPipeline({'statistics': flaky})
+        round = self.add_round([4] * 18)
+        db.session.add(RoundSummary.from_scores(round.id, round.scores.all()))
+        flaky_pipeline.enqueue(round.id)
+        db.session.commit()
+
+        flaky_pipeline.run_pending()
+        job = PostRoundJob.query.one()
+        self.assertEqual((job.status, job.attempts, job.last_error),
+                         ('pending', 1, 'database went away'))
+        self.assertGreater(job.run_after, datetime.utcnow())
+        self.assertIsNone(Statistic.query.first())
+        self.assertEqual(flaky_pipeline.run_pending(), 0)  # Not due yet
+
+        job.run_after = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        flaky_pipeline.run_pending()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.assertEqual(Statistic.query.one().total_rounds_played, 1)
+        self.assertEqual(flaky_pipeline.metrics()['jobs']['statistics']['failures'], 1)
+
+    def test_jobs_fail_after_max_attempts(self):
+        self.app.config['PIPELINE_MAX_ATTEMPTS'] = 2
+        self.app.config['PIPELINE_RETRY_SECONDS'] = 0
+
+        def broken(round):
+            raise ValueError('bad round')
+
+        broken_pipeline = PostRoundPipeline({'statistics': broken})
+        round = self.add_round([4] * 18)
+        broken_pipeline.enqueue(round.id)
+        db.session.commit()
+
+        broken_pipeline.run_pending()
+        broken_pipeline.run_pending()
+        self.assertEqual(PostRoundJob.query.one().status, 'failed')
+        self.assertEqual(broken_pipeline.metrics()['queue']['failed'], 1)
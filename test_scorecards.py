@@ -0,0 +1,114 @@
+from datetime import datetime
+from models import db, GameType, Golfer, Hole, Leaderboard, Milestone, Round, Score, Statistic, Tee
+from leaderboard import match_play_points
+from pipeline import pipeline
+from scorecards import ScorecardError, submit_scorecard, validate_entries
+from test_support import DatabaseTestCase
+
+
+HOLES = [Hole(number=number, par=4, yardage=400, handicap=number) for number in range(1, 19)]
+TEE = Tee(par=72, course_rating=71.2, slope_rating=128, holes=HOLES)
+
+
+def card(strokes):
+    return [{'hole_number': number, 'score': score, 'putts': 2}
+            for number, score in enumerate(strokes, start=1)]
+
+
+class TestScorecardSubmission(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.match_play = GameType(name='Match Play')
+        db.session.add(self.match_play)
+        db.session.commit()
+
+    def new_round(self, golfer_id=1):
+        round = Round(golfer_id=golfer_id, course_id=1, tee_id=1,
+                      game_type_id=self.match_play.id, date_played=datetime(2024, 5, 4, 9))
+        db.session.add(round)
+        db.session.commit()
+        return round
+
+    def submit(self, round, strokes):
+        result = submit_scorecard(round, TEE, card(strokes))
+        db.session.commit()
+        pipeline.run_pending()
+        return result
+
+    def test_net_scores_are_stored_from_playing_handicap(self):
+        round = self.new_round()
+        db.session.add(Golfer(id=1, username='golfer', email='golfer@example.com',
+                              first_name='Test', last_name='Golfer', state='TX',
+                              handicap_index=18.0))
+        db.session.commit()
+        self.submit(round, [6] * 18)
+
+        # Course handicap 18 * 128 / 113 + (71.2 - 72) = 19.6, so 20 strokes
+        self.assertEqual(round.summary.course_handicap, 20)
+        self.assertEqual([score.net_score for score in round.scores.order_by(Score.hole_number)],
+                         [4, 4] + [5] * 16)
+        self.assertEqual((round.summary.total_score, round.summary.net_total), (108, 88))
+
+    def test_validation_reports_every_problem(self):
+        round = self.new_round()
+        entries = card([4, 0]) + [{'hole_number': 2, 'score': 4}, {'hole_number': 19, 'score': 4},
+                                  {'hole_number': 3, 'score': '4'}]
+        with self.assertRaises(ScorecardError) as raised:
+            validate_entries(round, HOLES, entries)
+        self.assertEqual(len(raised.exception.errors), 4)
+
+    def test_booleans_are_not_numbers(self):
+        round = self.new_round()
+        entries = [{'hole_number': True, 'score': 4}, {'hole_number': 2, 'score': True},
+                   {'hole_number': 3, 'score': 4, 'putts': False}]
+        with self.assertRaises(ScorecardError) as raised:
+            validate_entries(round, HOLES, entries)
+        self.assertEqual(len(raised.exception.errors), 3)
+
+    def test_double_submit_is_a_no_op(self):
+        round = self.new_round()
+        self.assertEqual(self.submit(round, [4] * 18), 'created')
+        self.assertEqual(self.submit(round, [4] * 18), 'unchanged')
+
+        self.assertEqual(Score.query.filter_by(round_id=round.id).count(), 18)
+        self.assertEqual(round.summary.total_score, 72)
+        self.assertEqual(Statistic.query.one().total_rounds_played, 1)
+
+    def test_corrected_card_replaces_scores_and_derived_data(self):
+        first, second = self.new_round(1), self.new_round(2)
+        self.submit(first, [1] + [4] * 17)
+        self.submit(second, [4] * 18)
+        self.assertEqual(Leaderboard.query.filter_by(golfer_id=1).one().score, 1)
+
+        # Golfer 1 fixes a typo on hole 1 and now loses hole 2
+        self.assertEqual(self.submit(first, [4, 5] + [4] * 7), 'updated')
+
+        self.assertEqual(Score.query.filter_by(round_id=first.id).count(), 9)
+        db.session.refresh(first.summary)
+        self.assertEqual(first.summary.total_score, 37)
+        self.assertEqual(dict((entry.golfer_id, entry.score) for entry in Leaderboard.query),
+                         dict(match_play_points(self.match_play.id)))
+        self.assertEqual(dict((entry.golfer_id, entry.score) for entry in Leaderboard.query),
+                         {1: 0, 2: 1})
+        statistics = Statistic.query.filter_by(golfer_id=1).one()
+        self.assertEqual((statistics.total_rounds_played, statistics.holes_played), (1, 9))
+        self.assertAlmostEqual(statistics.average_score, 37)
+        self.assertEqual(Milestone.query.filter_by(round_id=first.id, type='Hole-in-One').count(), 0)
+
+    def test_cards_committed_before_processing_are_counted_once(self):
+        first, second = self.new_round(1), self.new_round(2)
+        submit_scorecard(first, TEE, card([3, 4]))
+        db.session.commit()
+        submit_scorecard(second, TEE, card([4, 4]))
+        db.session.commit()
+        pipeline.run_pending()
+
+        self.assertEqual(dict((entry.golfer_id, entry.score) for entry in Leaderboard.query),
+                         {1: 1, 2: 0})
+        self.assertEqual(dict((entry.golfer_id, entry.score) for entry in Leaderboard.query),
+                         dict(match_play_points(self.match_play.id)))
+
+        # A corrected card is taken out and put back against the same rounds
+        self.assertEqual(self.submit(second, [3, 3]), 'updated')
+        self.assertEqual(dict((entry.golfer_id, entry.score) for entry in Leaderboard.query),
+                         {1: 0, 2: 1})
@@ -1,8 +1,12 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import requests
+from datetime import datetime, timedelta
 from flask import Flask
-from services import get_admin_token, fetch_course_details, search_courses
+from sqlalchemy.orm import Session
+from models import db, APIToken, Course, Tee, Hole, Golfer
+from services import get_admin_token, fetch_course_details, search_courses, CourseDetailsCache, materialize_course, GHINClient, TokenManager, parse_handicap_index, refresh_stale_handicaps, bulk_refresh_handicaps, save_course_data, search_local_courses, find_courses
+from test_support import DatabaseTestCase
 
 
 class TestServiceFunctions(unittest.TestCase):
@@ -17,45 +21,381 @@ class TestServiceFunctions(unittest.TestCase):
         # Remove application context after a test is done
         self.app_context.pop()
 
-    @patch('services.requests.post')
+    @patch('services.get_admin_token', return_value=('fake_token', None))
+    @patch('services.ghin_client.session.request')
+    def test_search_courses(self, mock_get, mock_get_admin_token):
+        # Mock the response from the GHIN API for course search
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            'courses': [{'id': 1, 'name': 'Golf Club'}]}
+        mock_get.return_value = mock_response
+
+        result = search_courses('Golf')
+        self.assertIsNotNone(result)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]['name'], 'Golf Club')
+
+
+class TestGHINClient(unittest.TestCase):
+    def setUp(self):
+        self.client = GHINClient()
+
+    @patch.object(requests.Session, 'request')
+    def test_request_applies_endpoint_timeout(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=200)
+
+        self.client.get('course_details', 'courses/1.json')
+
+        mock_request.assert_called_once_with(
+            'GET', 'https://api2.ghin.com/api/v1/courses/1.json',
+            timeout=GHINClient.timeouts['course_details'])
+
+    @patch.object(requests.Session, 'request')
+    def test_metrics_count_outcomes_per_endpoint(self, mock_request):
+        mock_request.side_effect = [MagicMock(status_code=200),
+                                    requests.exceptions.Timeout()]
+
+        self.client.get('course_search', 'courses/search.json')
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.client.get('course_search', 'courses/search.json')
+
+        metrics = self.client.metrics()['course_search']
+        self.assertEqual(metrics['calls'], 2)
+        self.assertEqual(metrics['outcomes'], {'200': 1, 'timeout': 1})
+
+
+class TestGHINRequests(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['GHIN_ADMIN_USER'] = 'admin'
+        self.app.config['GHIN_ADMIN_PASSWORD'] = 'secret'
+        patcher = patch('services.token_manager', TokenManager())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('services.ghin_client.session.request')
     def test_get_admin_token(self, mock_post):
         # Mock the response from the GHIN API for login
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {'access_token': 'fake_token'}
+        mock_response.json.return_value = {
+            'golfer_user': {'golfer_user_token': 'fake_token'}}
         mock_post.return_value = mock_response
 
-        token, expiry = get_admin_token()
+        token = get_admin_token()
         self.assertEqual(token, 'fake_token')
-        self.assertIsNotNone(expiry)
+        self.assertIsNotNone(APIToken.get_current_token().expiry)
 
-    @patch('services.get_admin_token', return_value=('fake_token', None))
-    @patch('services.requests.get')
+    @patch('services.get_admin_token', return_value='fake_token')
+    @patch('services.ghin_client.session.request')
     def test_fetch_course_details(self, mock_get, mock_get_admin_token):
         # Mock the response from the GHIN API for fetching course details
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {'id': 123, 'name': 'Sample Course'}
+        mock_response.json.return_value = {
+            'CourseId': 123, 'CourseName': 'Sample Course', 'TeeSets': [{'TeeSetRatingId': 1}]}
         mock_get.return_value = mock_response
 
         course_details = fetch_course_details(123)
         self.assertIsNotNone(course_details)
-        self.assertEqual(course_details['name'], 'Sample Course')
+        self.assertEqual(course_details['CourseName'], 'Sample Course')
+        self.assertEqual(course_details['CourseId'], 123)
+        self.assertEqual(course_details['TeeSets'], [{'TeeSetRatingId': 1}])
+        self.assertEqual(mock_get.call_args.kwargs['headers']['Authorization'],
+                         'Bearer fake_token')
 
-    @patch('services.get_admin_token', return_value=('fake_token', None))
-    @patch('services.requests.get')
-    def test_search_courses(self, mock_get, mock_get_admin_token):
-        # Mock the response from the GHIN API for course search
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            'courses': [{'id': 1, 'name': 'Golf Club'}]}
-        mock_get.return_value = mock_response
 
-        result = search_courses('Golf')
-        self.assertIsNotNone(result)
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0]['name'], 'Golf Club')
+class TestCourseDetailsCache(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['COURSE_CACHE_MAX_ENTRIES'] = 2
+        self.cache = CourseDetailsCache()
+
+    @patch('services.fetch_course_details')
+    def test_second_lookup_is_served_from_cache(self, mock_fetch):
+        mock_fetch.return_value = {'CourseId': 1, 'TeeSets': []}
+
+        self.assertEqual(self.cache.get(1), {'CourseId': 1, 'TeeSets': []})
+        self.assertEqual(self.cache.get(1), {'CourseId': 1, 'TeeSets': []})
+
+        mock_fetch.assert_called_once_with(1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    @patch('services.fetch_course_details')
+    def test_durable_tier_survives_local_eviction(self, mock_fetch):
+        mock_fetch.side_effect = lambda course_id: {'CourseId': course_id}
+        for course_id in (1, 2, 3):
+            self.cache.get(course_id)
+
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.get(1), {'CourseId': 1})
+        self.assertEqual(mock_fetch.call_count, 3)
+
+    @patch('services.fetch_course_details')
+    def test_put_leaves_the_callers_session_alone(self, mock_fetch):
+        golfer = Golfer(first_name='Pending', last_name='Golfer', username='pending',
+                        email='pending@example.com', state='TX')
+        db.session.add(golfer)
+
+        self.cache.put(1, {'CourseId': 1})
+
+        self.assertIn(golfer, db.session.new)
+        db.session.rollback()
+        self.cache.clear()
+        self.assertEqual(self.cache.get(1), {'CourseId': 1})
+        mock_fetch.assert_not_called()
+
+    @patch('services.CourseDetailsCache._refresh_in_background')
+    @patch('services.fetch_course_details')
+    def test_stale_entry_is_served_while_refreshing(self, mock_fetch, mock_refresh):
+        self.cache.put(1, {'CourseId': 1},
+                       fetched_at=datetime.utcnow() - timedelta(days=2))
+
+        self.assertEqual(self.cache.get(1), {'CourseId': 1})
+        mock_fetch.assert_not_called()
+        mock_refresh.assert_called_once_with(1)
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+
+
+class TestTokenManager(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['GHIN_ADMIN_USER'] = 'admin'
+        self.app.config['GHIN_ADMIN_PASSWORD'] = 'secret'
+        self.manager = TokenManager()
+
+    def login_response(self, token):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {
+            'golfer_user': {'golfer_user_token': token}}
+        return response
+
+    @patch('services.ghin_client.post')
+    def test_token_is_persisted_and_reused(self, mock_post):
+        mock_post.return_value = self.login_response('fresh_token')
+
+        self.assertEqual(self.manager.get_token(), 'fresh_token')
+        self.assertEqual(self.manager.get_token(), 'fresh_token')
+
+        mock_post.assert_called_once()
+        self.assertEqual(APIToken.get_current_token().token, 'fresh_token')
+        self.assertEqual(self.manager.stats()['refreshes'], 1)
+
+    @patch('services.ghin_client.post')
+    def test_token_stored_by_another_worker_is_shared(self, mock_post):
+        db.session.add(APIToken(token='shared_token',
+                                expiry=datetime.utcnow() + timedelta(hours=12)))
+        db.session.commit()
+
+        self.assertEqual(self.manager.get_token(), 'shared_token')
+        mock_post.assert_not_called()
+        self.assertEqual(self.manager.stats()['shared_loads'], 1)
+
+    @patch('services.ghin_client.post')
+    def test_token_is_refreshed_before_expiry(self, mock_post):
+        db.session.add(APIToken(token='expiring_token',
+                                expiry=datetime.utcnow() + timedelta(minutes=5)))
+        db.session.commit()
+        mock_post.return_value = self.login_response('renewed_token')
+
+        self.assertEqual(self.manager.get_token(), 'renewed_token')
+
+    @patch('services.ghin_client.post')
+    def test_failed_refresh_keeps_valid_token(self, mock_post):
+        db.session.add(APIToken(token='expiring_token',
+                                expiry=datetime.utcnow() + timedelta(minutes=5)))
+        db.session.commit()
+        mock_post.return_value = MagicMock(status_code=503)
+
+        self.assertEqual(self.manager.get_token(), 'expiring_token')
+        self.assertEqual(self.manager.get_token(), 'expiring_token')
+        mock_post.assert_called_once()
+
+    @patch('services.ghin_client.post')
+    def test_refresh_leaves_the_callers_session_alone(self, mock_post):
+        mock_post.return_value = self.login_response('fresh_token')
+        golfer = Golfer(first_name='Pending', last_name='Golfer', username='pending',
+                        email='pending@example.com', state='TX')
+        db.session.add(golfer)
+
+        self.assertEqual(self.manager.get_token(), 'fresh_token')
+
+        self.assertIn(golfer, db.session.new)
+        db.session.rollback()
+        self.assertEqual(Golfer.query.filter_by(username='pending').count(), 0)
+
+
+class TestSaveCourseData(DatabaseTestCase):
+    def course_info(self, course_id, name, updated_on):
+        return {'CourseID': course_id, 'CourseName': name, 'City': 'Austin',
+                'State': 'US-TX', 'UpdatedOn': updated_on}
+
+    def test_save_course_data_upserts_in_bulk(self):
+        save_course_data([self.course_info(1, 'Old Name', '2023-01-01'),
+                          self.course_info(2, 'Same', '2023-01-01')])
+
+        counts = save_course_data([self.course_info(1, 'New Name', '2024-01-01'),
+                                   self.course_info(2, 'Same', '2023-01-01'),
+                                   self.course_info(3, 'Added', '2024-01-01')])
+
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1})
+        self.assertEqual(Course.query.filter_by(course_id=1).one().name, 'New Name')
+        self.assertEqual(Course.query.count(), 3)
+
+
+    def test_course_inserted_by_a_concurrent_search_is_left_alone(self):
+        execute = db.session.execute
+
+        def concurrent_insert_after_lookup(statement, *args, **kwargs):
+            result = execute(statement, *args, **kwargs)
+            if not Course.query.count():
+                with Session(db.engine) as other:
+                    other.execute(db.insert(Course), [{'course_id': 1, 'name': 'Old Name'}])
+                    other.commit()
+            return result
+
+        with patch.object(db.session, 'execute', side_effect=concurrent_insert_after_lookup):
+            counts = save_course_data([self.course_info(1, 'Old Name', '2023-01-01'),
+                                       self.course_info(2, 'Added', '2023-01-01')])
+
+        self.assertEqual(counts, {'inserted': 1, 'updated': 0, 'unchanged': 1})
+        self.assertEqual(Course.query.count(), 2)
+
+class TestLocalCourseSearch(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        save_course_data([
+            {'CourseID': 1, 'CourseName': 'Pine Valley', 'City': 'Pine Valley', 'State': 'US-NJ'},
+            {'CourseID': 2, 'CourseName': 'Old Pine Hills', 'City': 'Austin', 'State': 'US-TX'},
+            {'CourseID': 3, 'CourseName': 'Pinehurst No. 2', 'City': 'Pinehurst', 'State': 'US-NC'},
+        ])
+
+    def test_search_ranks_name_prefix_matches_first(self):
+        names = [course.name for course in search_local_courses('pine')]
+        self.assertEqual(names, ['Pine Valley', 'Pinehurst No. 2', 'Old Pine Hills'])
+
+    def test_every_term_must_match(self):
+        names = [course.name for course in search_local_courses('pine austin')]
+        self.assertEqual(names, ['Old Pine Hills'])
+
+    def test_wildcards_in_the_query_match_literally(self):
+        self.assertEqual(search_local_courses('%'), [])
+        self.assertEqual(search_local_courses('pine_'), [])
+        names = [course.name for course in search_local_courses('no.')]
+        self.assertEqual(names, ['Pinehurst No. 2'])
+
+    @patch('services.search_courses')
+    def test_fresh_local_results_skip_ghin(self, mock_search):
+        results = find_courses('pinehurst')
+
+        mock_search.assert_not_called()
+        self.assertEqual(results[0]['CourseID'], 3)
+
+    @patch('services.search_courses')
+    def test_local_miss_falls_back_to_ghin(self, mock_search):
+        mock_search.return_value = [{'CourseID': 4, 'CourseName': 'Augusta National'}]
+
+        results = find_courses('augusta')
+
+        self.assertEqual(results, mock_search.return_value)
+        self.assertEqual(Course.query.filter_by(course_id=4).one().name, 'Augusta National')
+
+
+class TestMaterializeCourse(DatabaseTestCase):
+    course_details = {
+        'Facility': {'FacilityId': 7, 'FacilityName': 'Swing Oil Links'},
+        'CourseName': 'Championship',
+        'TeeSets': [{
+            'TeeSetRatingId': 501,
+            'TeeSetRatingName': 'Blue',
+            'TotalYardage': 6800,
+            'TotalPar': 72,
+            'Ratings': [{'RatingType': 'Total', 'CourseRating': 72.4, 'SlopeRating': 131}],
+            'Holes': [{'HoleId': 9000 + n, 'Number': n, 'Par': 4, 'Length': 380, 'Allocation': n}
+                      for n in range(1, 19)]
+        }]
+    }
+
+    def test_materialize_course_writes_tees_and_holes(self):
+        course = materialize_course(42, self.course_details)
+
+        self.assertEqual(course.name, 'Championship')
+        self.assertIsNotNone(course.tees_synced_at)
+        tee = Tee.query.filter_by(tee_set_id=501).one()
+        self.assertEqual(tee.course_id, course.id)
+        self.assertEqual(tee.slope_rating, 131)
+        self.assertEqual([hole.number for hole in tee.holes], list(range(1, 19)))
+
+    def test_materialize_course_runs_once(self):
+        materialize_course(42, self.course_details)
+        materialize_course(42, self.course_details)
+
+        self.assertEqual(Course.query.count(), 1)
+        self.assertEqual(Hole.query.count(), 18)
+
+    def test_materialize_course_after_a_concurrent_view_adds_nothing(self):
+        course = materialize_course(42, self.course_details)
+        # Another view wrote the rows after this one found the course unsynced
+        course.tees_synced_at = None
+        db.session.commit()
+
+        materialize_course(42, self.course_details)
+        self.assertEqual((Course.query.count(), Tee.query.count(), Hole.query.count()),
+                         (1, 1, 18))
+
+
+class TestHandicapRefresh(DatabaseTestCase):
+    def add_golfer(self, username, ghin_id, fetched_at=None):
+        golfer = Golfer(first_name='Test', last_name='Golfer', username=username,
+                        email=f'{username}@example.com', ghin_id=ghin_id, state='TX',
+                        handicap_fetched_at=fetched_at)
+        db.session.add(golfer)
+        db.session.commit()
+        return golfer
+
+    def test_parse_handicap_index(self):
+        self.assertEqual(parse_handicap_index('12.4'), 12.4)
+        self.assertEqual(parse_handicap_index('+1.2'), -1.2)
+        self.assertIsNone(parse_handicap_index('NH'))
+
+    @patch('services.get_admin_token', return_value='fake_token')
+    @patch('services.lookup_golfer_handicap', return_value='+2.3')
+    def test_refresh_stale_handicaps_skips_fresh_golfers(self, mock_fetch, mock_token):
+        stale = self.add_golfer('stale', 111)
+        fresh = self.add_golfer('fresh', 222, fetched_at=datetime.utcnow())
+
+        self.assertEqual(refresh_stale_handicaps(), 1)
+
+        mock_fetch.assert_called_once_with(111, 'Golfer', 'TX')
+        self.assertEqual(stale.handicap_index, -2.3)
+        self.assertEqual(stale.display_handicap, '+2.3')
+        self.assertIsNone(fresh.handicap_index)
+
+    @patch('services.get_admin_token', return_value='fake_token')
+    @patch('services.lookup_golfer_handicap')
+    def test_bulk_refresh_reports_partial_failures(self, mock_lookup, mock_token):
+        results = {1: '10.1', 2: None, 3: requests.exceptions.ConnectionError('down')}
+
+        def lookup(ghin_id, last_name, state):
+            if isinstance(results[ghin_id], Exception):
+                raise results[ghin_id]
+            return results[ghin_id]
+        mock_lookup.side_effect = lookup
+        golfers = [self.add_golfer(f'golfer{n}', n) for n in (1, 2, 3)]
+
+        report = bulk_refresh_handicaps(workers=3, rate=1000)
+
+        self.assertEqual(report['total'], 3)
+        self.assertEqual(report['updated'], 1)
+        self.assertEqual(report['not_found'], [golfers[1].id])
+        self.assertEqual([golfer_id for golfer_id, _ in report['failed']], [golfers[2].id])
+        db.session.expire_all()
+        self.assertEqual(golfers[0].handicap_index, 10.1)
+        self.assertIsNotNone(golfers[1].handicap_fetched_at)
+        self.assertIsNone(golfers[2].handicap_fetched_at)
 
 
 if __name__ == '__main__':
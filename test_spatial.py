@@ -0,0 +1,44 @@
+import random
+import unittest
+from spatial import CourseGrid, haversine_km
+
+
+class TestCourseGrid(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = {course_id: (rng.uniform(25, 49), rng.uniform(-124, -67))
+                       for course_id in range(2000)}
+        self.grid = CourseGrid(cell_degrees=0.5)
+        for course_id, (lat, lon) in self.points.items():
+            self.grid.add(course_id, lat, lon)
+
+    def brute_force(self, lat, lon):
+        return sorted((haversine_km(lat, lon, p_lat, p_lon), course_id)
+                      for course_id, (p_lat, p_lon) in self.points.items())
+
+    def test_haversine_km(self):
+        # Austin to Dallas is roughly 292 km
+        self.assertAlmostEqual(haversine_km(30.2672, -97.7431, 32.7767, -96.7970), 292, delta=3)
+
+    def test_within_matches_brute_force(self):
+        expected = [match for match in self.brute_force(38.0, -95.0) if match[0] <= 150]
+        self.assertEqual(self.grid.within(38.0, -95.0, 150), expected)
+
+    def test_nearest_matches_brute_force(self):
+        self.assertEqual(self.grid.nearest(40.7, -74.0, k=5),
+                         self.brute_force(40.7, -74.0)[:5])
+
+    def test_readding_a_course_moves_it(self):
+        self.grid.add(0, 10.0, 10.0)
+        self.assertEqual(len(self.grid), 2000)
+        self.assertEqual(self.grid.nearest(10.0, 10.0, k=1)[0][1], 0)
+
+    def test_search_across_antimeridian(self):
+        grid = CourseGrid()
+        grid.add(1, -17.0, 179.9)
+        grid.add(2, -17.0, -179.9)
+        self.assertEqual([course_id for _, course_id in grid.within(-17.0, 179.95, 50)], [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
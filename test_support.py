@@ -0,0 +1,34 @@
+import unittest
+from flask import Flask
+from models import db, Round, Score
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Runs each test against a fresh in-memory SQLite database."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_round(self, strokes, pars=None, golfer_id=1, date_played=None):
+        pars = pars or [4] * len(strokes)
+        round = Round(golfer_id=golfer_id, course_id=1, tee_id=1, date_played=date_played)
+        db.session.add(round)
+        db.session.flush()
+        scores = [Score(round_id=round.id, hole_number=number, hole_par=par, score=score,
+                        putts=2, penalties=0, bunker_shots=0,
+                        fairway_hit=number % 2 == 0, green_in_regulation=score <= par)
+                  for number, (score, par) in enumerate(zip(strokes, pars), start=1)]
+        db.session.add_all(scores)
+        db.session.commit()
+        return round